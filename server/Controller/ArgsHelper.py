@@ -0,0 +1,61 @@
+from datetime import datetime
+from flask import request
+from flask_restful import abort
+
+# largest page a paginated endpoint returns
+MAX_PAGE_SIZE = 200
+
+def get_int_arg(name, default, minimum, maximum=None):
+    value = request.args.get(name, default)
+    try:
+        value = int(value)
+    except ValueError:
+        abort(400, message=f'{name} must be an int')
+    if value < minimum or (maximum is not None and value > maximum):
+        abort(400, message=f'{name} is out of range')
+    return value
+
+# returns (page, limit) from the page and limit query params
+def get_page_args(default_limit=50):
+    page = get_int_arg('page', 1, 1)
+    limit = get_int_arg('limit', default_limit, 1, MAX_PAGE_SIZE)
+    return page, limit
+
+# returns the query param name parsed with fmt, None if it is missing
+def get_datetime_arg(name, fmt, description):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.strptime(value, fmt)
+    except (ValueError, TypeError, OverflowError):
+        abort(400, message=f'{name} must be {description}')
+    # ranges end on the day or month after to, which must not overflow
+    if parsed.year == datetime.max.year:
+        abort(400, message=f'{name} is out of range')
+    return parsed
+
+# returns the from and to query params, checking that from is not after to
+def get_range_args(parse):
+    start = parse('from')
+    end = parse('to')
+    if start and end and start > end:
+        abort(400, message='from must not be after to')
+    return start, end
+
+def get_date_arg(name):
+    value = get_datetime_arg(name, '%Y-%m-%d', 'a date formatted as YYYY-MM-DD')
+    return value.date() if value else None
+
+# months are returned as YYYY-MM strings
+def get_month_arg(name):
+    value = get_datetime_arg(name, '%Y-%m', 'a month formatted as YYYY-MM')
+    return value.strftime('%Y-%m') if value else None
+
+# returns (from, to) dates, YYYY-MM-DD and inclusive
+def get_date_range_args():
+    return get_range_args(get_date_arg)
+
+# returns (from, to) months, YYYY-MM and inclusive
+def get_month_range_args():
+    return get_range_args(get_month_arg)
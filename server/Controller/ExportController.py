@@ -0,0 +1,55 @@
+from flask import request, Response, stream_with_context
+from flask_restful import Resource, abort
+from flask_jwt_extended import (jwt_required, get_jwt_identity)
+
+# Project modules
+from Manager import registry
+from Manager.ExportManager import ExportError
+from Controller.ArgsHelper import get_date_range_args
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# /api/export/<string:entity> [GET]
+class Export(Resource):
+    """ Streams every readings, referrals or followups row as a file download
+        queryParams (Optional):
+            - from, to: YYYY-MM-DD, inclusive, UTC days for referrals
+            - format: csv (default) or ndjson
+            - fields: comma separated columns, all columns by default
+            - gzip: true to gzip the file on the fly
+        Admins only
+    """
+    @jwt_required
+    def get(self, entity):
+        current_user = get_jwt_identity()
+        if 'ADMIN' not in current_user['roles']:
+            abort(403, message="Only admins may export data")
+
+        fmt = request.args.get('format', 'csv')
+        fields = request.args.get('fields')
+        fields = fields.split(',') if fields else None
+        gzip = request.args.get('gzip', '').lower() in ('true', '1')
+        date_from, date_to = get_date_range_args()
+
+        export_manager = registry.exportManager
+        try:
+            chunks = export_manager.stream(entity, fmt, fields, date_from, date_to, gzip)
+            # start the stream here so that invalid arguments are reported
+            # before the response starts, errors can't be sent mid stream
+            first = next(chunks, b'')
+        except ExportError as e:
+            abort(400, message=str(e))
+
+        def generate():
+            yield first
+            yield from chunks
+
+        filename = f'{entity}.{fmt}' + ('.gz' if gzip else '')
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/gzip' if gzip else CONTENT_TYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
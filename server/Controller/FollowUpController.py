@@ -6,9 +6,8 @@ from flask_restful import Resource, abort
 from flask_jwt_extended import (jwt_required, get_jwt_identity)
 
 # Project modules
-from Manager.FollowUpManager import FollowUpManager
-
-followUpManager = FollowUpManager()
+from Manager import registry
+from Database.QueryCompiler import QueryError
 
 # URI: /followup
 class FollowUp(Resource):
@@ -26,20 +25,23 @@ class FollowUp(Resource):
         args = request.args  
         if id:
             logging.debug('Received request: GET /follow_up/<id>')
-            follow_up = followUpManager.read("id", id)
+            follow_up = registry.followUpManager.read("id", id, 'detail')
             if follow_up is None: 
                 abort(400, message=f'No FollowUp exists with id "{id}"')
             return follow_up
         elif args:
             logging.debug('Received request: GET /follow_up')
             print("args: " + json.dumps(args, indent=2, sort_keys=True))
-            follow_ups = followUpManager.search(args)
+            try:
+                follow_ups = registry.followUpManager.search(args, 'list')
+            except QueryError as e:
+                abort(400, message=str(e))
             if not follow_ups:
                 abort(400, message="No FollowUps found with given query params.")
             return follow_ups
         else:
             logging.debug('Received request: GET /follow_up')
-            follow_ups = followUpManager.read_all()
+            follow_ups = registry.followUpManager.read_all('list')
             if not follow_ups:
                 abort(404, message="No FollowUps currently exist.")
             return follow_ups
@@ -50,7 +52,7 @@ class FollowUp(Resource):
         logging.debug('Received request: POST /follow_up')
         current_user = get_jwt_identity()
         follow_up_data = FollowUp._get_request_body()
-        response_body = followUpManager.create(follow_up_data, current_user)
+        response_body = registry.followUpManager.create(follow_up_data, current_user)
         return response_body, 201
     
     @jwt_required
@@ -62,7 +64,7 @@ class FollowUp(Resource):
             abort(400, message="id is required")
     
         new_follow_up = FollowUp._get_request_body()
-        update_res = followUpManager.update("id", id, new_follow_up, current_user)
+        update_res = registry.followUpManager.update("id", id, new_follow_up, current_user)
 
         if not update_res:
             abort(400, message=f'No FollowUp exists with id "{id}"')
@@ -73,12 +75,12 @@ class FollowUp(Resource):
         # validate inputs
         if id:
             logging.debug('Received request: DELETE /follow_up/<id>')
-            del_res = followUpManager.delete("id", id)
+            del_res = registry.followUpManager.delete("id", id)
             if not del_res:
                 abort(400, message=f'No FollowUp exists with id "{id}"')
         else:
             logging.debug('Received request: DELETE /follow_up')
-            followUpManager.delete_all()
+            registry.followUpManager.delete_all()
         return {}
 
 
@@ -93,20 +95,23 @@ class FollowUpMobile(Resource):
         args = request.args  
         if id:
             logging.debug('Received request: GET /mobile/follow_up/<id>')
-            follow_up = followUpManager.mobile_read("id", id)
+            follow_up = registry.followUpManager.mobile_read("id", id)
             if follow_up is None: 
                 abort(400, message=f'No FollowUp exists with id "{id}"')
             return follow_up
         elif args:
             logging.debug('Received request: GET /mobile/follow_up')
             print("args: " + json.dumps(args, indent=2, sort_keys=True))
-            follow_ups = followUpManager.mobile_search(args)
+            try:
+                follow_ups = registry.followUpManager.mobile_search(args)
+            except QueryError as e:
+                abort(400, message=str(e))
             if not follow_ups:
                 abort(400, message="No FollowUps found with given query params.")
             return follow_ups
         else:
             logging.debug('Received request: GET /mobile/follow_up')
-            follow_ups = followUpManager.mobile_read_all()
+            follow_ups = registry.followUpManager.mobile_read_all()
             if not follow_ups:
                 abort(404, message="No FollowUps currently exist.")
             return follow_ups
@@ -122,20 +127,23 @@ class FollowUpMobileSummarized(Resource):
         args = request.args  
         if id:
             logging.debug('Received request: GET /mobile/follow_up/<id>')
-            follow_up = followUpManager.mobile_read_summarized("id", id)
+            follow_up = registry.followUpManager.mobile_read_summarized("id", id)
             if follow_up is None: 
                 abort(400, message=f'No FollowUp exists with id "{id}"')
             return follow_up
         elif args:
             logging.debug('Received request: GET /mobile/follow_up')
             print("args: " + json.dumps(args, indent=2, sort_keys=True))
-            follow_ups = followUpManager.mobile_search_summarized(args)
+            try:
+                follow_ups = registry.followUpManager.mobile_search_summarized(args)
+            except QueryError as e:
+                abort(400, message=str(e))
             if not follow_ups:
                 abort(400, message="No FollowUps found with given query params.")
             return follow_ups
         else:
             logging.debug('Received request: GET /mobile/follow_up')
-            follow_ups = followUpManager.mobile_read_all_summarized()
+            follow_ups = registry.followUpManager.mobile_read_all_summarized()
             if not follow_ups:
                 abort(404, message="No FollowUps currently exist.")
             return follow_ups
\ No newline at end of file
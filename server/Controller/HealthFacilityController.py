@@ -5,9 +5,9 @@ from flask import request
 from flask_restful import Resource, abort
 
 # Project modules
-from Manager.HealthFacilityManager import HealthFacilityManager
-
-healthFacilityManager = HealthFacilityManager()
+from Manager import registry
+from Manager.HealthFacilityRegistry import healthFacilityRegistry
+from Database.QueryCompiler import QueryError
 
 # URI: /health_facility
 class HealthFacility(Resource):
@@ -24,20 +24,23 @@ class HealthFacility(Resource):
         args = request.args  
         if name:
             logging.debug('Received request: GET /health_facility/<id>')
-            hf = healthFacilityManager.read("healthFacilityName", name)
+            hf = registry.healthFacilityManager.read("healthFacilityName", name)
             if hf is None: 
                 abort(400, message=f'No health facility exists with name "{name}"')
             return hf
         elif args:
             logging.debug('Received request: GET /health_facility')
             print("args: " + json.dumps(args, indent=2, sort_keys=True))
-            hfs = healthFacilityManager.search(args)
+            try:
+                hfs = registry.healthFacilityManager.search(args, 'list')
+            except QueryError as e:
+                abort(400, message=str(e))
             if not hfs:
                 abort(400, message="No health facilities found with given query params.")
             return hfs
         else:
             logging.debug('Received request: GET /health_facility')
-            hfs = healthFacilityManager.read_all()
+            hfs = registry.healthFacilityManager.read_all('list')
             if not hfs:
                 abort(404, message="No health facilities currently exist.")
             return hfs
@@ -47,7 +50,7 @@ class HealthFacility(Resource):
     def post():
         logging.debug('Received request: POST /health_facility')
         hf_data = HealthFacility._get_request_body()
-        response_body = healthFacilityManager.create(hf_data)
+        response_body = registry.healthFacilityManager.create(hf_data)
         return response_body, 201
 
     @staticmethod
@@ -57,7 +60,7 @@ class HealthFacility(Resource):
             abort(400, message="name is required")
     
         new_hf = HealthFacility._get_request_body()
-        update_res = healthFacilityManager.update("healthFacilityName", name, new_hf)
+        update_res = registry.healthFacilityManager.update("healthFacilityName", name, new_hf)
 
         if not update_res:
             abort(400, message=f'No health facility exists with name "{name}"')
@@ -69,12 +72,12 @@ class HealthFacility(Resource):
         # validate inputs
         if name:
             logging.debug('Received request: DELETE /health_facility/<id>')
-            del_res = healthFacilityManager.delete("healthFacilityName", name)
+            del_res = registry.healthFacilityManager.delete("healthFacilityName", name)
             if not del_res:
                 abort(400, message=f'No health facility exists with name "{name}"')
         else:
             logging.debug('Received request: DELETE /health_facility')
-            healthFacilityManager.delete_all()
+            registry.healthFacilityManager.delete_all()
         return {}
 
 # api/health_facility_list
@@ -82,12 +85,8 @@ class HealthFacilityList(Resource):
 
     # return list of health facility names
     def get(self):
-        hfs = healthFacilityManager.read_all()
-        if not hfs:
+        hfs_names = healthFacilityRegistry.list_names()
+        if not hfs_names:
             abort(404, message="No health facilities currently exist.")
 
-        hfs_names = []
-        for hf in hfs:
-            hfs_names.append(hf['healthFacilityName'])
-        
         return hfs_names
@@ -0,0 +1,19 @@
+from flask_restful import Resource, abort
+from flask_jwt_extended import (jwt_required, get_jwt_identity)
+
+# Project modules
+from Database.IdentityCache import identityCache
+
+# /api/metrics/cache [GET]
+class CacheMetrics(Resource):
+    """ Get the hit rate of the primary key cache of Database.read, see
+        Database/IdentityCache.py. Counters are per worker process, so
+        successive calls may be answered by different workers
+        Admins only
+    """
+    @jwt_required
+    def get(self):
+        current_user = get_jwt_identity()
+        if 'ADMIN' not in current_user['roles']:
+            abort(403, message="Only admins may view metrics")
+        return identityCache.metrics()
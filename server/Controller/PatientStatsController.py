@@ -1,9 +1,10 @@
+from flask import request
 from flask_restful import Resource, abort
-from Manager.PatientStatsManager import PatientStatsManager
-from Manager.PatientManagerNew import PatientManager as PatientManagerNew
-patientStatsManager = PatientStatsManager()
-
-from Manager import patientManager
+from flask_jwt_extended import (jwt_required, get_jwt_identity)
+from Manager import registry
+from Manager.FilterHelper import can_see_patient
+from Manager.PatientStatsManager import VITALS_BUCKETS
+from Controller.ArgsHelper import get_date_range_args
 
 class PatientStats(Resource):
     """
@@ -19,6 +20,31 @@ class PatientStats(Resource):
     # TO DO: Add more error checking
     # GET /api/patient/stats/<string:patient_id>
     def get(self, patient_id):
-        stats = patientStatsManager.put_data_together(patient_id)
+        stats = registry.patientStatsManager.put_data_together(patient_id)
         return stats
 
+
+class PatientVitals(Resource):
+    """
+    Description: Returns the min/max/mean/count and latest value of
+    a patient's bpSystolic, bpDiastolic and heartRate per time bucket,
+    for a patient the caller can see
+    queryParams (Optional):
+        - from, to: YYYY-MM-DD, inclusive
+        - bucket: day, week or month (default)
+    """
+
+    # GET /api/patient/<string:patient_id>/vitals
+    @jwt_required
+    def get(self, patient_id):
+        bucket = request.args.get('bucket', 'month')
+        if bucket not in VITALS_BUCKETS:
+            abort(400, message=f'bucket must be one of {", ".join(VITALS_BUCKETS)}')
+        date_from, date_to = get_date_range_args()
+
+        # patients the caller can't see are reported as missing too
+        if registry.patientManager.read("patientId", patient_id) is None \
+                or not can_see_patient(get_jwt_identity(), patient_id):
+            abort(404, message="Patient {} doesn't exist.".format(patient_id))
+
+        return registry.patientStatsManager.get_vitals(patient_id, date_from, date_to, bucket)
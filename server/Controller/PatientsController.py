@@ -5,13 +5,11 @@ from flask import request
 from flask_restful import Resource, abort
 
 # Project modules
-from Manager.PatientManagerNew import PatientManager as PatientManagerNew
-from Manager.ReadingManagerNew import ReadingManager as ReadingManagerNew
+from Manager import registry
 from Validation import PatientValidation
+from Controller.ArgsHelper import get_page_args
 from flask_jwt_extended import (create_access_token, create_refresh_token,
                                     jwt_required, jwt_refresh_token_required, get_jwt_identity)
-patientManager = PatientManagerNew()
-readingManager = ReadingManagerNew()
 
 def abort_if_body_empty(request_body):
     if request_body is None:
@@ -19,7 +17,7 @@ def abort_if_body_empty(request_body):
 
 
 def abort_if_patient_doesnt_exist(patient_id):
-    patient = patientManager.read("patientId", patient_id)
+    patient = registry.patientManager.read("patientId", patient_id)
 
     if patient is None:
         abort(404, message="Patient {} doesn't exist.".format(patient_id))
@@ -28,7 +26,7 @@ def abort_if_patient_doesnt_exist(patient_id):
 
 
 def abort_if_patient_exists(patient_id):
-    patient = patientManager.read("patientId", patient_id)
+    patient = registry.patientManager.read("patientId", patient_id)
 
     if patient:
         abort(400, message="Patient {} already exists.".format(patient_id))
@@ -52,7 +50,7 @@ class PatientAll(Resource):
     def get():
         logging.debug('Received request: GET /patient')
 
-        patients = patientManager.read_all()
+        patients = registry.patientManager.read_all('list')
         if patients is None:
             abort(404, message="No patients currently exist.")
         return patients
@@ -68,12 +66,12 @@ class PatientAll(Resource):
         if invalid is not None:
             return invalid
 
-        response_body = patientManager.create(patient_data)
+        response_body = registry.patientManager.create(patient_data)
         return response_body, 201
 
     @staticmethod
     def delete():
-        patientManager.delete_all()
+        registry.patientManager.delete_all()
         return {}
 
 
@@ -89,7 +87,7 @@ class PatientInfo(Resource):
     def get(self, patient_id):
         logging.debug('Received request: GET /patient/' + patient_id)
 
-        patient = patientManager.read("patientId", patient_id)
+        patient = registry.patientManager.read("patientId", patient_id, 'detail')
 
         if patient is None:
             abort(404, message="Patient {} doesn't exist.".format(patient_id))
@@ -106,7 +104,7 @@ class PatientInfo(Resource):
         # if invalid is not None:
         #     return invalid
 
-        response_body = patientManager.update("patientId", patient_id, data)
+        response_body = registry.patientManager.update("patientId", patient_id, data)
 
         return response_body, 200
 
@@ -136,7 +134,7 @@ class PatientReading(Resource):
             return is_invalid_reading
 
         # create new reading (and patient if it does not already exist)
-        reading_and_patient = readingManager.create_reading_and_patient(
+        reading_and_patient = registry.readingManager.create_reading_and_patient(
             patient_reading_data['patient']['patientId'],
             patient_reading_data
         )
@@ -158,10 +156,33 @@ class PatientAllInformation(Resource):
     @jwt_required
     def get(self):
         current_user = get_jwt_identity()
-        patients_readings_referrals = patientManager.get_patient_with_referral_and_reading(current_user)
-        #patients_readings_referrals = patientManager.get_patient_with_referral_and_reading()
+        patients_readings_referrals = registry.patientManager.get_patient_with_referral_and_reading(current_user)
+        #patients_readings_referrals = registry.patientManager.get_patient_with_referral_and_reading()
 
         if not patients_readings_referrals:
             abort(404, message="No patients currently exist.")
         else:
             return patients_readings_referrals    
+
+
+# /patient/search [GET]
+class PatientSearch(Resource):
+    """ Search the patients the user can see
+        queryParams (Optional):
+            - q: patientId prefix if all digits, otherwise part of the name
+            - village: villageNumber
+            - zone
+            - page: starting from 1
+            - limit: page size
+    """
+    @jwt_required
+    def get(self):
+        current_user = get_jwt_identity()
+        q = request.args.get('q', '').strip()
+        village = request.args.get('village')
+        zone = request.args.get('zone')
+        if not (q or village or zone):
+            abort(400, message="At least one of q, village or zone is required")
+
+        page, limit = get_page_args()
+        return registry.patientManager.search_patients(current_user, q, village, zone, page, limit)
@@ -0,0 +1,53 @@
+from flask import request
+from flask_restful import Resource, abort
+from flask_jwt_extended import (jwt_required, get_jwt_identity)
+
+# Project modules
+from Manager import registry
+from Controller.ArgsHelper import get_int_arg
+
+# max web map zoom level
+MAX_ZOOM = 22
+
+# zoom whose cells, about 1.2km x 0.6km, are no smaller than a village,
+# see geo.zoom_to_precision
+VILLAGE_ZOOM = 16
+
+# max zoom of each role, a user gets the highest of their roles. VHTs and
+# CHOs visit the patients they see, others only get village sized cells
+ROLE_MAX_ZOOM = {
+    'VHT': MAX_ZOOM,
+    'CHO': MAX_ZOOM,
+    'HCW': VILLAGE_ZOOM,
+    'ADMIN': VILLAGE_ZOOM,
+}
+
+def parse_bbox_arg(name):
+    value = request.args.get(name)
+    if not value:
+        abort(400, message=f'{name} is required')
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(v) for v in value.split(',')]
+    except ValueError:
+        abort(400, message=f'{name} must be formatted as minLon,minLat,maxLon,maxLat')
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180
+            and -90 <= min_lat <= max_lat <= 90):
+        abort(400, message=f'{name} is out of range')
+    return min_lon, min_lat, max_lon, max_lat
+
+# /api/readings/heatmap [GET]
+class ReadingHeatmap(Resource):
+    """ Get the number of readings and their traffic lights per map cell
+        queryParams:
+            - bbox: minLon,minLat,maxLon,maxLat, required
+            - zoom: web map zoom level from 0 to MAX_ZOOM, defaults to 10,
+              lowered to the max zoom of the user's roles, see ROLE_MAX_ZOOM
+        Users only see the readings of their scope, see StatsManager.get_scope
+    """
+    @jwt_required
+    def get(self):
+        current_user = get_jwt_identity()
+        bbox = parse_bbox_arg('bbox')
+        zoom = get_int_arg('zoom', 10, 0, MAX_ZOOM)
+        max_zoom = max([ROLE_MAX_ZOOM.get(role, 0) for role in current_user['roles']] + [0])
+        return registry.readingManager.get_heatmap(current_user, bbox, min(zoom, max_zoom))
@@ -0,0 +1,39 @@
+import datetime
+from flask import request
+from flask_restful import Resource, abort
+from flask_jwt_extended import (jwt_required, get_jwt_identity)
+
+# Project modules
+from Manager import registry
+from utils import parse_client_datetime
+from Controller.ArgsHelper import get_page_args
+
+# /api/rechecks/due [GET]
+class RecheckDueList(Resource):
+    """ Get the patients due a vitals recheck, ordered by due time
+        queryParams (Optional):
+            - before: ISO 8601 date or datetime in utc, defaults to now
+            - scope: 'all' (default) for every patient the user can see,
+              'mine' for patients whose latest reading the user took
+            - page: starting from 1
+            - limit: page size, at most MAX_PAGE_SIZE
+    """
+    @jwt_required
+    def get(self):
+        current_user = get_jwt_identity()
+
+        before = request.args.get('before')
+        if before:
+            before = parse_client_datetime(before)
+            if before is None:
+                abort(400, message='before must be an ISO 8601 date or datetime')
+        else:
+            before = datetime.datetime.utcnow()
+
+        scope = request.args.get('scope', 'all')
+        if scope not in ('all', 'mine'):
+            abort(400, message='scope must be one of all, mine')
+
+        page, limit = get_page_args()
+
+        return registry.recheckManager.get_due(current_user, before, scope, page, limit)
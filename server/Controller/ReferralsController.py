@@ -1,32 +1,31 @@
 import json
 from flask import request
 from flask_restful import Resource, abort
+from flask_jwt_extended import (jwt_required, get_jwt_identity)
 from config import db
 from utils import pprint
 
 # Project modules
-from Manager.ReferralManager import ReferralManager
-from Validation.ReferralValidator import ReferralValidator
-
-referralManager = ReferralManager()
-validator = ReferralValidator()
+from Manager import registry
+from Database.QueryCompiler import QueryError
+from Controller.ArgsHelper import get_int_arg, MAX_PAGE_SIZE
 
 def abort_if_referral_doesnt_exist(referral_id):
-    referral = referralManager.read("id", referral_id)
+    referral = registry.referralManager.read("id", referral_id, 'detail')
     if referral is None:
         abort(404, message="Referral {} doesn't exist".format(referral_id))
     else:
         return referral
 
 def abort_if_referrals_doesnt_exist():
-    referrals = referralManager.read_all()
+    referrals = registry.referralManager.read_all('list')
     if referrals is None:
         abort(404, message="No referrals")
     else:
         return referrals
 
 def abort_if_referral_exists(referral_id):
-    referral = referralManager.read("id", referral_id)
+    referral = registry.referralManager.read("id", referral_id)
     if referral:
         abort(400, message="Referral {} already exists".format(referral_id))
 
@@ -47,7 +46,7 @@ class ReferralInfo(Resource):
             abort(400, message="id is required")
 
         new_referral_fields = ReferralApi._get_request_body()
-        update_res = referralManager.update("id", id, new_referral_fields)
+        update_res = registry.referralManager.update("id", id, new_referral_fields)
 
         if not update_res:
             abort(400, message=f'No referral exists with id "{id}"')
@@ -65,9 +64,10 @@ class ReferralApi(Resource):
 
     """ Get Referrals
         queryParams (Optional):
-            - healthFacilityId
+            - referralHealthFacilityName
             - userId
             - patientId
+            - order_by, limit, offset, fields (see Database/QueryCompiler.py)
         Description:    
             if query params are supplied, 
             all referrals that match the given query params are return
@@ -82,7 +82,10 @@ class ReferralApi(Resource):
         if not args:
             referrals = abort_if_referrals_doesnt_exist()
         else:
-            referrals = referralManager.search(args)
+            try:
+                referrals = registry.referralManager.search(args, 'list')
+            except QueryError as e:
+                abort(400, message=str(e))
         return referrals
             
     
@@ -109,10 +112,35 @@ class ReferralApi(Resource):
             patient info and reading info included
             all values are the correct data type
         Description:
-            creates Patient, Reading, and HealthFacility if not already created
+            creates Patient, Reading, and HealthFacility if not already created.
+            The body may also be a list of referrals, ex: from an SMS or a
+            bulk upload, which are validated and created together
         Returns: 
-            newly created referral object
+            newly created referral object, or list of them
     """
     def post(self):
         req_data = self._get_request_body()
-        return referralManager.create_referral_with_patient_and_reading(req_data), 201
\ No newline at end of file
+        if isinstance(req_data, list):
+            return registry.referralManager.create_referrals_with_patients_and_readings(req_data), 201
+        return registry.referralManager.create_referral_with_patient_and_reading(req_data), 201
+
+# /referral/queue [GET]
+class ReferralQueue(Resource):
+    """ Get the open referrals of a health facility, most severe first
+        queryParams (Optional):
+            - healthFacilityName: defaults to the user's health facility,
+              only admins may ask for another one
+            - after: the next cursor of the previous page, omit for the first page
+            - limit: page size
+    """
+    @jwt_required
+    def get(self):
+        current_user = get_jwt_identity()
+        health_facility_name = request.args.get('healthFacilityName', current_user['healthFacilityName'])
+        if not health_facility_name:
+            abort(400, message="healthFacilityName is required")
+        if health_facility_name != current_user['healthFacilityName'] and 'ADMIN' not in current_user['roles']:
+            abort(403, message="Only admins may view the queue of another health facility")
+
+        limit = get_int_arg('limit', 50, 1, MAX_PAGE_SIZE)
+        return registry.referralManager.get_queue(health_facility_name, request.args.get('after'), limit)
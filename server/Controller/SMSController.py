@@ -2,18 +2,18 @@ from flask import request, session
 from flask import Response
 from flask_restful import Resource, abort
 from flask import current_app
-from twilio.rest import Client
-from twilio.twiml.messaging_response import MessagingResponse
 import json
-import jwt
-import requests
 
 class SMS(Resource):
 
     # /api/sms [POST]
-    # SMS BODY SHOULD BE A REFERRAL JSON STRING
+    # SMS BODY SHOULD BE A REFERRAL JSON STRING, OR A JSON LIST OF REFERRALS
     #
     def post(self):
+        # imported here so that workers which never receive an SMS do not load them
+        import requests
+        from twilio.twiml.messaging_response import MessagingResponse
+
         req = request.form.to_dict()
         print(json.dumps(req, indent=2, sort_keys=True))
 
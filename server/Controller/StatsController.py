@@ -1,7 +1,10 @@
-from flask_restful import Resource
-from Manager.StatsManager import StatsManager
+from flask import request
+from flask_restful import Resource, abort
+from flask_jwt_extended import (jwt_required, get_jwt_identity)
+from Manager import registry
+from Manager.GeoStatsManager import GEO_LEVELS
+from Controller.ArgsHelper import get_month_range_args
 
-statsManager = StatsManager()
 class AllStats(Resource):
     """ 
         Description: returns a json object with the following:
@@ -11,12 +14,49 @@ class AllStats(Resource):
             total number of referrals made for pregnant patients per month
             total number of referrals made for pregnant patients that were followed up per month
             each quantity is of an array, each index in the array refers to that index-1 month
+        Users only see the stats of their scope (their health facility,
+        their VHTs or themselves), see StatsManager.get_scope
     """
 
     # TO DO: NEED TO ADD ERROR CHECKING
     # TO DO: NEED TO RETURN JSON IN NICER FORMAT
     # GET api/stats
+    @jwt_required
     def get(self):
-        stats = statsManager.put_data_together()
+        stats = registry.statsManager.put_data_together(get_jwt_identity())
         return stats
 
+
+class PatientsByTrafficLight(Resource):
+    """
+        Description: returns the number of patients the user can see by the
+        traffic light of their latest reading, e.g. for the VHT home screen
+    """
+
+    # GET api/stats/patients/trafficlight
+    @jwt_required
+    def get(self):
+        return registry.statsManager.get_patients_by_traffic_light(get_jwt_identity())
+
+
+class GeoStats(Resource):
+    """
+        Description: returns per village or per zone rollups: number of patients,
+        readings and referrals per month and traffic light distribution of readings
+        queryParams (Optional):
+            - level: village (default) or zone
+            - key: a single villageNumber or zoneNumber
+            - from, to: YYYY-MM, inclusive, defaults to the last 12 months
+        Users only see the patients, readings and referrals of their scope,
+        see StatsManager.get_scope
+    """
+
+    # GET api/stats/geo
+    @jwt_required
+    def get(self):
+        level = request.args.get('level', 'village')
+        if level not in GEO_LEVELS:
+            abort(400, message=f'level must be one of {", ".join(GEO_LEVELS)}')
+        month_from, month_to = get_month_range_args()
+        return registry.geoStatsManager.get_geo_stats(get_jwt_identity(), level, request.args.get('key'),
+                                                      month_from, month_to)
@@ -5,13 +5,11 @@ from models import validate_user, User, UserSchema, Role
 from config import db, flask_bcrypt
 from flask_jwt_extended import (create_access_token, create_refresh_token,
                                     jwt_required, jwt_refresh_token_required, get_jwt_identity)
-from Manager.UserManager import UserManager
-from Manager.RoleManager import RoleManager
+from Manager import registry
+from Database.IdentityCache import identityCache
+from sqlalchemy.orm import selectinload
 
 
-userManager = UserManager()
-roleManager = RoleManager()
-
 # user/all [POST]
 class UserAll(Resource):
     
@@ -19,8 +17,8 @@ class UserAll(Resource):
     def get(self):
         logging.debug('Received request: GET user/all')
 
-        users = userManager.read_all_no_password()
-        if users is None:
+        users = registry.userManager.read_all_list()
+        if not users:
             abort(404, message="No users currently exist.")
         return users
 
@@ -31,7 +29,7 @@ class UserAllVHT(Resource):
     def get(self):
         logging.debug('Received request: GET user/vhts')
 
-        vhtId_list = userManager.read_all_vhts()
+        vhtId_list = registry.userManager.read_all_vhts()
         if vhtId_list is None:
             return []
         return vhtId_list
@@ -67,6 +65,7 @@ class UserApi(Resource):
 
             db.session.add(role) # add user and role
             db.session.commit()
+            identityCache.invalidate(Role)
 
             return {}, 200
         else:
@@ -82,30 +81,15 @@ class UserAuthApi(Resource):
         if data['ok']:
             data = data['data']
 
-            user = User.query.filter_by(email=data['email']).first()
+            # roles and VHTs are loaded with one query each for the identity
+            user = User.query.options(selectinload(User.roleIds), selectinload(User.vhtList).load_only('id')) \
+                .filter_by(email=data['email']).first()
 
             if user and flask_bcrypt.check_password_hash(user.password, data['password']):
                 del data['password']
 
                 # setup any extra user params
-                roles = []
-                if user.roleIds:
-                    for role in user.roleIds:
-                        roles.append(role.name.name)
-                
-                data['roles'] = roles
-                data['firstName'] = user.firstName
-                data['healthFacilityName'] = user.healthFacilityName
-                data['isLoggedIn'] = True
-                data['userId'] = user.id
-
-                vhtList = []
-                data['vhtList'] = []
-                if 'CHO' in roles:
-                    if user.vhtList:
-                        for user in user.vhtList:
-                            vhtList.append(user.id)
-                        data['vhtList'] = vhtList
+                data.update(registry.userManager.get_identity(user))
 
                 access_token = create_access_token(identity=data)
                 refresh_token = create_refresh_token(identity=data)
@@ -146,16 +130,16 @@ class UserEdit(Resource):
         newVhtIds = new_user.get('newVhtIds')
         if newVhtIds is not None:
             # add vht to CHO's vht list
-            roleManager.add_vht_to_supervise(id, new_user['newVhtIds'])
+            registry.roleManager.add_vht_to_supervise(id, new_user['newVhtIds'])
             new_user.pop('newVhtIds', None)
 
         newRoleIds = new_user.get('newRoleIds')
         if newRoleIds is not None:
             # add user to role
-            roleManager.add_user_to_role(id, new_user['newRoleIds'])
+            registry.roleManager.add_user_to_role(id, new_user['newRoleIds'])
             new_user.pop('newRoleIds', None)
         
-        update_res = userManager.update("id", id, new_user)
+        update_res = registry.userManager.update("id", id, new_user)
 
         if not update_res:
             abort(400, message=f'No user exists with id "{id}"')
@@ -171,7 +155,7 @@ class UserDelete(Resource):
         if 'ADMIN' in current_user['roles']:
             if id:
                 logging.debug('Received request: DELETE /user/delete/<id>')
-                del_res = userManager.delete("id", id)
+                del_res = registry.userManager.delete("id", id)
                 if not del_res:
                     abort(400, message=f'No user exists with id "{id}"')
             else:
@@ -12,16 +12,79 @@ Usage:
     self.table and self.schema.
     - The implemented methods can be override in the child class if 
     custom implementations are needed
+    - Child classes can declare loading_profiles, named plans of the
+    relationships to load eagerly. read, read_all and search take the
+    name of a profile, so that dumping the rows they return does not
+    lazy load the relationships of each row with one query per row
 """
 
 import collections
+import datetime
+from sqlalchemy import bindparam
+from sqlalchemy.orm import selectinload, joinedload
 from config import db
+from utils import parse_client_datetime
+from .QueryCompiler import QueryCompiler
+from .IdentityCache import identityCache
+
+# strategies of loading_profiles: selectin loads a relationship of all the
+# rows with one more SELECT ... IN, joined loads it in the same query
+LOADERS = {
+    'selectin': selectinload,
+    'joined': joinedload,
+}
 
 class Database:
+    # fields that search() can filter and sort on, see QueryCompiler.py
+    searchable_fields = ()
+
+    # profile name -> {relationship path: strategy}, paths are relationship
+    # names separated by dots, ex: {'list': {'followUp.healthcareWorker': 'joined'}}
+    loading_profiles = {}
+
+    # columns the model's @validates hooks set from another column, which the
+    # UPDATEs of bulk_update and update_many bypass: source column ->
+    # function of its new value returning {derived column: value}
+    derived_columns = {}
+
     def __init__(self, table, schema):
         self.table = table
         self.schema = schema
+        identityCache.register(table, schema)
+
+    """
+        Description: 
+            returns the primary key value of a model, or None for tables
+            with a composite primary key
+    """
+    def primary_key_of(self, model):
+        pk_columns = self.table.__mapper__.primary_key
+        if len(pk_columns) != 1:
+            return None
+        return getattr(model, pk_columns[0].key)
     
+    """
+        Description: 
+            returns the query options of a loading profile, none for None
+        Raises:
+            KeyError if the profile is not one of loading_profiles
+    """
+    def load_options(self, profile):
+        if profile is None:
+            return []
+        options = []
+        for path, strategy in self.loading_profiles[profile].items():
+            loader, table = None, self.table
+            for name in path.split('.'):
+                attribute = getattr(table, name)
+                loader = getattr(loader, strategy + 'load')(attribute) if loader else LOADERS[strategy](attribute)
+                table = attribute.property.mapper.class_
+            options.append(loader)
+        return options
+
+    def query(self, profile=None):
+        return self.table.query.options(*self.load_options(profile))
+
     """
         Description: 
             converts a SQLAlchemy object to a python dict
@@ -41,6 +104,70 @@ class Database:
     def models_to_list(self, models):
         return self.schema(many=True).dump(models)
 
+    """
+        Description: 
+            converts value to the python type of the column named key,
+            values for keys that are not columns are returned unchanged
+        Raises:
+            ValueError or TypeError if value can't be converted
+    """
+    def coerce(self, key, value):
+        column = self.table.__table__.columns.get(key)
+        if column is None or value is None:
+            return value
+
+        column_type = column.type
+        if isinstance(column_type, db.Enum) and column_type.enum_class:
+            if isinstance(value, column_type.enum_class):
+                return value
+            return column_type.enum_class(value)
+        if isinstance(column_type, db.Boolean):
+            if isinstance(value, str):
+                return value.lower() in ('true', '1')
+            return bool(value)
+        if isinstance(column_type, db.DateTime) and isinstance(value, str):
+            parsed = parse_client_datetime(value)
+            if parsed is None:
+                raise ValueError(f'{value} is not a date')
+            return parsed
+        if isinstance(column_type, db.Date) and isinstance(value, str):
+            return datetime.date.fromisoformat(value)
+
+        try:
+            python_type = column_type.python_type
+        except NotImplementedError:
+            return value
+        if isinstance(value, python_type):
+            return value
+        return python_type(value)
+
+    """
+        Description: 
+            returns a copy of new_data with the columns derived from its
+            keys added, see derived_columns
+    """
+    def with_derived(self, new_data):
+        data = dict(new_data)
+        for key in new_data:
+            if key in self.derived_columns:
+                data.update(self.derived_columns[key](new_data[key]))
+        return data
+
+    """
+        Description: 
+            builds the WHERE criteria for a dict of column names to values,
+            list values are matched with IN (...)
+    """
+    def build_filter(self, search_dict):
+        criteria = []
+        for key, value in search_dict.items():
+            column = getattr(self.table, key)
+            if isinstance(value, (list, tuple, set)):
+                criteria.append(column.in_([self.coerce(key, v) for v in value]))
+            else:
+                criteria.append(column == self.coerce(key, value))
+        return criteria
+
     """
         Description: 
             create new record in table, using new_data
@@ -55,34 +182,75 @@ class Database:
         new_entry = self.schema().load(new_data, session=db.session)
         db.session.add(new_entry)
         db.session.commit()
+        identityCache.invalidate(self.table, [self.primary_key_of(new_entry)])
         return self.model_to_dict(new_entry)
     
+    """
+        Description: 
+            insert many new records in table with multi-row INSERTs, without
+            building ORM objects
+        Params:
+            new_data_list: 
+                [list] of dicts containing keys, matching column names of
+                table, and their corresponding values to save 
+            commit: False to leave the insert in the caller's transaction
+        Return: 
+            - [int] number of records inserted
+    """
+    def create_many(self, new_data_list, commit=True):
+        rows = [{key: self.coerce(key, new_data[key]) for key in new_data} for new_data in new_data_list]
+        db.session.bulk_insert_mappings(self.table, rows)
+        if commit:
+            db.session.commit()
+        identityCache.invalidate(self.table)
+        return len(rows)
+
     """
         Description: 
             read single record in table
         Params:
             key: name of the column used to query
             value: value of the column used to query 
+            profile: name of a loading profile, see load_options
         Return: 
             - [dict] containing the key value pairs of the first matching 
             record 
             - None is returned if query has no matches
+        Reads by primary key go through the identity cache, see IdentityCache.py
     """
-    def read(self, key, value):
+    def read(self, key, value, profile=None):
+        pk_columns = self.table.__mapper__.primary_key
+        if len(pk_columns) == 1 and pk_columns[0].key == key:
+            try:
+                pk = self.coerce(key, value)
+            except (ValueError, KeyError, TypeError):
+                pk = None
+            if pk is not None:
+                # taken before the query, so a write racing it is not cached
+                version = identityCache.version(self.table)
+                row = identityCache.get(self.table, pk)
+                if row is None:
+                    row = self.model_to_dict(self.query(profile).get(pk))
+                    if row is not None:
+                        identityCache.put(self.table, pk, row, version)
+                return row
+
         search_dict = {}
         search_dict[key] = value
-        entry = self.table.query.filter_by(**search_dict).one_or_none()
+        entry = self.query(profile).filter_by(**search_dict).one_or_none()
         return self.model_to_dict(entry)
 
     """
         Description: 
             read all records in table
+        Params:
+            profile: name of a loading profile, see load_options
         Return: 
             - [list] containing dicts corresponding to all records
             - None is returned if query has no matches
     """
-    def read_all(self):
-        all_entries = self.table.query.all()
+    def read_all(self, profile=None):
+        all_entries = self.query(profile).all()
         if all_entries:
             return self.models_to_list(all_entries)
         return None
@@ -105,13 +273,9 @@ class Database:
         found_entry = self.table.query.filter_by(**search_dict).first()
         if found_entry:
             for key in new_data:
-                this_attr = getattr(found_entry, key)
-                this_type = type(this_attr)
-                if this_attr == None:
-                    setattr(found_entry, key, new_data[key])
-                else:
-                    setattr(found_entry, key, this_type(new_data[key]))
+                setattr(found_entry, key, self.coerce(key, new_data[key]))
             db.session.commit()
+            identityCache.invalidate(self.table, [self.primary_key_of(found_entry)])
         return self.model_to_dict(found_entry)
 
     """
@@ -129,8 +293,10 @@ class Database:
         search_dict[key] = value
         found_entry = self.table.query.filter_by(**search_dict).first()
         if found_entry:
+            pk = self.primary_key_of(found_entry)
             db.session.delete(found_entry)
             db.session.commit()
+            identityCache.invalidate(self.table, [pk])
             return True
         return False
 
@@ -143,18 +309,91 @@ class Database:
     def delete_all(self):
         count = db.session.query(self.table).delete()
         db.session.commit()
+        identityCache.invalidate(self.table)
         print(f'Deleted {count} {type(self.table).__name__}')
         return count
 
     """
         Description: 
-            read single record in table
+            update all records matching search_dict with a single UPDATE,
+            including the columns derived from the updated ones
+        Params:
+            search_dict: dict of column names to values, list values match any
+            new_data: dict containing the key value pairs to update
+        Return: 
+            - [int] number of records updated
+    """
+    def bulk_update(self, search_dict, new_data):
+        new_data = self.with_derived(new_data)
+        values = {key: self.coerce(key, new_data[key]) for key in new_data}
+        count = self.table.query.filter(*self.build_filter(search_dict)) \
+            .update(values, synchronize_session=False)
+        db.session.commit()
+        identityCache.invalidate(self.table)
+        return count
+
+    """
+        Description: 
+            delete all records matching search_dict with a single DELETE,
+            without loading them
+        Params:
+            search_dict: dict of column names to values, list values match any
+        Return: 
+            - [int] number of records deleted
+    """
+    def bulk_delete(self, search_dict):
+        count = self.table.query.filter(*self.build_filter(search_dict)) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        identityCache.invalidate(self.table)
+        return count
+
+    """
+        Description: 
+            update many records by primary key in one transaction. Updates
+            setting the same columns are sent as one executemany UPDATE.
+            Columns derived from the updated ones are updated too
+        Params:
+            updates: [list] of (primary key value, dict of key value pairs)
+        Return: 
+            - [int] number of records updated
+    """
+    def update_many(self, updates):
+        pk_column = self.table.__mapper__.primary_key[0]
+        groups = {}
+        for pk, new_data in updates:
+            new_data = self.with_derived(new_data)
+            params = {'_pk': pk}
+            for key in new_data:
+                params['_v_' + key] = self.coerce(key, new_data[key])
+            groups.setdefault(tuple(sorted(new_data)), []).append(params)
+
+        count = 0
+        for keys, params in groups.items():
+            if not keys:
+                continue
+            statement = self.table.__table__.update() \
+                .where(pk_column == bindparam('_pk')) \
+                .values({key: bindparam('_v_' + key) for key in keys})
+            count += db.session.execute(statement, params).rowcount
+        db.session.commit()
+        identityCache.invalidate(self.table, [self.coerce(pk_column.key, pk) for pk, _ in updates])
+        return count
+
+    """
+        Description: 
+            read all records in table matching a query
         Params:
             search_dict:
-                python dict containing key value pairs to query table
+                python dict or request.args of query arguments, only fields
+                in searchable_fields are allowed, see QueryCompiler.py
+            profile: name of a loading profile, see load_options
         Return: 
             - [list] containing the python dicts of all matching records
+        Raises:
+            QueryError if search_dict contains an invalid argument
     """
-    def search(self, search_dict):
-        all_entries = self.table.query.filter_by(**search_dict)
-        return self.models_to_list(all_entries)
\ No newline at end of file
+    def search(self, search_dict, profile=None):
+        query, fields = QueryCompiler(self).compile(search_dict)
+        query = query.options(*self.load_options(profile))
+        return self.schema(many=True, only=fields).dump(query.all())
\ No newline at end of file
@@ -3,6 +3,14 @@ from models import FollowUp, FollowUpSchema
 from .Database import Database
 
 class FollowUpRepo(Database):
+    searchable_fields = ('id', 'healthcareWorkerId', 'dateAssessed')
+
+    # FollowUpSchema nests the healthcare worker and dumps the referral id
+    loading_profiles = {
+        'list': {'healthcareWorker': 'joined', 'referral': 'selectin'},
+        'detail': {'healthcareWorker': 'joined', 'referral': 'joined'},
+    }
+
     def __init__(self):
         super(FollowUpRepo, self).__init__(
             table=FollowUp,
@@ -3,6 +3,13 @@ from models import HealthFacility, HealthFacilitySchema
 from .Database import Database
 
 class HealthFacilityRepo(Database):
+    searchable_fields = ('healthFacilityName',)
+
+    # HealthFacilitySchema dumps the ids of the facility's users and referrals
+    loading_profiles = {
+        'list': {'users': 'selectin', 'referrals': 'selectin'},
+    }
+
     def __init__(self):
         super(HealthFacilityRepo, self).__init__(
             table=HealthFacility,
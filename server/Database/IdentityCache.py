@@ -0,0 +1,195 @@
+"""
+Filename:
+    IdentityCache.py
+Description:
+    Two level cache of the rows Database.read returns by primary key:
+    - a map kept in flask.g for the current request, so reading the same
+      row again in one request does not query the database
+    - an optional LRU shared by the requests of a worker process, holding
+      rows serialized as JSON, enabled by setting IDENTITY_CACHE_SIZE
+    A row's dump can include its related rows (e.g. a patient's readings,
+    a referral's follow up and its healthcare worker), so writing to a table
+    also invalidates every cached table whose dumps include it.
+Usage:
+    - Database.read takes the version() of the table, looks rows up with
+    get() and stores the rows it then queries with put(), which drops them
+    if the table was written to in between
+    - call invalidate(table, pks) after committing changes to rows of table,
+    or invalidate(table) after changing rows whose keys are unknown
+    - LRU entries expire after IDENTITY_CACHE_TTL seconds, which bounds how
+    stale a row can be after another worker process writes it
+"""
+
+import collections
+import json
+import threading
+import time
+from flask import g, has_request_context
+from marshmallow import fields
+from config import app
+
+# key of the request scoped map in flask.g
+REQUEST_MAP = '_identity_map'
+
+"""
+    Description:
+        returns the names of the tables whose data appears in the dump of a
+        row of table: itself, tables it has a relationship with, and the
+        tables of nested schemas
+"""
+def dumped_tables(table, schema):
+    tables = {table.__tablename__}
+    for relationship in table.__mapper__.relationships:
+        tables.add(relationship.mapper.class_.__tablename__)
+    for field in schema._declared_fields.values():
+        nested = getattr(field, 'nested', None) if isinstance(field, fields.Nested) else None
+        if isinstance(nested, type):
+            tables |= dumped_tables(nested.Meta.model, nested)
+    return tables
+
+
+class IdentityCache():
+    def __init__(self):
+        # (tablename, pk) -> (generation, time cached, json)
+        self._lru = collections.OrderedDict()
+        # tablename -> generation, entries of older generations are stale
+        self._generations = collections.Counter()
+        # tablename -> number of invalidations of its rows, see version()
+        self._writes = collections.Counter()
+        # tablename -> names of the tables whose dumps include it
+        self._dependents = collections.defaultdict(set)
+        self._registered = set()
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    """
+        Description:
+            records which tables a table's dumps depend on, called by each
+            Database with its table and schema
+    """
+    def register(self, table, schema):
+        if table.__tablename__ in self._registered:
+            return
+        with self._lock:
+            for dependency in dumped_tables(table, schema):
+                self._dependents[dependency].add(table.__tablename__)
+            self._registered.add(table.__tablename__)
+
+    def _request_map(self):
+        if not has_request_context():
+            return None
+        if REQUEST_MAP not in g:
+            setattr(g, REQUEST_MAP, {})
+        return getattr(g, REQUEST_MAP)
+
+    """
+        Return:
+            - [dict] a copy of the cached row, safe to modify
+            - None if the row is not cached
+    """
+    def get(self, table, pk):
+        key = (table.__tablename__, pk)
+        generation = self._generations[key[0]]
+
+        request_map = self._request_map()
+        entry = request_map.get(key) if request_map is not None else None
+        if entry and entry[0] == generation:
+            self._stats['requestHits'] += 1
+            return json.loads(entry[1])
+
+        if app.config.get('IDENTITY_CACHE_SIZE', 0) > 0:
+            ttl = app.config.get('IDENTITY_CACHE_TTL', 5)
+            with self._lock:
+                entry = self._lru.get(key)
+                if entry and entry[0] == generation and time.monotonic() - entry[1] <= ttl:
+                    self._lru.move_to_end(key)
+                else:
+                    entry = None
+            if entry:
+                self._stats['lruHits'] += 1
+                if request_map is not None:
+                    request_map[key] = (generation, entry[2])
+                return json.loads(entry[2])
+
+        self._stats['misses'] += 1
+        return None
+
+    """
+        Return:
+            the version of table's cached rows, to take before reading a row
+            from the database and pass to put()
+    """
+    def version(self, table):
+        tablename = table.__tablename__
+        return (self._generations[tablename], self._writes[tablename])
+
+    """
+        Description:
+            caches a row read from the database, unless table was written to
+            since version was taken, as the row may then be stale
+    """
+    def put(self, table, pk, row, version):
+        key = (table.__tablename__, pk)
+        try:
+            serialized = json.dumps(row)
+        except TypeError:
+            return
+
+        size = app.config.get('IDENTITY_CACHE_SIZE', 0)
+        with self._lock:
+            if self.version(table) != version:
+                return
+            generation = version[0]
+
+            request_map = self._request_map()
+            if request_map is not None:
+                request_map[key] = (generation, serialized)
+
+            if size > 0:
+                self._lru[key] = (generation, time.monotonic(), serialized)
+                self._lru.move_to_end(key)
+                while len(self._lru) > size:
+                    self._lru.popitem(last=False)
+
+    """
+        Description:
+            drops the given rows of table, or all of its rows if pks is None,
+            and every cached row of the tables whose dumps include table
+    """
+    def invalidate(self, table, pks=None):
+        tablename = table.__tablename__
+        with self._lock:
+            self._stats['invalidations'] += 1
+            self._writes[tablename] += 1
+            for dependent in self._dependents[tablename] - {tablename}:
+                self._generations[dependent] += 1
+            if pks is None:
+                self._generations[tablename] += 1
+            else:
+                for pk in pks:
+                    self._lru.pop((tablename, pk), None)
+
+        request_map = self._request_map()
+        if request_map is not None and pks is not None:
+            for pk in pks:
+                request_map.pop((tablename, pk), None)
+
+    """
+        Return:
+            counters of this worker process since it started
+    """
+    def metrics(self):
+        hits = self._stats['requestHits'] + self._stats['lruHits']
+        lookups = hits + self._stats['misses']
+        return {
+            'requestHits': self._stats['requestHits'],
+            'lruHits': self._stats['lruHits'],
+            'misses': self._stats['misses'],
+            'hitRate': round(hits / lookups, 4) if lookups else None,
+            'invalidations': self._stats['invalidations'],
+            'lruSize': len(self._lru),
+            'lruCapacity': app.config.get('IDENTITY_CACHE_SIZE', 0),
+        }
+
+
+identityCache = IdentityCache()
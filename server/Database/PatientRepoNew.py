@@ -3,6 +3,14 @@ from models import Patient, PatientSchema
 from .Database import Database
 
 class PatientRepo(Database):
+    searchable_fields = ('patientId', 'patientName', 'villageNumber', 'zone', 'patientSex', 'isPregnant')
+
+    # PatientSchema dumps the ids of the patient's readings
+    loading_profiles = {
+        'list': {'readings': 'selectin'},
+        'detail': {'readings': 'selectin'},
+    }
+
     def __init__(self):
         super(PatientRepo, self).__init__(
             table=Patient,
@@ -0,0 +1,149 @@
+"""
+Filename:
+    QueryCompiler.py
+Description:
+    Compiles query string arguments into a SQLAlchemy query for
+    Database.search. Only the fields listed in a Database's
+    searchable_fields can be filtered or sorted on.
+Usage:
+    ?patientId=123                  equality
+    ?patientId__in=123,456          matches any of the comma separated values
+    ?dateReferred__gte=2019-10-01   range, one of __gt, __gte, __lt, __lte
+    ?patientId__prefix=4830         starts with
+    ?order_by=-dateReferred,id      sort, '-' for descending
+    ?limit=50&offset=100            page of results, limit is capped at MAX_LIMIT
+    ?fields=id,patientId            only return these fields
+"""
+
+import logging
+from config import app
+
+MAX_LIMIT = 1000
+
+RESERVED_ARGS = {'order_by', 'limit', 'offset', 'fields'}
+
+class QueryError(Exception):
+    pass
+
+# escapes the LIKE wildcards of value, for use with escape='\\'
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+"""
+    Description:
+        returns the names of the columns of table that an index can be used
+        to search on, i.e. the leading column of the primary key, of each
+        index and of each unique constraint
+"""
+def indexed_columns(table):
+    sql_table = table.__table__
+    indexed = set()
+    leading_columns = [list(sql_table.primary_key.columns)]
+    leading_columns += [list(index.columns) for index in sql_table.indexes]
+    leading_columns += [list(constraint.columns) for constraint in sql_table.constraints
+                        if constraint.__class__.__name__ == 'UniqueConstraint']
+    for columns in leading_columns:
+        if columns:
+            indexed.add(columns[0].key)
+    return indexed
+
+
+class QueryCompiler():
+    def __init__(self, database):
+        self.database = database
+        self.table = database.table
+        self.searchable_fields = set(database.searchable_fields)
+        self.indexed = indexed_columns(database.table)
+
+    """
+        Description:
+            compiles search_dict into a query
+        Params:
+            search_dict: dict or request.args of query string arguments
+        Return:
+            - (query, fields) where fields is the list of fields to return,
+            or None for all fields
+        Raises:
+            QueryError if an argument is invalid or not allowed
+    """
+    def compile(self, search_dict):
+        query = self.table.query
+        for arg, value in search_dict.items():
+            if arg in RESERVED_ARGS:
+                continue
+            field, _, op = arg.partition('__')
+            query = query.filter(self.predicate(field, op or 'eq', value))
+
+        order_by = search_dict.get('order_by')
+        if order_by:
+            for field in order_by.split(','):
+                descending = field.startswith('-')
+                column = self.column(field.lstrip('-'))
+                query = query.order_by(column.desc() if descending else column.asc())
+
+        limit = search_dict.get('limit')
+        if limit:
+            query = query.limit(min(self.to_int('limit', limit), MAX_LIMIT))
+
+        offset = search_dict.get('offset')
+        if offset:
+            query = query.offset(self.to_int('offset', offset))
+
+        fields = search_dict.get('fields')
+        if fields:
+            fields = fields.split(',')
+            schema_fields = self.database.schema().fields
+            for field in fields:
+                if field not in schema_fields:
+                    raise QueryError(f'{field} is not a valid field')
+
+        return query, fields or None
+
+    def predicate(self, field, op, value):
+        column = self.column(field)
+        if op == 'eq':
+            return column == self.coerce(field, value)
+        if op == 'in':
+            values = value.split(',') if isinstance(value, str) else value
+            return column.in_([self.coerce(field, v) for v in values])
+        if op == 'gt':
+            return column > self.coerce(field, value)
+        if op == 'gte':
+            return column >= self.coerce(field, value)
+        if op == 'lt':
+            return column < self.coerce(field, value)
+        if op == 'lte':
+            return column <= self.coerce(field, value)
+        if op == 'prefix':
+            return column.like(escape_like(value) + '%', escape='\\')
+        raise QueryError(f'{op} is not a valid operator')
+
+    """
+        Description:
+            returns the column for a whitelisted field, refusing or warning
+            about fields that no index can be used for
+    """
+    def column(self, field):
+        if field not in self.searchable_fields:
+            raise QueryError(f'{field} is not a searchable field of {self.table.__tablename__}')
+        if field not in self.indexed:
+            message = f'{field} of {self.table.__tablename__} is not indexed'
+            if app.config.get('SEARCH_REQUIRE_INDEX'):
+                raise QueryError(message)
+            logging.warning(message + ', search will scan the table')
+        return getattr(self.table, field)
+
+    def coerce(self, field, value):
+        try:
+            return self.database.coerce(field, value)
+        except (ValueError, KeyError, TypeError):
+            raise QueryError(f'{field}: {value} is not a valid value')
+
+    def to_int(self, arg, value):
+        try:
+            value = int(value)
+        except ValueError:
+            raise QueryError(f'{arg} must be an int')
+        if value < 0:
+            raise QueryError(f'{arg} must not be negative')
+        return value
@@ -1,11 +1,79 @@
-from models import Reading, ReadingSchema
+from datetime import timedelta
+from sqlalchemy import func
+from config import db
+from models import Reading, ReadingSchema, ReadingArchive
+
+from utils import parse_client_datetime
+from geo import gps_columns
 
 from .Database import Database
 
 class ReadingRepo(Database):
+    searchable_fields = ('readingId', 'patientId', 'userId', 'dateTimeTaken', 'trafficLightStatus')
+
+    # ReadingSchema dumps the ids of the reading's patient and referral
+    loading_profiles = {
+        'list': {'patient': 'selectin', 'referral': 'selectin'},
+        'detail': {'patient': 'joined', 'referral': 'joined'},
+    }
+
+    # set by the validators of Reading, see models.py
+    derived_columns = {
+        'dateRecheckVitalsNeeded': lambda value: {'recheckDueAt': parse_client_datetime(value)},
+        'gpsLocationOfReading': gps_columns,
+    }
+
     def __init__(self):
         super(ReadingRepo, self).__init__(
             table=Reading,
             schema=ReadingSchema
         )
 
+    """
+    Description:
+        returns the tables holding the readings taken on or after date_from:
+        only the reading table when date_from is after every archived
+        reading, otherwise the reading and readingarchive tables
+    Params:
+        date_from: date, or None for all readings
+    """
+    def tables_for_range(self, date_from=None):
+        # one lookup on ix_readingarchive_dateTimeTaken
+        newest_archived = db.session.query(func.max(ReadingArchive.dateTimeTaken)).scalar()
+        if newest_archived is None or (date_from and date_from.isoformat() > newest_archived):
+            return [Reading]
+        return [Reading, ReadingArchive]
+
+    """
+    Description:
+        query of the readings taken between date_from and date_to, reading
+        the archive only if the range reaches into it
+    Params:
+        columns: [list] of column names to select
+        date_from, date_to: inclusive dates, or None
+        criteria: function returning a list of filters for a table, called
+            with Reading and ReadingArchive
+    Return:
+        - query, a UNION ALL of both tables when both are needed
+    """
+    def query_range(self, columns, date_from=None, date_to=None, criteria=None):
+        queries = []
+        for table in self.tables_for_range(date_from):
+            query = db.session.query(*[getattr(table, column) for column in columns])
+            if criteria:
+                query = query.filter(*criteria(table))
+            # dateTimeTaken is an ISO 8601 string, so dates compare as strings
+            if date_from:
+                query = query.filter(table.dateTimeTaken >= date_from.isoformat())
+            if date_to:
+                query = query.filter(table.dateTimeTaken < (date_to + timedelta(days=1)).isoformat())
+            queries.append(query)
+        return queries[0] if len(queries) == 1 else queries[0].union_all(*queries[1:])
+
+    """
+    Description:
+        same as query_range, as the columns of a subquery, in the order of
+        columns, for queries grouping or joining on them
+    """
+    def columns_in_range(self, columns, date_from=None, date_to=None, criteria=None):
+        return list(self.query_range(columns, date_from, date_to, criteria).subquery().c)
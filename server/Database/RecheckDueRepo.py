@@ -0,0 +1,12 @@
+from models import RecheckDue, RecheckDueSchema
+
+from .Database import Database
+
+class RecheckDueRepo(Database):
+    searchable_fields = ('patientId', 'userId', 'dueAt')
+
+    def __init__(self):
+        super(RecheckDueRepo, self).__init__(
+            table=RecheckDue,
+            schema=RecheckDueSchema
+        )
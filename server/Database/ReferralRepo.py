@@ -1,9 +1,38 @@
 from models import Referral, ReferralSchema
 from config import db
+from utils import parse_client_datetime
 
 from .Database import Database
+from .IdentityCache import identityCache
 
 class ReferralRepo(Database):
+    searchable_fields = ('id', 'userId', 'patientId', 'referralHealthFacilityName',
+                         'readingId', 'followUpId', 'dateReferred', 'triagePriority', 'referredAt')
+
+    # ReferralSchema dumps the ids of the referral's facility, reading and
+    # user, and nests its follow up with the follow up's healthcare worker
+    loading_profiles = {
+        'list': {
+            'healthFacility': 'selectin',
+            'reading': 'selectin',
+            'users': 'selectin',
+            'followUp.healthcareWorker': 'joined',
+            'followUp.referral': 'joined',
+        },
+        'detail': {
+            'healthFacility': 'joined',
+            'reading': 'joined',
+            'users': 'joined',
+            'followUp.healthcareWorker': 'joined',
+            'followUp.referral': 'joined',
+        },
+    }
+
+    # set by the validator of Referral, see models.py
+    derived_columns = {
+        'dateReferred': lambda value: {'referredAt': parse_client_datetime(value)},
+    }
+
     def __init__(self):
         super(ReferralRepo, self).__init__(
             table=Referral,
@@ -17,7 +46,7 @@ class ReferralRepo(Database):
     """
     def update(self, key, value, new_data):
         if "followUpId" in new_data:
-            search_dict = {}
+            search_dict = {'followUpId': new_data['followUpId']}
             found_entry = self.table.query.filter_by(**search_dict).first()
             if found_entry:
                 # remove association with previous FollowUp
@@ -25,7 +54,8 @@ class ReferralRepo(Database):
                 found_entry.followUp = None
                 found_entry.followUpId = None
                 db.session.commit()
-                return super(ReferralRepo, self).update(key, value, new_data)
+                identityCache.invalidate(self.table, [found_entry.id])
+            return super(ReferralRepo, self).update(key, value, new_data)
 
         else:
             return super(ReferralRepo, self).update(key, value, new_data)
\ No newline at end of file
@@ -3,6 +3,19 @@ from models import User, UserSchema
 from .Database import Database
 
 class UserRepo(Database):
+    searchable_fields = ('id', 'email', 'healthFacilityName')
+
+    # UserSchema dumps the ids of every relationship of the user
+    loading_profiles = {
+        'list': {
+            'healthFacility': 'selectin',
+            'roleIds': 'selectin',
+            'referrals': 'selectin',
+            'vhtList': 'selectin',
+            'followups': 'selectin',
+        },
+    }
+
     def __init__(self):
         super(UserRepo, self).__init__(
             table=User,
@@ -0,0 +1,130 @@
+import csv
+import datetime
+import enum
+import io
+import json
+import zlib
+from config import db
+from models import Reading, Referral, FollowUp
+from Manager import registry
+
+# entity -> (table, date column filtered by from/to)
+EXPORT_ENTITIES = {
+    'readings': (Reading, 'dateTimeTaken'),
+    'referrals': (Referral, 'referredAt'),
+    'followups': (FollowUp, 'dateAssessed'),
+}
+
+EXPORT_FORMATS = ['csv', 'ndjson']
+
+# rows fetched from the server side cursor at a time
+EXPORT_CHUNK_SIZE = 1000
+
+class ExportError(Exception):
+    pass
+
+def to_json_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+class ExportManager():
+
+    """
+    Description: returns the column names to export, all columns of the
+        entity's table by default
+    Raises: ExportError if entity or a field is unknown
+    """
+    def get_columns(self, entity, fields=None):
+        if entity not in EXPORT_ENTITIES:
+            raise ExportError(f'entity must be one of {", ".join(EXPORT_ENTITIES)}')
+        table, _ = EXPORT_ENTITIES[entity]
+        all_columns = [column.key for column in table.__table__.columns]
+        if not fields:
+            return all_columns
+        for field in fields:
+            if field not in all_columns:
+                raise ExportError(f'{field} is not a column of {entity}')
+        return list(fields)
+
+    """
+    Description: yields the rows of an entity as tuples, in primary key order,
+        from a server side cursor so that only chunk_size rows are held in
+        memory at a time. Rows are read as plain columns, no ORM objects.
+        Readings come from the reading table, then from the archive if the
+        range reaches into it
+    Parameters:
+        date_from, date_to: inclusive YYYY-MM-DD dates, or None, in UTC for
+            referrals, which are filtered on referredAt
+    """
+    def iter_rows(self, entity, columns, date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+        table, date_field = EXPORT_ENTITIES[entity]
+        tables = [table]
+        if table is Reading:
+            tables = registry.readingManager.database.tables_for_range(date_from)
+        # exclusive end of the range
+        date_end = date_to + datetime.timedelta(days=1) if date_to else None
+
+        for table in tables:
+            date_column = getattr(table, date_field)
+            query = db.session.query(*[getattr(table, column) for column in columns])
+            if isinstance(date_column.type, db.DateTime):
+                # a UTC datetime column, ranged from the start of date_from
+                start = datetime.datetime.combine(date_from, datetime.time.min) if date_from else None
+                end = datetime.datetime.combine(date_end, datetime.time.min) if date_end else None
+            else:
+                # dates are stored as ISO 8601 strings, so a date range is a string range
+                start = date_from.isoformat() if date_from else None
+                end = date_end.isoformat() if date_end else None
+            if start:
+                query = query.filter(date_column >= start)
+            if end:
+                query = query.filter(date_column < end)
+            query = query.order_by(*table.__table__.primary_key.columns) \
+                .execution_options(stream_results=True) \
+                .yield_per(chunk_size)
+            for row in query:
+                yield row
+
+    """
+    Description: yields the export as chunks of bytes, csv with a header row
+        or one json object per line, gzipped on the fly if gzip is set
+    """
+    def stream(self, entity, fmt='csv', fields=None, date_from=None, date_to=None,
+               gzip=False, chunk_size=EXPORT_CHUNK_SIZE):
+        if fmt not in EXPORT_FORMATS:
+            raise ExportError(f'format must be one of {", ".join(EXPORT_FORMATS)}')
+        columns = self.get_columns(entity, fields)
+        # wbits 31 writes a gzip header and trailer
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+        def encode(text):
+            data = text.encode('utf-8')
+            return compressor.compress(data) if compressor else data
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(columns)
+
+        rows = self.iter_rows(entity, columns, date_from, date_to, chunk_size)
+        for count, row in enumerate(rows, 1):
+            if writer:
+                writer.writerow([value.value if isinstance(value, enum.Enum) else value for value in row])
+            else:
+                buffer.write(json.dumps({column: to_json_value(value) for column, value in zip(columns, row)}))
+                buffer.write('\n')
+            if count % chunk_size == 0:
+                data = encode(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+                if data:
+                    yield data
+
+        data = encode(buffer.getvalue())
+        if compressor:
+            data += compressor.flush()
+        if data:
+            yield data
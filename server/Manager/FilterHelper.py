@@ -1,3 +1,6 @@
+from config import db
+from models import Patient, Referral
+from Manager import registry
 
 
 # need to finish filtering for CHO 
@@ -65,9 +68,48 @@ def filtered_list_cho(patients, readings, vhtList, userId):
     return patient_filtered_list
 
 
-
-
-
-
-
-
+# SQL counterparts of the filters above, for queries that should not load whole tables
+
+def scoped_user_ids(current_user):
+    """
+    Returns the ids of the users whose readings current_user can see:
+    a VHT sees their own, a CHO also sees those of the VHTs they supervise,
+    a user without a role sees none. Returns None for ADMIN and HCW, whose
+    scope does not depend on who took a reading
+    """
+    if 'ADMIN' in current_user['roles'] or 'HCW' in current_user['roles']:
+        return None
+    if 'CHO' in current_user['roles']:
+        return [current_user['userId']] + list(current_user['vhtList'])
+    if 'VHT' in current_user['roles']:
+        return [current_user['userId']]
+    return []
+
+
+def scoped_patient_ids(current_user):
+    """
+    Returns a query of the patientIds current_user can see, same rules as
+    get_patient_with_referral_and_reading, or None if they can see all patients.
+    Patients seen through their readings are found in the archived readings too
+    """
+    if 'ADMIN' in current_user['roles']:
+        return None
+    if 'HCW' in current_user['roles']:
+        return db.session.query(Referral.patientId) \
+            .filter(Referral.referralHealthFacilityName == current_user['healthFacilityName'])
+
+    user_ids = scoped_user_ids(current_user)
+    return registry.readingManager.database.query_range(
+        ['patientId'], criteria=lambda table: [table.userId.in_(user_ids)])
+
+
+def can_see_patient(current_user, patient_id):
+    """
+    Returns whether current_user can see the patient, see scoped_patient_ids
+    """
+    patient_ids = scoped_patient_ids(current_user)
+    if patient_ids is None:
+        return True
+    return db.session.query(Patient.patientId) \
+        .filter(Patient.patientId == patient_id, Patient.patientId.in_(patient_ids)) \
+        .first() is not None
@@ -1,7 +1,6 @@
 from Database.FollowUpRepo import FollowUpRepo
 from Manager.Manager import Manager
-from Manager import referralManager
-from Manager import patientManager
+from Manager import registry
 from utils import get_current_time, pprint
 
 class FollowUpManager(Manager):
@@ -10,34 +9,24 @@ class FollowUpManager(Manager):
 
     # include patient schema in response
     def mobile_read(self, key, value):
-        follow_up = super(FollowUpManager, self).read(key, value)
+        follow_up = super(FollowUpManager, self).read(key, value, 'detail')
         if not follow_up:
             return follow_up
-        follow_up = self.include_patient(follow_up)
-        follow_up = self.include_referral(follow_up)
-        return follow_up
+        return self.include_referrals([follow_up])[0]
     
     def mobile_search(self, search_dict):
-        follow_ups = super(FollowUpManager, self).search(search_dict)
+        # mobile responses have a fixed shape, so field selection is ignored
+        search_dict = {key: search_dict[key] for key in search_dict if key != 'fields'}
+        follow_ups = super(FollowUpManager, self).search(search_dict, 'list')
         if not follow_ups: 
             return None
-        for i in range(len(follow_ups)):
-            follow_up = self.include_patient(follow_ups[i])
-            follow_up = self.include_patient(follow_up)
-            follow_up = self.include_referral(follow_up)
-            follow_ups[i] = follow_up
-        return follow_ups
+        return self.include_referrals(follow_ups)
 
     def mobile_read_all(self):
-        follow_ups = super(FollowUpManager, self).read_all()
+        follow_ups = super(FollowUpManager, self).read_all('list')
         if not follow_ups:
             return None
-        for i in range(len(follow_ups)):
-            follow_up = self.include_patient(follow_ups[i])
-            follow_up = self.include_patient(follow_up)
-            follow_up = self.include_referral(follow_up)
-            follow_ups[i] = follow_up
-        return follow_ups
+        return self.include_referrals(follow_ups)
 
     def mobile_read_summarized(self, key, value):
         follow_up = self.mobile_read(key, value)
@@ -60,23 +49,25 @@ class FollowUpManager(Manager):
         return follow_ups
 
 
-    # attaches patient info to a follow_up dict if the follow_up is attached to a valid referral
-    def include_patient(self, follow_up):
-        if not follow_up['referral']:
-            return follow_up
-        
-        referral = referralManager.read("id", follow_up['referral'])
-        patient = patientManager.read("patientId", referral['patientId'])
-        follow_up['patient'] = patient
-        return follow_up
-    
-    def include_referral(self, follow_up):
-        if not follow_up['referral']:
-            return follow_up
-        
-        referral = referralManager.read("id", follow_up['referral'])
-        follow_up['referral'] = referral
-        return follow_up
+    # replaces the referral id of each follow_up dict with the referral and
+    # attaches the referral's patient, reading all of them with one search each
+    def include_referrals(self, follow_ups):
+        referral_ids = [follow_up['referral'] for follow_up in follow_ups if follow_up['referral']]
+        if not referral_ids:
+            return follow_ups
+
+        referrals = registry.referralManager.search({'id__in': referral_ids}, 'list')
+        referrals = {referral['id']: referral for referral in referrals}
+        patient_ids = list({referral['patientId'] for referral in referrals.values()})
+        patients = registry.patientManager.search({'patientId__in': patient_ids}, 'list') if patient_ids else []
+        patients = {patient['patientId']: patient for patient in patients}
+
+        for follow_up in follow_ups:
+            if follow_up['referral']:
+                referral = referrals.get(follow_up['referral'])
+                follow_up['patient'] = patients.get(referral['patientId']) if referral else None
+                follow_up['referral'] = referral
+        return follow_ups
 
     def mobile_summarize(self, follow_up):
         if not follow_up:
@@ -111,7 +102,7 @@ class FollowUpManager(Manager):
                 'id': follow_up['healthcareWorker']['id'],
                 'email': follow_up['healthcareWorker']['email']
             }
-            res['healthFacility']['name'] = follow_up['healthcareWorker']['healthFacility']
+            res['healthFacility']['name'] = follow_up['healthcareWorker']['healthFacilityName']
         else:
             res['healthFacility'] = None
 
@@ -127,7 +118,7 @@ class FollowUpManager(Manager):
             referral_id = data["referral"]
             data.pop("referral", None)
             res = super(FollowUpManager, self).create(data)        
-            referralManager.update("id", referral_id, {
+            registry.referralManager.update("id", referral_id, {
                 "followUpId": res["id"]
             })
             res["referral"] = int(referral_id)
@@ -145,7 +136,7 @@ class FollowUpManager(Manager):
             referral_id = new_data["referral"]
             new_data.pop("referral", None)
             res = super(FollowUpManager, self).update(key, value, new_data)        
-            referralManager.update("id", referral_id, {
+            registry.referralManager.update("id", referral_id, {
                 "followUpId": res["id"]
             })
             res["referral"] = int(referral_id)
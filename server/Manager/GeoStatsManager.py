@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_
+from config import db
+from models import Patient, Referral, Village
+from Manager import registry
+
+# levels of geographic rollup
+GEO_LEVELS = ['village', 'zone']
+
+# default number of months returned by get_geo_stats
+DEFAULT_MONTHS = 12
+
+def month_start(month):
+    return datetime.strptime(month, '%Y-%m')
+
+def add_months(month, count):
+    date = month_start(month)
+    index = date.year * 12 + date.month - 1 + count
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+class GeoStatsManager():
+
+    """
+    Description: returns the rollup key of a patient, i.e. their villageNumber,
+        or for zones the zoneNumber of their village from the Village table,
+        falling back to the patient's own zone for villages not in the table
+    """
+    def group_column(self, level):
+        if level == 'village':
+            return Patient.villageNumber
+        return func.coalesce(Village.zoneNumber, Patient.zone)
+
+    """
+    Description: restricts a query joined to Patient and Village to a single
+        village or zone, using the patient village and zone indexes
+    """
+    def filter_group(self, query, level, key):
+        if key is None:
+            return query
+        if level == 'village':
+            return query.filter(Patient.villageNumber == key)
+        villages = db.session.query(Village.villageNumber).filter(Village.zoneNumber == key)
+        return query.filter(or_(Patient.villageNumber.in_(villages), Patient.zone == key)) \
+            .filter(self.group_column(level) == key)
+
+    def base_query(self, scope, level, key, *columns):
+        group = self.group_column(level)
+        query = db.session.query(group, *columns) \
+            .select_from(Patient) \
+            .outerjoin(Village, Village.villageNumber == Patient.villageNumber)
+        if scope.patient_filter is not None:
+            query = query.filter(scope.patient_filter)
+        return self.filter_group(query, level, key)
+
+    """
+    Description: per village or zone rollups, computed by grouped queries over
+        the patient, reading and referral indexes rather than by loading rows.
+        Readings are counted from the readingarchive table too when the
+        range reaches into it, see ReadingRepo.query_range. Only counts the
+        patients, readings and referrals current_user can see, see
+        StatsManager.get_scope
+    Parameters:
+        current_user: jwt identity
+        level: one of GEO_LEVELS
+        key: only return this village or zone, or None for all of them
+        month_from, month_to: inclusive range of months formatted as YYYY-MM,
+            defaults to the last DEFAULT_MONTHS months
+    Return: {level, from, to, groups: [{key, patients, readingsByMonth,
+        referralsByMonth, trafficLight}]}
+    """
+    def get_geo_stats(self, current_user, level, key=None, month_from=None, month_to=None):
+        scope = registry.statsManager.get_scope(current_user)
+        month_to = month_to or datetime.utcnow().strftime('%Y-%m')
+        month_from = month_from or add_months(month_to, 1 - DEFAULT_MONTHS)
+        # dates are stored as ISO 8601 strings, so a month range is a string range
+        date_from = month_from
+        date_to = add_months(month_to, 1)
+        # readings of the months, from the reading and readingarchive tables
+        reading_patient, reading_taken, reading_status = registry.readingManager.database.columns_in_range(
+            ['patientId', 'dateTimeTaken', 'trafficLightStatus'],
+            month_start(month_from).date(), month_start(date_to).date() - timedelta(days=1),
+            scope.reading_criteria)
+
+        groups = {}
+        def group(group_key):
+            if group_key not in groups:
+                groups[group_key] = {
+                    'key': group_key,
+                    'patients': 0,
+                    'readingsByMonth': {},
+                    'referralsByMonth': {},
+                    'trafficLight': {},
+                }
+            return groups[group_key]
+
+        group_by = self.group_column(level)
+
+        patients = self.base_query(scope, level, key, func.count(Patient.patientId)) \
+            .group_by(group_by)
+        for group_key, count in patients:
+            group(group_key)['patients'] = count
+
+        reading_month = func.substr(reading_taken, 1, 7)
+        readings = self.base_query(scope, level, key, reading_month, func.count()) \
+            .join(reading_patient.table, reading_patient == Patient.patientId) \
+            .group_by(group_by, reading_month)
+        for group_key, month, count in readings:
+            group(group_key)['readingsByMonth'][month] = count
+
+        traffic_lights = self.base_query(scope, level, key, reading_status, func.count()) \
+            .join(reading_patient.table, reading_patient == Patient.patientId) \
+            .group_by(group_by, reading_status)
+        for group_key, status, count in traffic_lights:
+            group(group_key)['trafficLight'][status.name if status else 'NONE'] = count
+
+        referral_month = func.substr(Referral.dateReferred, 1, 7)
+        referrals = self.base_query(scope, level, key, referral_month, func.count(Referral.id)) \
+            .join(Referral, Referral.patientId == Patient.patientId) \
+            .filter(Referral.dateReferred >= date_from, Referral.dateReferred < date_to) \
+            .filter(*([] if scope.referral_filter is None else [scope.referral_filter])) \
+            .group_by(group_by, referral_month)
+        for group_key, month, count in referrals:
+            group(group_key)['referralsByMonth'][month] = count
+
+        return {
+            'level': level,
+            'from': month_from,
+            'to': month_to,
+            'groups': sorted(groups.values(), key=lambda g: (g['key'] is None, g['key'] or '')),
+        }
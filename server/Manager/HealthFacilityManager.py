@@ -1,7 +1,37 @@
 from Database.HealthFacilityRepoNew import HealthFacilityRepo
 from Manager.Manager import Manager
+from Manager.HealthFacilityRegistry import healthFacilityRegistry
 
 
 class HealthFacilityManager(Manager):
     def __init__(self):
-        Manager.__init__(self, HealthFacilityRepo)
\ No newline at end of file
+        Manager.__init__(self, HealthFacilityRepo)
+
+    # every write invalidates the in-memory registry of facility names
+    def create(self, data):
+        res = super(HealthFacilityManager, self).create(data)
+        healthFacilityRegistry.invalidate()
+        return res
+
+    # left to the caller when commit is False, as the new names are only
+    # visible to other workers once the transaction commits
+    def create_many(self, data_list, commit=True):
+        res = super(HealthFacilityManager, self).create_many(data_list, commit)
+        if commit:
+            healthFacilityRegistry.invalidate()
+        return res
+
+    def update(self, key, value, new_data):
+        res = super(HealthFacilityManager, self).update(key, value, new_data)
+        healthFacilityRegistry.invalidate()
+        return res
+
+    def delete(self, key, value):
+        res = super(HealthFacilityManager, self).delete(key, value)
+        healthFacilityRegistry.invalidate()
+        return res
+
+    def delete_all(self):
+        res = super(HealthFacilityManager, self).delete_all()
+        healthFacilityRegistry.invalidate()
+        return res
@@ -0,0 +1,131 @@
+"""
+Description:
+    Process-local registry of health facility names. The health facility
+    table is small and rarely changes, so validators and list endpoints
+    read the names from memory instead of querying the table every time.
+Usage:
+    - healthFacilityRegistry.names() returns the set of known names
+    - healthFacilityRegistry.invalidate() must be called after writing
+    to the health facility table, it also replaces the version file of
+    HEALTH_FACILITY_REGISTRY_VERSION_PATH
+    - Every worker process checks the version file, a stat() and no SQL,
+    before trusting its names, and reloads them when it changed. Workers
+    on other hosts pick up changes once their copy is older than
+    HEALTH_FACILITY_REGISTRY_TTL seconds
+"""
+
+import collections
+import os
+import tempfile
+import time
+import uuid
+
+from config import app, db
+from models import HealthFacility
+
+# names are stored lowercased too, as MySQL's collation matches "hf1" to "HF1"
+Snapshot = collections.namedtuple('Snapshot', ['names', 'lowered', 'sorted_names', 'loaded_at', 'version'])
+
+
+def read_version():
+    try:
+        stat = os.stat(app.config['HEALTH_FACILITY_REGISTRY_VERSION_PATH'])
+    except OSError:
+        return None
+    # the file is replaced on every change, so its inode changes too
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+def write_version():
+    path = app.config['HEALTH_FACILITY_REGISTRY_VERSION_PATH']
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+        with os.fdopen(fd, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print('Could not write the health facility version: ' + str(e))
+
+
+class HealthFacilityRegistry():
+    def __init__(self):
+        # replaced as a whole, so readers always see a consistent snapshot
+        self._snapshot = None
+
+    def _is_stale(self, snapshot):
+        ttl = app.config.get('HEALTH_FACILITY_REGISTRY_TTL', 30)
+        return snapshot is None \
+            or time.monotonic() - snapshot.loaded_at > ttl \
+            or read_version() != snapshot.version
+
+    def _current(self):
+        snapshot = self._snapshot
+        if self._is_stale(snapshot):
+            snapshot = self._reload()
+        return snapshot
+
+    def _reload(self):
+        # read before the query, so a write racing it triggers another reload
+        version = read_version()
+        rows = db.session.query(HealthFacility.healthFacilityName).all()
+        names = frozenset(row[0] for row in rows)
+        snapshot = Snapshot(names, frozenset(name.lower() for name in names), sorted(names),
+                            time.monotonic(), version)
+        self._snapshot = snapshot
+        return snapshot
+
+    """
+        Description:
+            reloads all health facility names from the database
+        Return:
+            [frozenset] of all health facility names
+    """
+    def refresh(self):
+        return self._reload().names
+
+    """
+        Description:
+            drops the names of this worker and tells the other workers to
+            drop theirs
+    """
+    def invalidate(self):
+        self._snapshot = None
+        write_version()
+
+    """
+        Return:
+            [frozenset] of all health facility names
+    """
+    def names(self):
+        return self._current().names
+
+    """
+        Return:
+            [list] of all health facility names, sorted
+    """
+    def list_names(self):
+        return list(self._current().sorted_names)
+
+    """
+        Description:
+            returns the subset of names that are not known health facilities,
+            ignoring case. On a miss the registry is reloaded, at most once
+            per HEALTH_FACILITY_REGISTRY_MISS_INTERVAL seconds, in case a
+            worker on another host created them
+    """
+    def missing(self, names):
+        def find_missing(snapshot, names):
+            return {name for name in names if name is None or str(name).lower() not in snapshot.lowered}
+
+        snapshot = self._current()
+        missing = find_missing(snapshot, names)
+        interval = app.config.get('HEALTH_FACILITY_REGISTRY_MISS_INTERVAL', 1)
+        if missing and time.monotonic() - snapshot.loaded_at > interval:
+            missing = find_missing(self._reload(), missing)
+        return missing
+
+    def contains(self, name):
+        return not self.missing({name})
+
+
+healthFacilityRegistry = HealthFacilityRegistry()
@@ -0,0 +1,200 @@
+import csv
+import itertools
+from sqlalchemy.exc import DataError, IntegrityError
+from config import db
+from models import Patient, Reading, ReadingArchive, User
+from Manager import registry
+
+# rows validated and inserted per transaction
+IMPORT_CHUNK_SIZE = 1000
+
+# max number of values sent in a single IN (...) clause
+IN_CLAUSE_CHUNK_SIZE = 1000
+
+# entity -> how to import it
+#   table: model the rows are inserted in
+#   manager: registry name of the manager whose create_many inserts them
+#   key: primary key, rows whose key already exists are rejected
+#   required: columns that must have a value
+#   ranges: numeric columns and their inclusive (min, max)
+#   computed: columns set by the server, ignored if present in the file
+IMPORT_ENTITIES = {
+    'patients': {
+        'table': Patient,
+        'manager': 'patientManager',
+        'key': 'patientId',
+        'required': ['patientId', 'patientName', 'patientAge', 'patientSex'],
+        'ranges': {'patientAge': (0, 120)},
+        'computed': [],
+    },
+    'readings': {
+        'table': Reading,
+        'manager': 'readingManager',
+        'key': 'readingId',
+        'required': ['readingId', 'patientId', 'bpSystolic', 'bpDiastolic', 'heartRateBPM'],
+        'ranges': {'bpSystolic': (0, 300), 'bpDiastolic': (0, 300), 'heartRateBPM': (0, 300)},
+        'computed': ['trafficLightStatus', 'recheckDueAt', 'gpsLatitude', 'gpsLongitude', 'gpsCell'],
+    },
+}
+
+class ImportFileError(Exception):
+    pass
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+"""
+    Description: returns the subset of values that are in column, using one
+        SELECT column ... WHERE column IN (...) per chunk of values
+"""
+def find_existing(column, values):
+    values = list(values)
+    found = set()
+    for i in range(0, len(values), IN_CLAUSE_CHUNK_SIZE):
+        chunk = values[i:i + IN_CLAUSE_CHUNK_SIZE]
+        found.update(row[0] for row in db.session.query(column).filter(column.in_(chunk)))
+    return found
+
+class ImportManager():
+
+    """
+    Description: imports a csv file, whose header row names the columns of the
+        entity, chunk_size rows at a time: each chunk is validated, deduped
+        and inserted in one transaction, bad rows, including those the
+        database refuses, are written to reject_file with an error column
+    Parameters:
+        entity: one of IMPORT_ENTITIES
+        infile, reject_file: open text files
+        progress: called with the running totals after each chunk
+    Return: {'read': n, 'imported': n, 'rejected': n}
+    """
+    def import_csv(self, entity, infile, reject_file, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+        if entity not in IMPORT_ENTITIES:
+            raise ImportFileError(f'entity must be one of {", ".join(IMPORT_ENTITIES)}')
+        spec = IMPORT_ENTITIES[entity]
+
+        reader = csv.DictReader(infile)
+        columns = reader.fieldnames or []
+        table_columns = set(spec['table'].__table__.columns.keys())
+        unknown = [column for column in columns if column not in table_columns]
+        if unknown:
+            raise ImportFileError(f'{", ".join(unknown)} are not columns of {entity}')
+        missing = [column for column in spec['required'] if column not in columns]
+        if missing:
+            raise ImportFileError(f'required columns {", ".join(missing)} are missing')
+
+        rejects = csv.writer(reject_file)
+        rejects.writerow(columns + ['error'])
+
+        totals = {'read': 0, 'imported': 0, 'rejected': 0}
+        # keys imported so far, to reject duplicates within the file
+        seen = set()
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                break
+            valid, rejected = self.validate_chunk(spec, rows, seen)
+            refused = self.insert(getattr(registry, spec['manager']), valid) if valid else []
+            for row, _ in refused:
+                seen.discard(row[spec['key']])
+            rejected += refused
+            for row, error in rejected:
+                rejects.writerow([row.get(column) for column in columns] + [error])
+
+            totals['read'] += len(rows)
+            totals['imported'] += len(valid) - len(refused)
+            totals['rejected'] += len(rejected)
+            if progress:
+                progress(totals)
+        return totals
+
+    """
+    Description: inserts validated rows in one transaction. If the database
+        refuses them, the transaction is rolled back and each half is retried,
+        down to single rows, so a bad row only rejects itself
+    Parameters:
+        valid: list of (csv row, row dict ready to insert)
+    Return: list of (csv row, error) of the rows that were not inserted
+    """
+    def insert(self, manager, valid):
+        try:
+            manager.create_many([data for _, data in valid])
+            return []
+        except (IntegrityError, DataError) as e:
+            db.session.rollback()
+            if len(valid) == 1:
+                return [(valid[0][0], f'rejected by the database: {e.orig}')]
+        middle = len(valid) // 2
+        return self.insert(manager, valid[:middle]) + self.insert(manager, valid[middle:])
+
+    """
+    Description: validates a chunk of csv rows, range checks run on whole
+        columns at once
+    Return: (list of (csv row, row dict ready to insert), list of (row, error))
+    """
+    def validate_chunk(self, spec, rows, seen):
+        # numpy is only needed for imports, so it is not loaded with the app
+        import numpy as np
+
+        repo = getattr(registry, spec['manager']).database
+        errors = [None] * len(rows)
+
+        def reject(i, error):
+            if errors[i] is None:
+                errors[i] = error
+
+        for column in spec['required']:
+            for i, row in enumerate(rows):
+                if not row.get(column):
+                    reject(i, f'{column} is required')
+
+        for column, (minimum, maximum) in spec['ranges'].items():
+            values = np.array([to_float(row.get(column)) for row in rows])
+            present = np.array([bool(row.get(column)) for row in rows])
+            # nan fails both comparisons, so non numbers are out of range too
+            bad = present & ~((values >= minimum) & (values <= maximum))
+            for i in np.flatnonzero(bad):
+                reject(i, f'{column} must be a number from {minimum} to {maximum}')
+
+        key = spec['key']
+        keys = {row[key] for row in rows if row.get(key)}
+        existing = find_existing(getattr(spec['table'], key), keys)
+        if spec['table'] is Reading:
+            # a reading moved to the archive still exists
+            existing |= find_existing(ReadingArchive.readingId, keys)
+            patient_ids = {row['patientId'] for row in rows if row.get('patientId')}
+            known_patients = find_existing(Patient.patientId, patient_ids)
+            user_ids = set()
+            for i, row in enumerate(rows):
+                if row.get('userId'):
+                    try:
+                        user_ids.add(int(row['userId']))
+                    except ValueError:
+                        reject(i, f'userId {row["userId"]} must be an int')
+            known_users = find_existing(User.id, user_ids)
+
+        valid = []
+        for i, row in enumerate(rows):
+            if errors[i] is None and (row[key] in existing or row[key] in seen):
+                reject(i, f'{key} {row[key]} already exists')
+            if errors[i] is None and spec['table'] is Reading and row['patientId'] not in known_patients:
+                reject(i, f'patientId {row["patientId"]} does not belong to an existing patient')
+            if errors[i] is None and spec['table'] is Reading and row.get('userId') \
+                    and int(row['userId']) not in known_users:
+                reject(i, f'userId {row["userId"]} does not belong to an existing user')
+            if errors[i] is not None:
+                continue
+
+            try:
+                data = {column: repo.coerce(column, value) for column, value in row.items()
+                        if value != '' and column not in spec['computed']}
+            except (ValueError, KeyError, TypeError) as e:
+                reject(i, f'invalid value: {e}')
+                continue
+            seen.add(row[key])
+            valid.append((row, data))
+
+        return valid, [(row, errors[i]) for i, row in enumerate(rows) if errors[i] is not None]
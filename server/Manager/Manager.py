@@ -17,12 +17,15 @@ class Manager:
     
     def create(self, data):
         return self.database.create(data)
+
+    def create_many(self, data_list, commit=True):
+        return self.database.create_many(data_list, commit)
         
-    def read_all(self):
-        return self.database.read_all()
+    def read_all(self, profile=None):
+        return self.database.read_all(profile)
         
-    def read(self, key, value):
-        return self.database.read(key, value)
+    def read(self, key, value, profile=None):
+        return self.database.read(key, value, profile)
 
     def update(self, key, value, new_data):
         return self.database.update(key, value, new_data)
@@ -33,6 +36,15 @@ class Manager:
     def delete_all(self):
         return self.database.delete_all()
 
-    def search(self, search_dict):
-        return self.database.search(search_dict)
+    def bulk_update(self, search_dict, new_data):
+        return self.database.bulk_update(search_dict, new_data)
+
+    def bulk_delete(self, search_dict):
+        return self.database.bulk_delete(search_dict)
+
+    def update_many(self, updates):
+        return self.database.update_many(updates)
+
+    def search(self, search_dict, profile=None):
+        return self.database.search(search_dict, profile)
         
\ No newline at end of file
@@ -1,44 +1,79 @@
 import json
 from Database.PatientRepoNew import PatientRepo
-from Database.ReadingRepoNew import ReadingRepo
-from Database.ReferralRepo import ReferralRepo
 from Manager.Manager import Manager
-from Manager import referralManager, readingManager
-from Manager.ReferralManager import ReferralManager #referral data
-from Manager.ReadingManagerNew import ReadingManager #referral data
+from Manager import registry
+from Manager.FilterHelper import filtered_list_hcw, filtered_list_vht, filtered_list_cho, scoped_patient_ids
+from Database.QueryCompiler import escape_like
+from config import db
+from models import Patient
 
+# columns returned by patient search, enough to pick a patient from a list
+SEARCH_COLUMNS = ('patientId', 'patientName', 'patientAge', 'patientSex',
+                  'isPregnant', 'villageNumber', 'zone')
 
-# to do: remove all the redundant imports
-
-from Manager.UserManager import UserManager
-userManager = UserManager()
-referralManager = ReferralManager()
-readingManager = ReadingManager()
-from Manager.FilterHelper import filtered_list_hcw, filtered_list_vht, filtered_list_cho
-from Manager.RoleManager import RoleManager
-roleManager = RoleManager()
-from flask_jwt_extended import (create_access_token, create_refresh_token,
-jwt_required, jwt_refresh_token_required, get_jwt_identity)
-
+# names queries at least this long use the ngram FULLTEXT index on MySQL,
+# shorter ones (e.g. initials) a prefix match on ix_patient_patientName
+NGRAM_MIN_QUERY_LENGTH = 3
 
 
 class PatientManager(Manager):
     def __init__(self):
         Manager.__init__(self, PatientRepo)
 
+    """
+    Description: returns one page of the patients matching a search, only
+        including patients current_user can see, ordered by patientId
+    Parameters:
+        q: a patientId prefix if it is all digits, otherwise part of the
+            patient's name (initials are matched as a prefix)
+        village, zone: exact villageNumber and zone
+    """
+    def search_patients(self, current_user, q, village, zone, page, limit):
+        query = db.session.query(*[getattr(Patient, column) for column in SEARCH_COLUMNS])
+
+        if q:
+            if q.isdigit():
+                query = query.filter(Patient.patientId.like(escape_like(q) + '%', escape='\\'))
+            elif len(q) >= NGRAM_MIN_QUERY_LENGTH and db.engine.dialect.name == 'mysql':
+                # phrase search over ngrams matches q anywhere in the name
+                query = query.filter(Patient.patientName.match('"' + q.replace('"', '') + '"'))
+            else:
+                query = query.filter(Patient.patientName.like(escape_like(q) + '%', escape='\\'))
+        if village:
+            query = query.filter(Patient.villageNumber == village)
+        if zone:
+            query = query.filter(Patient.zone == zone)
+
+        patient_ids = scoped_patient_ids(current_user)
+        if patient_ids is not None:
+            query = query.filter(Patient.patientId.in_(patient_ids))
+
+        rows = query.order_by(Patient.patientId) \
+            .offset((page - 1) * limit) \
+            .limit(limit) \
+            .all()
+
+        items = []
+        for row in rows:
+            item = dict(zip(SEARCH_COLUMNS, row))
+            item['patientSex'] = item['patientSex'].value if item['patientSex'] else None
+            items.append(item)
+
+        return {'page': page, 'limit': limit, 'items': items}
+
 
     def get_patient_with_referral_and_reading(self, current_user):
         print(current_user)
         
         # harcoding for testing purposes
         # get filtered list of patients here, and then query only that list
-        patient_list = self.read_all()
-        ref_list = referralManager.read_all()
-        readings_list = readingManager.read_all() 
-        user_list = userManager.read_all()
+        patient_list = self.read_all('list')
+        ref_list = registry.referralManager.read_all('list')
+        readings_list = registry.readingManager.read_all('list')
+        user_list = registry.userManager.read_all('list')
 
         if 'ADMIN' in current_user['roles']:
-            patients_query = self.read_all()
+            patients_query = patient_list
         elif 'HCW' in current_user['roles']:
             patients_query = filtered_list_hcw(patient_list, ref_list, user_list, current_user['userId'])
         elif 'CHO' in current_user['roles']:
@@ -63,14 +98,14 @@ class PatientManager(Manager):
                 needs_assessment = False
                 for reading in patient["readings"]:
                     # build the reading json to add to array
-                    reading_json = readingManager.read("readingId", reading)
+                    reading_json = registry.readingManager.read("readingId", reading)
 
                     # print(json.dumps(reading_json, indent=2, sort_keys=True))
 
                     # add referral if exists in reading
                     if reading_json["referral"]:
 
-                        top_ref = referralManager.read("id", reading_json["referral"])
+                        top_ref = registry.referralManager.read("id", reading_json["referral"])
                         if not top_ref['followUp']:
                             needs_assessment = True
                         
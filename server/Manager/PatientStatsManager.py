@@ -1,10 +1,15 @@
 from flask_restful import abort
 from datetime import datetime
-from Manager.Manager import Manager
-from Manager.ReadingManagerNew import ReadingManager #reading data
-from Manager import patientManager
+from Manager import registry
 import json
-readingManager = ReadingManager()
+
+VITALS = ['bpSystolic', 'bpDiastolic', 'heartRateBPM']
+
+# buckets from finest to coarsest
+VITALS_BUCKETS = ['day', 'week', 'month']
+
+# max number of buckets returned by get_vitals
+MAX_VITALS_POINTS = 366
 
 # TO DO: Add error checking
 # TO DO: Update init
@@ -72,11 +77,21 @@ class PatientStatsManager():
     """
     def put_data_together(self, patient_id):
 
-        patient = patientManager.read("patientId", patient_id)
+        patient = registry.patientManager.read("patientId", patient_id)
         if patient is None:
             abort(404, message="Patient {} doesn't exist.".format(patient_id))
 
-        readings = readingManager.read_all()
+        # includes the patient's archived readings, see ReadingRepo.query_range
+        columns = ['patientId', 'dateTimeTaken', 'trafficLightStatus'] + VITALS
+        query = registry.readingManager.database.query_range(
+            columns, criteria=lambda table: [table.patientId == patient_id]
+        )
+        readings = []
+        for row in query.all():
+            reading = dict(zip(columns, row))
+            status = reading['trafficLightStatus']
+            reading['trafficLightStatus'] = status.name if status else None
+            readings.append(reading)
         
         # getting all bpSystolic readings for each month
         bp_systolic = self.get_data('bpSystolic', readings, patient_id)
@@ -112,9 +127,94 @@ class PatientStatsManager():
     
         # ret
         return data
-        
 
+    """
+    Description: returns the dates of the readings as numpy days, bucketed
+        by bucket (day, week starting on Monday, or month)
+    """
+    def bucket_dates(self, days, bucket):
+        import numpy as np
+        if bucket == 'day':
+            return days
+        if bucket == 'week':
+            # 1970-01-01 (day 0) was a Thursday
+            return days - (days.astype('int64') + 3) % 7
+        return days.astype('datetime64[M]').astype('datetime64[D]')
 
+    """
+    Description: Returns min/max/mean/count and the latest value of each
+        vital sign of a patient, per day, week or month. If there would be more
+        than MAX_VITALS_POINTS buckets, the next coarser bucket is used, and
+        only the latest MAX_VITALS_POINTS buckets are returned. Readings with
+        a malformed dateTimeTaken are left out and counted in skipped
+    Parameters:
+        date_from, date_to: datetime.date or None, both inclusive
+        bucket: one of VITALS_BUCKETS
+    """
+    def get_vitals(self, patient_id, date_from, date_to, bucket):
+        import numpy as np
+
+        # includes archived readings when the range reaches back to them
+        query = registry.readingManager.database.query_range(
+            ['dateTimeTaken'] + VITALS, date_from, date_to,
+            criteria=lambda table: [table.patientId == patient_id]
+        )
+        rows = sorted((row for row in query.all() if row[0]), key=lambda row: row[0])
+
+        # readings whose dateTimeTaken is not a date are counted, not charted
+        dated, days, skipped = [], [], 0
+        for row in rows:
+            try:
+                days.append(np.datetime64(row[0][:10], 'D'))
+                dated.append(row)
+            except ValueError:
+                skipped += 1
+        rows = dated
+
+        result = {
+            'patientId': patient_id,
+            'bucket': bucket,
+            'truncated': False,
+            'skipped': skipped,
+            'points': []
+        }
+        if not rows:
+            return result
 
+        days = np.array(days, dtype='datetime64[D]')
+        values = {
+            vital: np.array([row[i + 1] for row in rows], dtype=float)
+            for i, vital in enumerate(VITALS)
+        }
 
-        
+        for bucket in VITALS_BUCKETS[VITALS_BUCKETS.index(bucket):]:
+            keys = self.bucket_dates(days, bucket)
+            starts, first_index = np.unique(keys, return_index=True)
+            if len(starts) <= MAX_VITALS_POINTS:
+                break
+        result['bucket'] = bucket
+
+        if len(starts) > MAX_VITALS_POINTS:
+            result['truncated'] = True
+            starts = starts[-MAX_VITALS_POINTS:]
+            first_index = first_index[-MAX_VITALS_POINTS:]
+        ends = np.append(first_index[1:], len(rows))
+
+        for start, begin, end in zip(starts, first_index, ends):
+            point = {'start': str(start), 'count': int(end - begin)}
+            for vital in VITALS:
+                bucket_values = values[vital][begin:end]
+                bucket_values = bucket_values[~np.isnan(bucket_values)]
+                if len(bucket_values) == 0:
+                    point[vital] = None
+                    continue
+                point[vital] = {
+                    'min': float(bucket_values.min()),
+                    'max': float(bucket_values.max()),
+                    'mean': round(float(bucket_values.mean()), 1),
+                    'count': len(bucket_values),
+                    'latest': float(bucket_values[-1])
+                }
+            result['points'].append(point)
+
+        return result
@@ -1,22 +1,163 @@
 from Database.ReadingRepoNew import ReadingRepo
 from Manager.Manager import Manager
 
-from Manager import patientManager
+from Manager import registry
+from sqlalchemy import func, and_, or_
+from config import db
+from models import Reading, ReadingArchive, Referral, RecheckDue
+from trafficlight import classify, classify_many, triage_priority
+from utils import parse_client_datetime
+from Database.IdentityCache import identityCache
+from geo import gps_columns, geohash_decode, zoom_to_precision
+from flask_restful import abort
+from Manager.ReadingQueue import readingQueue
 
 class ReadingManager(Manager):
     def __init__(self):
         Manager.__init__(self, ReadingRepo)
 
+    # bulk ingestion: classifies all readings at once, then inserts them and
+    # refreshes the recheck worklist in one transaction
+    def create_many(self, readings, commit=True):
+        statuses = classify_many(
+            [reading.get('bpSystolic') for reading in readings],
+            [reading.get('bpDiastolic') for reading in readings],
+            [reading.get('heartRateBPM') for reading in readings]
+        )
+        for reading, status in zip(readings, statuses):
+            reading['trafficLightStatus'] = status
+            reading['recheckDueAt'] = parse_client_datetime(reading.get('dateRecheckVitalsNeeded'))
+            reading.update(gps_columns(reading.get('gpsLocationOfReading')))
+        count = super(ReadingManager, self).create_many(readings, commit=False)
+        registry.recheckManager.refresh(list({reading['patientId'] for reading in readings}), commit=False)
+        if commit:
+            db.session.commit()
+        return count
+
+    # keeps the recheck worklist of the reading's patient current
+    def create(self, data):
+        reading = super(ReadingManager, self).create(data)
+        registry.recheckManager.refresh([reading['patientId']])
+        return reading
+
+    """
+    Description: moves the readings taken before cutoff to the readingarchive
+        table, chunk_size at a time, one transaction per chunk. Readings
+        that a referral or the recheck worklist points to stay in the
+        reading table
+    Parameters:
+        cutoff: datetime
+    Return: number of readings archived
+    """
+    def archive(self, cutoff, chunk_size=1000, progress=None):
+        columns = [column.name for column in Reading.__table__.columns]
+        archived = 0
+        while True:
+            reading_ids = [row[0] for row in db.session.query(Reading.readingId)
+                .outerjoin(Referral, Referral.readingId == Reading.readingId)
+                .outerjoin(RecheckDue, RecheckDue.readingId == Reading.readingId)
+                .filter(Reading.dateTimeTaken < cutoff.isoformat())
+                .filter(Referral.id.is_(None), RecheckDue.patientId.is_(None))
+                .order_by(Reading.dateTimeTaken)
+                .limit(chunk_size)]
+            if not reading_ids:
+                break
+
+            select = db.select([Reading.__table__.c[column] for column in columns]) \
+                .where(Reading.readingId.in_(reading_ids))
+            db.session.execute(ReadingArchive.__table__.insert().from_select(columns, select))
+            Reading.query.filter(Reading.readingId.in_(reading_ids)).delete(synchronize_session=False)
+            db.session.commit()
+            identityCache.invalidate(Reading, reading_ids)
+
+            archived += len(reading_ids)
+            if progress:
+                progress(archived)
+        return archived
+
+    """
+    Description: validates a reading and appends it to the reading queue, a
+        background thread inserts it later, see Manager/ReadingQueue.py
+    Return: the reading as it will be inserted
+    """
+    def enqueue(self, data):
+        errors = self.database.schema().validate(data, session=db.session)
+        if errors:
+            abort(400, message=errors)
+        reading = dict(data)
+        reading['trafficLightStatus'] = classify(reading.get('bpSystolic'), reading.get('bpDiastolic'),
+                                                 reading.get('heartRateBPM'))
+        readingQueue.enqueue(reading)
+        return reading
+
     def create_reading_and_patient(self, patient_id, patient_reading_data):
-        patient = patientManager.read("patientId", patient_id)
+        patient = registry.patientManager.read("patientId", patient_id)
         if patient is None:
-            patient = patientManager.create(patient_reading_data['patient'])
+            patient = registry.patientManager.create(patient_reading_data['patient'])
         
         patient_reading_data['reading']['patientId'] = patient_id
 
-        reading = self.create(patient_reading_data['reading'])
+        if readingQueue.enabled():
+            reading = self.enqueue(patient_reading_data['reading'])
+        else:
+            reading = self.create(patient_reading_data['reading'])
 
         return {
             'reading': reading,
             'patient': patient
-        }
\ No newline at end of file
+        }
+
+    """
+    Description: counts the readings in a bounding box per geohash cell and
+        traffic light, aggregated in SQL from the gps index so no reading
+        is sent to the client. Archived readings are counted too. Only
+        counts the readings current_user can see, see StatsManager.get_scope
+    Parameters:
+        current_user: jwt identity
+        bbox: (min_lon, min_lat, max_lon, max_lat), min_lon > max_lon for a
+            box crossing the antimeridian
+        zoom: web map zoom level, sets the size of the cells
+    Return: {zoom, precision, cells: [{cell, latitude, longitude, count,
+        trafficLight, severity}]}, severity is the most severe traffic light
+        of the cell
+    """
+    def get_heatmap(self, current_user, bbox, zoom):
+        min_lon, min_lat, max_lon, max_lat = bbox
+        precision = zoom_to_precision(zoom)
+        reading_criteria = registry.statsManager.get_scope(current_user).reading_criteria
+
+        # filters of each table, so both read their own gps index
+        def criteria(table):
+            if min_lon <= max_lon:
+                in_lon = table.gpsLongitude.between(min_lon, max_lon)
+            else:
+                in_lon = or_(table.gpsLongitude >= min_lon, table.gpsLongitude <= max_lon)
+            filters = [table.gpsLatitude.between(min_lat, max_lat), in_lon]
+            if reading_criteria is not None:
+                filters += reading_criteria(table)
+            return filters
+
+        gps_cell, status = self.database.columns_in_range(['gpsCell', 'trafficLightStatus'], criteria=criteria)
+        cell = func.substr(gps_cell, 1, precision)
+        rows = db.session.query(cell, status, func.count()).group_by(cell, status).all()
+
+        cells = {}
+        for cell_hash, status, count in rows:
+            status = status.name if status else 'NONE'
+            if cell_hash not in cells:
+                latitude, longitude = geohash_decode(cell_hash)
+                cells[cell_hash] = {
+                    'cell': cell_hash,
+                    'latitude': latitude,
+                    'longitude': longitude,
+                    'count': 0,
+                    'trafficLight': {},
+                    'severity': status,
+                }
+            summary = cells[cell_hash]
+            summary['count'] += count
+            summary['trafficLight'][status] = count
+            if triage_priority(status) < triage_priority(summary['severity']):
+                summary['severity'] = status
+
+        return {'zoom': zoom, 'precision': precision, 'cells': sorted(cells.values(), key=lambda c: c['cell'])}
@@ -0,0 +1,193 @@
+"""
+Description:
+    Write-behind ingestion of readings. When READING_QUEUE_PATH is set,
+    new readings are appended to a SQLite queue on local disk and
+    acknowledged once that append is durable. A background flusher thread
+    in each worker process then inserts them into the main database in
+    batches, see ReadingManager.create_reading_and_patient.
+Guarantees:
+    - at least once: rows are deleted from the queue only after their batch
+      is committed to the main database. If a worker dies mid batch, its
+      claim expires after READING_QUEUE_CLAIM_TIMEOUT seconds and another
+      flusher retries the batch. Readings whose readingId already exists,
+      in the reading or readingarchive table, are skipped, so retries do
+      not insert duplicates. If a claim expires while its flusher is still
+      inserting, two flushers may insert the same readings: the one that
+      fails counts the readings the other one inserted as done
+    - bounded latency: a flusher wakes up as soon as READING_QUEUE_BATCH_SIZE
+      readings are waiting, or after READING_QUEUE_MAX_LATENCY seconds
+    - readings the main database refuses (e.g. invalid values) are moved to
+      the deadletter table of the queue file instead of blocking the queue.
+      Other errors are transient: the batch stays claimed and is retried
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from config import app, db
+from models import Reading, ReadingArchive
+from Manager import registry
+from Manager.ImportManager import find_existing
+
+# errors of readings the main database never accepts, constraint violations
+# and values that it or Database.coerce can't store
+REFUSED = (IntegrityError, DataError, ValueError, TypeError)
+
+
+class ReadingQueue():
+    def __init__(self):
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._appended = 0
+
+    def enabled(self):
+        return bool(app.config.get('READING_QUEUE_PATH'))
+
+    # one connection per thread, opened after uWSGI forks the workers
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(app.config['READING_QUEUE_PATH'], timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # fsync on every commit, an acknowledged reading survives a power loss
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.execute('CREATE TABLE IF NOT EXISTS readingqueue ('
+                               'id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, '
+                               'claimedBy TEXT, claimedAt REAL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS deadletter ('
+                               'id INTEGER PRIMARY KEY, payload TEXT NOT NULL, error TEXT, failedAt REAL)')
+            self._local.connection = connection
+        return connection
+
+    """
+        Description:
+            durably appends a reading to the queue
+        Params:
+            reading: [dict] of a reading, as passed to ReadingManager.create
+    """
+    def enqueue(self, reading):
+        self._connection().execute('INSERT INTO readingqueue (payload) VALUES (?)', (json.dumps(reading),))
+        # approximate, counts this process's appends since the last wake up
+        with self._lock:
+            self._appended += 1
+            if self._appended >= app.config['READING_QUEUE_BATCH_SIZE']:
+                self._appended = 0
+                self._wake.set()
+
+    """
+        Description:
+            claims up to batch_size readings, unclaimed ones or ones whose
+            claim expired, so that concurrent flushers get disjoint batches
+        Return:
+            (claim token, [list] of (queue id, payload))
+    """
+    def claim(self, batch_size):
+        connection = self._connection()
+        token = uuid.uuid4().hex
+        now = time.time()
+        expired = now - app.config['READING_QUEUE_CLAIM_TIMEOUT']
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'UPDATE readingqueue SET claimedBy = ?, claimedAt = ? WHERE id IN ('
+                'SELECT id FROM readingqueue WHERE claimedBy IS NULL OR claimedAt < ? ORDER BY id LIMIT ?)',
+                (token, now, expired, batch_size))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        rows = connection.execute('SELECT id, payload FROM readingqueue WHERE claimedBy = ? ORDER BY id',
+                                  (token,)).fetchall()
+        return token, rows
+
+    # returns the readingIds that are already in the main database
+    def _existing(self, reading_ids):
+        return find_existing(Reading.readingId, reading_ids) | find_existing(ReadingArchive.readingId, reading_ids)
+
+    def _dead_letter(self, queue_id, payload, error):
+        logging.error(f'Reading queue: moving {queue_id} to deadletter: {error}')
+        self._connection().execute('INSERT OR REPLACE INTO deadletter (id, payload, error, failedAt) VALUES (?, ?, ?, ?)',
+                                   (queue_id, payload, error, time.time()))
+
+    """
+        Description:
+            inserts one claimed batch into the main database with multi-row
+            INSERTs, then removes it from the queue
+        Return:
+            [int] number of readings taken from the queue
+    """
+    def flush_once(self):
+        token, rows = self.claim(app.config['READING_QUEUE_BATCH_SIZE'])
+        if not rows:
+            return 0
+
+        readings = [(queue_id, payload, json.loads(payload)) for queue_id, payload in rows]
+        existing = self._existing({reading['readingId'] for _, _, reading in readings})
+        batch = []
+        for queue_id, payload, reading in readings:
+            if reading['readingId'] in existing:
+                continue
+            existing.add(reading['readingId'])
+            batch.append((queue_id, payload, reading))
+
+        # any other error, e.g. a lost connection, leaves the batch claimed
+        # until its claim expires and a flusher retries it
+        try:
+            registry.readingManager.create_many([reading for _, _, reading in batch])
+        except REFUSED:
+            # find the readings the database refuses, one at a time
+            db.session.rollback()
+            for queue_id, payload, reading in batch:
+                try:
+                    registry.readingManager.create_many([reading])
+                except REFUSED as e:
+                    db.session.rollback()
+                    # inserted meanwhile by a flusher that claimed it after
+                    # our claim expired, or that we claimed after its claim did
+                    if self._existing({reading['readingId']}):
+                        continue
+                    self._dead_letter(queue_id, payload, str(e))
+
+        self._connection().execute('DELETE FROM readingqueue WHERE claimedBy = ?', (token,))
+        return len(rows)
+
+    def _run(self):
+        max_latency = app.config['READING_QUEUE_MAX_LATENCY']
+        batch_size = app.config['READING_QUEUE_BATCH_SIZE']
+        while not self._stop.is_set():
+            self._wake.wait(max_latency)
+            self._wake.clear()
+            try:
+                with app.app_context():
+                    while self.flush_once() >= batch_size:
+                        pass
+            except Exception as e:
+                logging.exception(f'Reading queue: flush failed, retrying: {e}')
+                time.sleep(max_latency)
+
+    """
+        Description:
+            starts the flusher thread of this process, if the queue is enabled
+    """
+    def start(self):
+        if not self.enabled() or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='reading-queue-flusher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+readingQueue = ReadingQueue()
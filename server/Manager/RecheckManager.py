@@ -0,0 +1,142 @@
+import os
+from datetime import datetime
+from sqlalchemy import func, and_
+from config import app, db
+from models import Patient, Reading, RecheckDue
+from Database.RecheckDueRepo import RecheckDueRepo
+from Manager.Manager import Manager
+from Manager.FilterHelper import scoped_user_ids, scoped_patient_ids
+from Database.IdentityCache import identityCache
+
+class RecheckManager(Manager):
+    def __init__(self):
+        Manager.__init__(self, RecheckDueRepo)
+
+    """
+    Description: rebuilds the recheck worklist rows of the given patients
+        from their latest reading, set based
+    Parameters:
+        patient_ids: list of patientIds
+        commit: False to leave the writes in the caller's transaction
+    """
+    def refresh(self, patient_ids, commit=True):
+        if not patient_ids:
+            return 0
+
+        latest = db.session.query(Reading.patientId, func.max(Reading.dateTimeTaken).label('dateTimeTaken')) \
+            .filter(Reading.patientId.in_(patient_ids)) \
+            .group_by(Reading.patientId) \
+            .subquery()
+        rows = db.session.query(Reading.patientId, Reading.readingId, Reading.userId, Reading.recheckDueAt) \
+            .join(latest, and_(Reading.patientId == latest.c.patientId,
+                               Reading.dateTimeTaken == latest.c.dateTimeTaken)) \
+            .filter(Reading.recheckDueAt.isnot(None)) \
+            .all()
+
+        # one row per patient, even if two readings share the latest dateTimeTaken
+        due = {}
+        for patient_id, reading_id, user_id, due_at in rows:
+            due[patient_id] = {'patientId': patient_id, 'readingId': reading_id, 'userId': user_id, 'dueAt': due_at}
+
+        RecheckDue.query.filter(RecheckDue.patientId.in_(patient_ids)).delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(RecheckDue, list(due.values()))
+        if commit:
+            db.session.commit()
+        identityCache.invalidate(RecheckDue, patient_ids)
+        return len(due)
+
+    """
+    Description: refreshes the worklist of the patients whose recheck came
+        due after since and up to now, found from ix_reading_recheckDueAt and
+        ix_recheckdue_dueAt, so a run reads the rechecks due in its window
+        rather than every patient. Used by `python manage.py sweep_rechecks`
+    Parameters:
+        since: datetime of the last sweep, None to sweep every patient
+    """
+    def sweep(self, since, now, chunk_size=1000):
+        if since is None:
+            return self.sweep_all(chunk_size)
+
+        patient_ids = {row[0] for row in db.session.query(Reading.patientId)
+            .filter(Reading.recheckDueAt > since, Reading.recheckDueAt <= now)
+            .distinct()}
+        patient_ids.update(row[0] for row in db.session.query(RecheckDue.patientId)
+            .filter(RecheckDue.dueAt > since, RecheckDue.dueAt <= now))
+
+        patient_ids = sorted(patient_ids)
+        due = 0
+        for i in range(0, len(patient_ids), chunk_size):
+            due += self.refresh(patient_ids[i:i + chunk_size])
+        return {'patients': len(patient_ids), 'due': due}
+
+    # returns the time of the last sweep, None if there was none
+    def read_last_sweep(self):
+        path = app.config['RECHECK_SWEEP_STATE_PATH']
+        if not os.path.exists(path):
+            return None
+        with open(path) as state_file:
+            try:
+                return datetime.fromisoformat(state_file.read().strip())
+            except ValueError:
+                return None
+
+    def write_last_sweep(self, swept_at):
+        with open(app.config['RECHECK_SWEEP_STATE_PATH'], 'w') as state_file:
+            state_file.write(swept_at.isoformat())
+
+    """
+    Description: rebuilds the whole recheck worklist, chunk_size patients at
+        a time
+    """
+    def sweep_all(self, chunk_size=1000):
+        last_id = None
+        patients = 0
+        due = 0
+        while True:
+            query = db.session.query(Patient.patientId)
+            if last_id is not None:
+                query = query.filter(Patient.patientId > last_id)
+            patient_ids = [row[0] for row in query.order_by(Patient.patientId).limit(chunk_size)]
+            if not patient_ids:
+                break
+            due += self.refresh(patient_ids)
+            patients += len(patient_ids)
+            last_id = patient_ids[-1]
+        return {'patients': patients, 'due': due}
+
+    """
+    Description: returns one page of the patients due a recheck before a
+        time, ordered by due time
+    Parameters:
+        current_user: jwt identity, limits the patients returned
+        scope: 'mine' for readings taken by current_user only,
+            'all' for every patient current_user can see
+    """
+    def get_due(self, current_user, before, scope, page, limit):
+        query = db.session.query(RecheckDue, Patient.patientName, Patient.villageNumber) \
+            .join(Patient, Patient.patientId == RecheckDue.patientId) \
+            .filter(RecheckDue.dueAt <= before)
+
+        if scope == 'mine':
+            query = query.filter(RecheckDue.userId == current_user['userId'])
+        else:
+            user_ids = scoped_user_ids(current_user)
+            patient_ids = scoped_patient_ids(current_user)
+            if user_ids is not None:
+                query = query.filter(RecheckDue.userId.in_(user_ids))
+            elif patient_ids is not None:
+                query = query.filter(RecheckDue.patientId.in_(patient_ids))
+
+        rows = query.order_by(RecheckDue.dueAt, RecheckDue.patientId) \
+            .offset((page - 1) * limit) \
+            .limit(limit) \
+            .all()
+
+        items = []
+        for recheck, patient_name, village_number in rows:
+            item = self.database.model_to_dict(recheck)
+            item['patientName'] = patient_name
+            item['villageNumber'] = village_number
+            items.append(item)
+
+        return {'page': page, 'limit': limit, 'items': items}
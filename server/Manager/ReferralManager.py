@@ -1,25 +1,134 @@
+import base64
+import binascii
+import json
+from datetime import datetime
 from flask_restful import abort
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import DataError, IntegrityError
 
-from utils import pprint
+from utils import pprint, parse_client_datetime
+from config import db
 
 from Database.ReferralRepo import ReferralRepo
-from Database.PatientRepoNew import PatientRepo
-from Database.ReadingRepoNew import ReadingRepo
-from Database.HealthFacilityRepoNew import HealthFacilityRepo
 
-from models import Patient, HealthFacility, Reading
+from models import User, Patient, HealthFacility, Reading, Referral
+from trafficlight import triage_priority
 from Validation.ReferralValidator import ReferralValidator
 
 from Manager.Manager import Manager
+from Manager.HealthFacilityRegistry import healthFacilityRegistry
 
-from Manager import patientManager, readingManager, healthFacilityManager
+from Manager import registry
 
 validator = ReferralValidator()
 
+"""
+Description: filter of the rows ordered after values when ordering by
+    columns ascending, NULLs first as MySQL and SQLite sort them
+"""
+def keyset_after(columns, values):
+    column, value = columns[0], values[0]
+    if value is None:
+        greater, equal = column.isnot(None), column.is_(None)
+    else:
+        greater, equal = column > value, column == value
+    if len(columns) == 1:
+        return greater
+    return or_(greater, and_(equal, keyset_after(columns[1:], values[1:])))
+
+# opaque cursor of the position of a referral in a queue
+def encode_queue_cursor(referral):
+    referred_at = referral.referredAt.isoformat() if referral.referredAt else None
+    position = json.dumps([referral.triagePriority, referred_at, referral.id])
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+# returns (triagePriority, referredAt, id) of a cursor, aborts if it is not valid
+def decode_queue_cursor(cursor):
+    try:
+        priority, referred_at, referral_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        referred_at = datetime.fromisoformat(referred_at) if referred_at is not None else None
+        if not isinstance(referral_id, int) or not isinstance(priority, (int, type(None))):
+            raise ValueError
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        abort(400, message='after is not a valid cursor')
+    return priority, referred_at, referral_id
+
 class ReferralManager(Manager):
     def __init__(self):
         Manager.__init__(self, ReferralRepo)
 
+    # places the new referral in the queue of its health facility
+    def create(self, data):
+        referral = super(ReferralManager, self).create(data)
+        self.update_triage_priority([referral['readingId']])
+        return referral
+
+    """
+    Description: maps readingIds to the triagePriority of their traffic light
+    Parameters:
+        reading_ids: list of readingIds
+    """
+    def triage_priorities(self, reading_ids):
+        rows = db.session.query(Reading.readingId, Reading.trafficLightStatus) \
+            .filter(Reading.readingId.in_(reading_ids)) \
+            .all()
+        return {reading_id: triage_priority(status.name if status else None) for reading_id, status in rows}
+
+    """
+    Description: sets triagePriority of the referrals of the given readings
+        from the readings' traffic light, one UPDATE per priority
+    Parameters:
+        reading_ids: list of readingIds
+    """
+    def update_triage_priority(self, reading_ids):
+        by_priority = {}
+        for reading_id, priority in self.triage_priorities(reading_ids).items():
+            by_priority.setdefault(priority, []).append(reading_id)
+
+        count = 0
+        for priority, ids in by_priority.items():
+            count += self.database.bulk_update({'readingId': ids}, {'triagePriority': priority})
+        return count
+
+    """
+    Description: returns one page of the open referrals of a health facility,
+        i.e. those without a follow up, most severe first and then oldest first.
+        Pages are keyset paginated on (triagePriority, referredAt, id) and
+        served from ix_referral_queue, so any page costs O(limit) rows read,
+        however deep in the queue it is
+    Parameters:
+        health_facility_name: name of the health facility
+        after: cursor returned as next by the previous page, None for the
+            first page
+    Return: {healthFacilityName, limit, items, next}, next is None on the
+        last page
+    """
+    def get_queue(self, health_facility_name, after, limit):
+        order = [Referral.triagePriority, Referral.referredAt, Referral.id]
+        query = db.session.query(Referral, Patient.patientName, Reading.trafficLightStatus) \
+            .join(Patient, Patient.patientId == Referral.patientId) \
+            .join(Reading, Reading.readingId == Referral.readingId) \
+            .filter(Referral.referralHealthFacilityName == health_facility_name) \
+            .filter(Referral.followUpId.is_(None))
+        if after:
+            position = decode_queue_cursor(after)
+            query = query.filter(keyset_after(order, position))
+            if position[0] is not None:
+                # a range on the index's priority column, whatever the OR below it
+                query = query.filter(Referral.triagePriority >= position[0])
+        # one more row than the page, to know if there is a next page
+        rows = query.order_by(*order).limit(limit + 1).all()
+
+        items = []
+        for referral, patient_name, status in rows[:limit]:
+            item = self.database.model_to_dict(referral)
+            item['patientName'] = patient_name
+            item['trafficLightStatus'] = status.name if status else None
+            items.append(item)
+
+        next_cursor = encode_queue_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        return {'healthFacilityName': health_facility_name, 'limit': limit, 'items': items, 'next': next_cursor}
+
     def create_referral_with_patient_and_reading(self, req_data):
         # if the patient is already created, dont create, 
         try:
@@ -27,7 +136,7 @@ class ReferralManager(Manager):
         except Exception as e:
             print("patient does not exist yet, creating")
             # do validation here
-            created_patient = patientManager.create(req_data['patient'])  
+            created_patient = registry.patientManager.create(req_data['patient'])  
             print("created_patient: ")
             pprint(created_patient)
 
@@ -38,7 +147,7 @@ class ReferralManager(Manager):
         except Exception as e:
             print("reading does not exist yet, creating")
             req_data['reading']['patientId'] = req_data['patient']['patientId']
-            created_reading = readingManager.create(req_data['reading'])
+            created_reading = registry.readingManager.create(req_data['reading'])
             print("created_reading: ")
             pprint(created_reading)
 
@@ -48,7 +157,7 @@ class ReferralManager(Manager):
             validator.exists(HealthFacility, "healthFacilityName", req_data['healthFacilityName'])
         except Exception as e:
             print("healthFacility doesnt exist, creating")
-            created_hf = healthFacilityManager.create(
+            created_hf = registry.healthFacilityManager.create(
                 {'healthFacilityName': req_data['healthFacilityName']}
             )
             print("created health facility: ")
@@ -79,3 +188,97 @@ class ReferralManager(Manager):
         created_res = self.create(referral_data)
         return referral_data
 
+    """
+    Description: batch version of create_referral_with_patient_and_reading,
+        for SMS and bulk uploads of many referrals at once. The whole batch is
+        validated before anything is written: new patients and readings
+        against their schemas, and every foreign key with one IN query per
+        table, see ReferralValidator.validate_many. Missing patients, readings
+        and health facilities and the referrals are then inserted with one
+        create_many each, all in one transaction, so a bad batch writes nothing
+    Parameters:
+        req_list: [list] of request bodies of create_referral_with_patient_and_reading
+    Return: [list] of the referral dicts created
+    """
+    def create_referrals_with_patients_and_readings(self, req_list):
+        def build_ref_dict(ref_json):
+            return {
+                'patientId': ref_json['patient']['patientId'],
+                'readingId': ref_json['reading']['readingId'],
+                'dateReferred': ref_json['date'],
+                'referralHealthFacilityName': ref_json['healthFacilityName'],
+                'comment': ref_json['comment'],
+            }
+
+        try:
+            referrals = [build_ref_dict(req_data) for req_data in req_list]
+            for referral_data in referrals:
+                validator.enforce_required(referral_data)
+        except (KeyError, TypeError) as e:
+            abort(400, message=f'Invalid referral, missing {e}')
+        except Exception as e:
+            abort(400, message=str(e))
+
+        patients = {req_data['patient']['patientId']: req_data['patient'] for req_data in req_list}
+        readings = {}
+        for req_data in req_list:
+            req_data['reading']['patientId'] = req_data['patient']['patientId']
+            readings[req_data['reading']['readingId']] = req_data['reading']
+
+        missing_patients = validator.find_missing(Patient, 'patientId', set(patients))
+        missing_readings = validator.find_missing(Reading, 'readingId', set(readings))
+        new_patients = [patients[patient_id] for patient_id in missing_patients]
+        new_readings = [readings[reading_id] for reading_id in missing_readings]
+        names = {referral_data['referralHealthFacilityName'] for referral_data in referrals}
+        new_names = validator.find_missing(HealthFacility, 'healthFacilityName', names)
+
+        errors = {}
+        patient_schema = registry.patientManager.database.schema()
+        for patient in new_patients:
+            patient_errors = patient_schema.validate(patient, session=db.session)
+            if patient_errors:
+                errors[f"patient {patient['patientId']}"] = patient_errors
+        reading_schema = registry.readingManager.database.schema()
+        for reading in new_readings:
+            reading_errors = reading_schema.validate(reading, session=db.session)
+            if reading_errors:
+                errors[f"reading {reading['readingId']}"] = reading_errors
+        user_ids = {reading['userId'] for reading in new_readings if reading.get('userId') is not None}
+        for user_id in sorted(validator.find_missing(User, 'id', user_ids), key=str):
+            errors[f'userId {user_id}'] = 'does not belong to an existing user'
+        if errors:
+            abort(400, message=errors)
+
+        try:
+            validator.validate_many(referrals, pending={
+                'patientId': set(missing_patients),
+                'readingId': set(missing_readings),
+                'referralHealthFacilityName': new_names,
+            })
+        except Exception as e:
+            abort(400, message=str(e))
+
+        try:
+            if new_patients:
+                registry.patientManager.create_many(new_patients, commit=False)
+            if new_readings:
+                registry.readingManager.create_many(new_readings, commit=False)
+            if new_names:
+                registry.healthFacilityManager.create_many(
+                    [{'healthFacilityName': name} for name in new_names], commit=False)
+
+            # create_many does not run the model's validators, so set referredAt
+            # and triagePriority here, from readings inserted above or stored
+            priorities = self.triage_priorities([referral_data['readingId'] for referral_data in referrals])
+            self.create_many([dict(referral_data,
+                                   referredAt=parse_client_datetime(referral_data['dateReferred']),
+                                   triagePriority=priorities.get(referral_data['readingId']))
+                              for referral_data in referrals], commit=False)
+            db.session.commit()
+        except (ValueError, TypeError, IntegrityError, DataError) as e:
+            db.session.rollback()
+            abort(400, message=f'Invalid referral batch: {getattr(e, "orig", e)}')
+
+        if new_names:
+            healthFacilityRegistry.invalidate()
+        return referrals
@@ -2,16 +2,14 @@ from Manager.Manager import Manager
 
 from config import db
 from models import Role, User
+from Database.IdentityCache import identityCache
 
 
 class RoleManager():
 
     def get_role_names(self, role_ids):
-        roles = []
-        for role_id in role_ids:
-            role = Role.query.filter_by(id=role_id).first()
-            roles.append(role.name.name)
-        return roles
+        roles = Role.query.filter(Role.id.in_(role_ids)).all() if role_ids else []
+        return [role.name.name for role in roles]
 
     def add_user_to_role(self, user_id, role_ids):
         # remove all user roles
@@ -25,6 +23,8 @@ class RoleManager():
             role.users.append(user)
             db.session.add(role)
         db.session.commit()
+        identityCache.invalidate(User, [user_id])
+        identityCache.invalidate(Role)
 
     def add_vht_to_supervise(self, cho_id, vht_ids):
         # find the cho
@@ -40,4 +40,5 @@ class RoleManager():
             vht = User.query.filter_by(id=vht_id).first()
             cho.vhtList.append(vht)
             db.session.add(cho)
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+        identityCache.invalidate(User)
\ No newline at end of file
@@ -1,126 +1,164 @@
-from datetime import datetime
-from Manager.Manager import Manager
-from Manager.PatientManagerNew import PatientManager #patient data
-from Manager.ReadingManagerNew import ReadingManager #reading data
-from Manager.ReferralManager import ReferralManager #referral data
-import json
+import collections
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, and_
+from config import app, db
+from models import Patient, Reading, Referral, SexEnum
+from Manager.FilterHelper import scoped_user_ids, scoped_patient_ids
+from Manager import registry
 
-patientManager = PatientManager()
-referralManager = ReferralManager()
-readingManager = ReadingManager()
+
+"""
+    Description: returns the month of a YYYY-MM-DD... date column as 1-12
+"""
+def month_of(column):
+    return func.substr(column, 6, 2)
+
+
+# what a user's stats are computed from, see StatsManager.get_scope.
+# reading_criteria is a function of Reading or ReadingArchive returning a
+# list of filters, see ReadingRepo.query_range
+Scope = collections.namedtuple('Scope', ['key', 'patient_filter', 'reading_criteria', 'referral_filter'])
 
 
-# TO DO: NEED TO ADD ERROR CHECKING
-# add init
 class StatsManager():
+    def __init__(self):
+        # scope key -> (time computed, stats), least recently used first
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
 
-    def get_traffic_light(self, item, data):
-        yellow_up_index = 1
-        yellow_down_index = 2
-        red_up_index = 3
-        red_down_index = 4
-        green_index = 0
-
-        if(item['trafficLightStatus'] == 'YELLOW_UP'):
-            data[yellow_up_index] += 1
-        if(item['trafficLightStatus'] == 'YELLOW_DOWN'):
-            data[yellow_down_index] += 1
-        if(item['trafficLightStatus'] == 'RED_UP'):
-            data[red_up_index] += 1
-        if(item['trafficLightStatus'] == 'RED_DOWN'):
-            data[red_down_index] += 1
-        if(item['trafficLightStatus'] == 'GREEN'):
-            data[green_index] += 1    
-
-
-
-    """ 
-        Description: can get either the total number of readings, or referrals, or assessments per month:
-        Can also get number of traffic lights in the last month
-            Parameters: 
-                Table: which table to look through 
-                category: e.g readings, referrals
-                dateLabel: how date is recorded in that category e.g dateTime vs dateReferred
-        """
-    def get_data(self, table, dateLabel, category):
-        if(category != 'trafficLight'):
-            data = [0,0,0,0,0,0,0,0,0,0,0,0]
-        
-        else:
-            data = [0,0,0,0,0]
-
-
-        today = datetime.today()
-        month_needed_for_for_traffic_light = today.month - 1
-        counter = 0
-        for item in table:
-            date_string = item[dateLabel]
-            #make sure to add error checking in here
-            date_object = datetime.strptime(date_string[5:7] , '%m')
-            month = date_object.month
-            if(category == 'reading' or category == 'referral'):
-                data[month-1] += 1
-            elif(category == 'assessment'): #counting number of assessments done
-                if(item['followUpId'] is not None):
-                    data[month-1] += 1
-            elif(category == 'trafficLight' and month == month_needed_for_for_traffic_light):
-                # get traffic light data
-                self.get_traffic_light(item, data)
-                
-        return data
+    """
+        Description: returns the cached value of key, computing it with
+        compute() once the cached copy is older than STATS_CACHE_TTL seconds.
+        Only the STATS_CACHE_SIZE most recently used keys are kept
+    """
+    def cached(self, key, compute):
+        ttl = app.config.get('STATS_CACHE_TTL', 60)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry:
+                self._cache.move_to_end(key)
+        if entry and time.monotonic() - entry[0] <= ttl:
+            return entry[1]
+        value = compute()
+        with self._lock:
+            self._cache[key] = (time.monotonic(), value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > app.config.get('STATS_CACHE_SIZE', 1024):
+                self._cache.popitem(last=False)
+        return value
 
-    """ 
-        Description: can get either the total number of pregnant patients that were referred,
-        total number of pregnant women that were referred and followed up, total number of women referred,
-        or total number of women assessed
-            Parameters: 
-                category: referred vs assesed           
     """
+        Description: the scope of the stats a user sees
+            - ADMIN: everything
+            - HCW: referrals to their health facility and the readings of the
+              patients referred there
+            - CHO: readings of the CHO and their VHTs and the referrals of those readings
+            - VHT: their own readings and the referrals of those readings
+            - any other user: nothing
+        Parameters:
+            current_user: jwt identity
+        Return: Scope, the patients, readings and referrals the user sees,
+            its filters are None for everything
+    """
+    def get_scope(self, current_user):
+        if 'ADMIN' in current_user['roles']:
+            return Scope('all', None, None, None)
+
+        if 'HCW' in current_user['roles']:
+            facility = current_user['healthFacilityName']
+            return Scope(f'facility:{facility}',
+                         Patient.patientId.in_(scoped_patient_ids(current_user)),
+                         lambda table: [table.patientId.in_(scoped_patient_ids(current_user))],
+                         Referral.referralHealthFacilityName == facility)
+
+        user_ids = scoped_user_ids(current_user)
+        role = 'cho' if 'CHO' in current_user['roles'] else 'vht' if user_ids else 'none'
+        # referred readings are never archived, see ReadingManager.archive
+        readings = db.session.query(Reading.readingId).filter(Reading.userId.in_(user_ids))
+        return Scope(f'{role}:{current_user["userId"]}',
+                     Patient.patientId.in_(scoped_patient_ids(current_user)),
+                     lambda table: [table.userId.in_(user_ids)],
+                     Referral.readingId.in_(readings))
 
-    def get_unique_counts(self, category):
-        data = [0,0,0,0,0,0,0,0,0,0,0,0]
-        collected = []
-        referrals = referralManager.read_all()
-        for item in referrals:
-            date_string = item['dateReferred']
-            # make sure to add error checking in here
-            date_object = datetime.strptime(date_string[5:7] , '%m')
-            month = date_object.month
-            patient_id = item['patientId']
-            patient = patientManager.read("patientId", patient_id)
-            
-            # checking if referral was for a pregnant patient
-            if(category == "pregReferrals" and patient not in collected):
-                if(patient['isPregnant']==1): 
-                    data[month-1] += 1
-                    collected.append(patient)
-
-            # checking how many pregnant women were assessed 
-            if(category == "pregAssessment"):
-                if(item['followUpId'] is not None and patient['isPregnant']==1 and patient not in collected):
-                    data[month-1] += 1
-                    collected.append(patient)
-
-            # checking how many women were referred
-            if(category == 'womenReferred' and patient not in collected):
-                if patient['patientSex'] == 'FEMALE':
-                    data[month-1] += 1
-                    collected.append(patient)
-
-           # checking referrals for women that were assessed
-            if(category == "womenAssessed"):
-                if(item['followUpId'] is not None and patient['patientSex']=='FEMALE' and patient not in collected):
-                    data[month-1] += 1
-                    collected.append(patient)
-
-           # checking unique people
-            if(category == "uniquePeopleAssessed"):
-                if(item['followUpId'] is not None and patient not in collected):
-                    data[month-1] += 1        
-                    collected.append(patient)
+    """
+        Description: returns a list of 12 counts, index 0 for January, from
+        rows of (month, count)
+    """
+    def per_month(self, rows):
+        data = [0] * 12
+        for month, count in rows:
+            if month and month.isdigit() and 1 <= int(month) <= 12:
+                data[int(month) - 1] += count
         return data
 
-    """ 
+    def count_per_month(self, query, date_column):
+        month = month_of(date_column)
+        return self.per_month(query.add_columns(month, func.count()).group_by(month).all())
+
+    """
+        Description: counts patients per month of their first referral matching
+        referral_criteria, only counting patients matching patient_criteria
+    """
+    def first_referral_per_month(self, referral_filter, referral_criteria, patient_criteria):
+        first = db.session.query(func.min(Referral.id).label('id')) \
+            .filter(*referral_criteria)
+        if referral_filter is not None:
+            first = first.filter(referral_filter)
+        first = first.group_by(Referral.patientId).subquery()
+
+        month = month_of(Referral.dateReferred)
+        query = db.session.query(month, func.count()) \
+            .join(first, first.c.id == Referral.id)
+        if patient_criteria:
+            query = query.join(Patient, Patient.patientId == Referral.patientId) \
+                .filter(*patient_criteria)
+        return self.per_month(query.group_by(month).all())
+
+    """
+        Description: computes the stats of a scope, readings are counted
+        from the reading and readingarchive tables, see ReadingRepo.query_range
+    """
+    def compute(self, scope):
+        reading_repo = registry.readingManager.database
+        referral_filter = scope.referral_filter
+        referrals = db.session.query().select_from(Referral)
+        if referral_filter is not None:
+            referrals = referrals.filter(referral_filter)
+
+        followed_up = [Referral.followUpId.isnot(None)]
+        pregnant = [Patient.isPregnant.is_(True)]
+        female = [Patient.patientSex == SexEnum.FEMALE]
+
+        data_to_return = {}
+        taken, = reading_repo.columns_in_range(['dateTimeTaken'], criteria=scope.reading_criteria)
+        data_to_return['readingsPerMonth'] = self.count_per_month(db.session.query(), taken)
+        data_to_return['referralsPerMonth'] = self.count_per_month(referrals, Referral.dateReferred)
+        data_to_return['assessmentsPerMonth'] = self.count_per_month(referrals.filter(*followed_up), Referral.dateReferred)
+        data_to_return['pregnantWomenReferredPerMonth'] = self.first_referral_per_month(referral_filter, [], pregnant)
+        data_to_return['pregnantWomenAssessedPerMonth'] = self.first_referral_per_month(referral_filter, followed_up, pregnant)
+        data_to_return['womenReferredPerMonth'] = self.first_referral_per_month(referral_filter, [], female)
+        data_to_return['womenAssessedPerMonth'] = self.first_referral_per_month(referral_filter, followed_up, female)
+        data_to_return['uniquePeopleAssesedPerMonth'] = self.first_referral_per_month(referral_filter, followed_up, [])
+
+        # traffic lights of the readings taken last month
+        last_month_end = datetime.today().date().replace(day=1) - timedelta(days=1)
+        _, status = reading_repo.columns_in_range(['dateTimeTaken', 'trafficLightStatus'],
+                                                  last_month_end.replace(day=1), last_month_end,
+                                                  scope.reading_criteria)
+        statuses = dict(db.session.query(status, func.count()).group_by(status).all())
+        counts = {status.name: count for status, count in statuses.items() if status}
+        data_to_return['trafficLightStatusLastMonth'] = {
+            'green': counts.get('GREEN', 0),
+            'yellowUp': counts.get('YELLOW_UP', 0),
+            'yellowDown': counts.get('YELLOW_DOWN', 0),
+            'redUp': counts.get('RED_UP', 0),
+            'redDown': counts.get('RED_DOWN', 0),
+        }
+        return data_to_return
+
+    """
         Description: puts a json object together with the following:
             total number of readings per month
             total number of referrals per month
@@ -131,55 +169,46 @@ class StatsManager():
             total number of assessments made for women
             total traffic light numbers for the last month
             each quantity is of an array, each index in the array refers to that index-1 month
+        Parameters:
+            current_user: jwt identity, see get_scope
     """
-    def put_data_together(self):
-        print("putting data together")
-        readings = readingManager.read_all()
-        referrals = referralManager.read_all()
-        data_to_return = {}
+    def put_data_together(self, current_user):
+        scope = self.get_scope(current_user)
+        return self.cached(('stats', scope.key), lambda: self.compute(scope))
 
-        # getting readings per month
-        readings_per_month = self.get_data(readings, 'dateTimeTaken', 'reading')
-        data_to_return['readingsPerMonth'] = readings_per_month
-
-        # getting number of referrals per month
-        referrals_per_month = self.get_data(referrals, 'dateReferred', 'referral')
-        data_to_return['referralsPerMonth'] = referrals_per_month 
-
-        # getting number of assessments per month
-        assessments_per_month = self.get_data(referrals, 'dateReferred', 'assessment')
-        data_to_return['assessmentsPerMonth'] = assessments_per_month
-        
-        # getting number of pregnant women that were referred
-        pregnant_referrals_per_month = self.get_unique_counts('pregReferrals')
-        data_to_return['pregnantWomenReferredPerMonth'] = pregnant_referrals_per_month
-        
-        # getting number of number pregnant women assessed
-        pregnant_assessments_per_month = self.get_unique_counts('pregAssessment')
-        data_to_return['pregnantWomenAssessedPerMonth'] = pregnant_assessments_per_month
-
-        # getting number of women referred per month
-        women_referrals_per_month = self.get_unique_counts('womenReferred')
-        data_to_return['womenReferredPerMonth'] = women_referrals_per_month
-
-        # getting number of women assessed per month
-        women_assessments_per_month = self.get_unique_counts('womenAssessed')
-        data_to_return['womenAssessedPerMonth'] = women_assessments_per_month
-
-        # getting unique number of people assessed per month
-        unique_people_assessed_per_month = self.get_unique_counts('uniquePeopleAssessed')
-        data_to_return['uniquePeopleAssesedPerMonth'] = unique_people_assessed_per_month
-
-        # getting traffic light data for the last month 
-        # sorry to the person who has to read the magic numbers below
-        traffic_light_data_last_month = self.get_data(readings, 'dateTimeTaken', 'trafficLight')
-        data_to_return['trafficLightStatusLastMonth'] = {}
-        data_to_return ['trafficLightStatusLastMonth']['green'] = traffic_light_data_last_month[0]
-        data_to_return ['trafficLightStatusLastMonth']['yellowUp'] = traffic_light_data_last_month[1]
-        data_to_return ['trafficLightStatusLastMonth']['yellowDown'] = traffic_light_data_last_month[2]
-        data_to_return ['trafficLightStatusLastMonth']['redUp'] = traffic_light_data_last_month[3]
-        data_to_return ['trafficLightStatusLastMonth']['redDown'] = traffic_light_data_last_month[4]
-
-    
-        # returning stats in json format
-        return json.loads(json.dumps(data_to_return))
+    """
+        Description: counts the patients current_user can see by the traffic
+        light of their latest reading, hot or archived. Of two readings taken
+        at the same time, the one with the greater readingId is the latest
+        Return: {'GREEN': n, 'YELLOW_UP': n, ..., 'NONE': n}
+    """
+    def get_patients_by_traffic_light(self, current_user):
+        scope = self.get_scope(current_user)
+
+        def compute():
+            patient_ids = scoped_patient_ids(current_user)
+            criteria = (lambda table: [table.patientId.in_(patient_ids)]) if patient_ids is not None else None
+            readings = registry.readingManager.database.query_range(
+                ['patientId', 'dateTimeTaken', 'readingId', 'trafficLightStatus'], criteria=criteria
+            ).subquery()
+
+            latest = db.session.query(readings.c.patientId, func.max(readings.c.dateTimeTaken).label('dateTimeTaken')) \
+                .group_by(readings.c.patientId) \
+                .subquery()
+            latest_ids = db.session.query(func.max(readings.c.readingId).label('readingId')) \
+                .join(latest, and_(readings.c.patientId == latest.c.patientId,
+                                   readings.c.dateTimeTaken == latest.c.dateTimeTaken)) \
+                .group_by(readings.c.patientId) \
+                .subquery()
+
+            rows = db.session.query(readings.c.trafficLightStatus, func.count()) \
+                .join(latest_ids, readings.c.readingId == latest_ids.c.readingId) \
+                .group_by(readings.c.trafficLightStatus) \
+                .all()
+
+            counts = {status: 0 for status in ['GREEN', 'YELLOW_UP', 'YELLOW_DOWN', 'RED_UP', 'RED_DOWN', 'NONE']}
+            for status, count in rows:
+                counts[status.name if status else 'NONE'] += count
+            return counts
+
+        return self.cached(('patients_by_traffic_light', scope.key), compute)
@@ -1,28 +1,56 @@
 from Database.UserRepo import UserRepo
 from Manager.Manager import Manager
 
-from Manager.RoleManager import RoleManager
-roleManager = RoleManager()
+from config import db
+from models import User, Role, RoleEnum, UserListSchema, userRole, supervises
 
 class UserManager(Manager):
     def __init__(self):
         Manager.__init__(self, UserRepo)
 
-    def read_all_no_password(self):
-        users_query = self.read_all()
-        for user in users_query:
-            user.pop('password', None)
-        
-        return users_query
+    """
+        Description: returns every user as a UserListSchema, in two queries
+        whatever the number of users: one for the columns of the users, one
+        for the ids of their roles and of the VHTs they supervise
+    """
+    def read_all_list(self):
+        users = {}
+        for row in db.session.query(User.id, User.firstName, User.username, User.email,
+                                    User.healthFacilityName).order_by(User.id):
+            users[row.id] = dict(row._asdict(), roleIds=[], vhtList=[])
+
+        links = db.union_all(
+            db.select([db.literal('roleIds').label('field'), userRole.c.userId, userRole.c.roleId]),
+            db.select([db.literal('vhtList'), supervises.c.choId, supervises.c.vhtId])
+        )
+        for field, user_id, value in db.session.execute(links):
+            if user_id in users and value is not None:
+                users[user_id][field].append(value)
+        for user in users.values():
+            user['roleIds'].sort()
+            user['vhtList'].sort()
+        return UserListSchema(many=True).dump(list(users.values()))
 
     # returns a list of VHT objects (id + email)
     def read_all_vhts(self):
-        vht_list = []
-        users_query = self.read_all()
-        for user in users_query:
-            if user['roleIds']:
-                role_names = roleManager.get_role_names(user['roleIds'])
-                if 'VHT' in role_names:
-                    vht_list.append({'id': user['id'], 'email': user['email']})
-        
-        return vht_list
+        rows = db.session.query(User.id, User.email) \
+            .join(userRole, userRole.c.userId == User.id) \
+            .join(Role, Role.id == userRole.c.roleId) \
+            .filter(Role.name == RoleEnum.VHT) \
+            .distinct() \
+            .order_by(User.id)
+        return [{'id': user_id, 'email': email} for user_id, email in rows]
+
+    """
+        Description: returns the jwt identity of a User model, without its email
+    """
+    def get_identity(self, user):
+        roles = [role.name.name for role in user.roleIds]
+        return {
+            'roles': roles,
+            'firstName': user.firstName,
+            'healthFacilityName': user.healthFacilityName,
+            'isLoggedIn': True,
+            'userId': user.id,
+            'vhtList': [vht.id for vht in user.vhtList] if 'CHO' in roles else [],
+        }
@@ -1,11 +1,5 @@
-from Manager.Manager import Manager
+from Manager import registry
 
-from Database.ReferralRepo import ReferralRepo
-from Database.ReadingRepoNew import ReadingRepo
-from Database.PatientRepoNew import PatientRepo
-from Database.HealthFacilityRepoNew import HealthFacilityRepo
-
-referralManager = Manager(ReferralRepo)
-patientManager = Manager(PatientRepo)
-readingManager = Manager(ReadingRepo)
-healthFacilityManager = Manager(HealthFacilityRepo)
\ No newline at end of file
+# managers are built lazily, see Manager/registry.py
+def __getattr__(name):
+    return getattr(registry, name)
\ No newline at end of file
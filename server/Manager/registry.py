@@ -0,0 +1,50 @@
+"""
+Description:
+    Lazy registry of the managers. Each manager is built once, the first
+    time it is used, and is then shared by every module
+Usage:
+    from Manager import registry
+    registry.patientManager.read("patientId", patient_id)
+
+    Look managers up where they are used rather than at import time, so
+    that importing a module does not build the managers it depends on
+"""
+
+import importlib
+import threading
+
+# name -> (module, class) of each manager
+_factories = {
+    'patientManager': ('Manager.PatientManagerNew', 'PatientManager'),
+    'readingManager': ('Manager.ReadingManagerNew', 'ReadingManager'),
+    'referralManager': ('Manager.ReferralManager', 'ReferralManager'),
+    'healthFacilityManager': ('Manager.HealthFacilityManager', 'HealthFacilityManager'),
+    'followUpManager': ('Manager.FollowUpManager', 'FollowUpManager'),
+    'userManager': ('Manager.UserManager', 'UserManager'),
+    'roleManager': ('Manager.RoleManager', 'RoleManager'),
+    'statsManager': ('Manager.StatsManager', 'StatsManager'),
+    'patientStatsManager': ('Manager.PatientStatsManager', 'PatientStatsManager'),
+    'recheckManager': ('Manager.RecheckManager', 'RecheckManager'),
+    'geoStatsManager': ('Manager.GeoStatsManager', 'GeoStatsManager'),
+    'exportManager': ('Manager.ExportManager', 'ExportManager'),
+    'importManager': ('Manager.ImportManager', 'ImportManager'),
+}
+
+_instances = {}
+_lock = threading.RLock()
+
+def get(name):
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            if name not in _instances:
+                module_name, class_name = _factories[name]
+                module = importlib.import_module(module_name)
+                _instances[name] = getattr(module, class_name)()
+            instance = _instances[name]
+    return instance
+
+def __getattr__(name):
+    if name in _factories:
+        return get(name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,6 +1,6 @@
 # This module provides functions to validate the request data for a Patient.
 
-from Manager import patientManager
+from Manager import registry
 
 
  # make sure body has required fields
@@ -95,7 +95,7 @@ def update_info_invalid(patient_id, request_body):
     if request_body is None:
         return {'HTTP 400': 'The request body cannot be empty.'}, 400
 
-    if patientManager.read("patientId", patient_id) is None:
+    if registry.patientManager.read("patientId", patient_id) is None:
         return {'HTTP 404': 'The given Patient ID was invalid.'}, 404
 
     has_required_field = \
@@ -1,10 +1,26 @@
 
 # This module provides functions to validate the request data for a Referral.
 
+from config import db
 from models import User, Patient, HealthFacility, Reading, FollowUp
+from Manager.HealthFacilityRegistry import healthFacilityRegistry
 import json
 
+# max number of values sent in a single IN (...) clause
+IN_CLAUSE_CHUNK_SIZE = 1000
+
 class ReferralValidator(object):
+    # foreign key fields of a referral, mapped to the table and column they reference
+    fk_fields = {
+        "userId": (User, "id"),
+        "patientId": (Patient, "patientId"),
+        "referralHealthFacilityName": (HealthFacility, "healthFacilityName"),
+        "readingId": (Reading, "readingId"),
+        "followUpId": (FollowUp, "id"),
+    }
+
+    string_fields = {'dateReferred', 'comment', 'actionTaken', 'id'}
+
     def validate(self, new_ref):
         """
             description:
@@ -15,28 +31,44 @@ class ReferralValidator(object):
                 referralHealthFacilityId belongs to a valid HealthFacility, required
                 readingId belongs to a valid Reading, required
                 followUpId belongs to a valid FollowUp
-        """ 
-        print("validating referral")
+        """
+        self.validate_many([new_ref])
 
-        string_fields = {'dateReferred', 'comment', 'actionTaken'}
+    def validate_many(self, new_refs, pending=None):
+        """
+            description:
+                validates a list of referral dicts using the same rules as validate(),
+                checking all foreign keys with one query per referenced table
+            params:
+                pending: {foreign key field: set of values} of rows the caller
+                inserts in the same transaction, accepted as existing
+            raises:
+                Exception listing every invalid field and missing reference at once
+        """
+        errors = []
+        references = {}
 
-        for key in new_ref:
-            if key == "userId":
-                self.exists(User, "id", new_ref[key])
-            elif key == "patientId":
-                self.exists(Patient, "patientId", new_ref[key])
-            elif key == "referralHealthFacilityName":
-                self.exists(HealthFacility, "healthFacilityName", new_ref[key])
-            elif key == "readingId":
-                self.exists(Reading, "readingId", new_ref[key])
-            elif key == "followUpId":
-                self.exists(FollowUp, "id", new_ref[key])
-            elif key in string_fields:
-                self.isString(key, new_ref)
-            elif key == "id":
-                self.isString(key, new_ref)
-            else:
-                raise Exception(f'{key} is not a valid referral field')
+        for new_ref in new_refs:
+            for key in new_ref:
+                if key in self.fk_fields:
+                    references.setdefault(key, set()).add(new_ref[key])
+                elif key in self.string_fields:
+                    try:
+                        self.isString(key, new_ref)
+                    except Exception as e:
+                        errors.append(str(e))
+                else:
+                    errors.append(f'{key} is not a valid referral field')
+
+        pending = pending or {}
+        for key, values in references.items():
+            table, column = self.fk_fields[key]
+            values = values - pending.get(key, set())
+            for val in sorted(self.find_missing(table, column, values), key=str):
+                errors.append(f'{key}: {val} does not belong to an existing {table.__tablename__}')
+
+        if errors:
+            raise Exception('; '.join(errors))
 
     def isString(self, key, new_ref):
         if not isinstance(new_ref[key], str):
@@ -46,16 +78,33 @@ class ReferralValidator(object):
         if not isinstance(new_ref[key], int):
             raise Exception(f'{key}: {new_ref[key]} must be an int')
 
+    def find_missing(self, table, key, values):
+        """
+            description:
+                returns the subset of values that have no matching row in table,
+                using one SELECT key ... WHERE key IN (...) per chunk of values
+        """
+        if table is HealthFacility:
+            # served from memory, see Manager/HealthFacilityRegistry.py
+            return healthFacilityRegistry.missing(values)
+
+        column = getattr(table, key)
+        values = list(values)
+        found = set()
+        for i in range(0, len(values), IN_CLAUSE_CHUNK_SIZE):
+            chunk = [val for val in values[i:i + IN_CLAUSE_CHUNK_SIZE] if val is not None]
+            if not chunk:
+                continue
+            rows = db.session.query(column).filter(column.in_(chunk)).all()
+            found.update(str(row[0]).lower() for row in rows)
+        # compare as strings, since ids may arrive as "3" for an int column, and
+        # ignoring case, as MySQL's collation matches "p1" to an existing "P1"
+        return {val for val in values if val is None or str(val).lower() not in found}
 
     def exists(self, table, key, val):
-        filter = {
-            key: val
-        }
-        res = table.query.filter_by(**filter).one_or_none()
-        # res = table.query.filter_by(key=val).one_or_none()
-        if not res:
+        if self.find_missing(table, key, {val}):
             raise Exception(f'{key}: {val} does not belong to an existing {table.__tablename__}')
-    
+
     def enforce_required(self, new_ref):
         required = {
             "dateReferred",
@@ -67,8 +116,8 @@ class ReferralValidator(object):
         for key in new_ref:
             if key in required:
                 required.remove(key)
-            
+
         if len(required) > 0:
             raise Exception(f'Required keys: {required}, missing')
-            
+
 
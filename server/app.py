@@ -7,6 +7,8 @@
       * Serve React App
       * Initilize server routes
       * Start Flask server
+    - `python app.py` starts the Flask development server, production
+      is served by uWSGI through wsgi.py (see cradleplatform.ini)
 """
 import sys
 import os
@@ -15,28 +17,58 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 import config
 import routes
 
-app = config.app
-routes.init(config.api)
+_initialized = False
 
-# For Heroku configuration
-port = os.environ.get('PORT')
-host = None
-if port is None:
-    print('PORT environment variable not found. Using Flask default.')
-else:
-    print('PORT environment variable found:', port)
-    print('Binding to host 0.0.0.0')
-    host = '0.0.0.0'
+def create_app():
+    """
+        Returns the Flask app with all routes registered. Safe to call more
+        than once, the routes are only registered the first time.
+    """
+    global _initialized
+    if not _initialized:
+        routes.init(config.api)
+        from capture import trafficCapture
+        trafficCapture.init_app(config.app)
+        # before uWSGI forks the workers, so they share the loaded files
+        from staticfiles import staticIndex
+        staticIndex.load(config.app.static_folder)
+        import models # needs to be after db instance
+        config.app.config['BASE_URL'] = os.environ.get('BASE_URL', 'http://localhost:5000/')
+        _initialized = True
+    return config.app
 
-import models # needs to be after db instance
+def warmup():
+    """
+        Opens the database connections of this process and loads the caches,
+        so that the first requests do not pay for them, and starts the
+        flusher of the reading queue if it is enabled
+    """
+    from Manager.HealthFacilityRegistry import healthFacilityRegistry
+    from Manager.ReadingQueue import readingQueue
+    app = create_app()
+    try:
+        with app.app_context():
+            connections = [config.db.engine.connect() for _ in range(app.config['DB_POOL_SIZE'])]
+            for connection in connections:
+                connection.execute('SELECT 1')
+                connection.close()
+            healthFacilityRegistry.refresh()
+    except Exception as e:
+        print('Warmup failed: ' + str(e))
+    readingQueue.start()
 
-if '-prod' in sys.argv:
-    port = 8040
-    host = "::"
-    app.config['BASE_URL'] = "https://cmpt373.csil.sfu.ca:8048/"
-else:
-    app.config['BASE_URL'] = "http://localhost:5000/"
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, host=host, port=port)
+    # For Heroku configuration
+    port = os.environ.get('PORT')
+    host = None
+    if port is None:
+        print('PORT environment variable not found. Using Flask default.')
+    else:
+        print('PORT environment variable found:', port)
+        print('Binding to host 0.0.0.0')
+        host = '0.0.0.0'
 
+    warmup()
+    app.run(debug=True, host=host, port=port)
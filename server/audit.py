@@ -0,0 +1,425 @@
+"""
+    @File: audit.py
+    @Description:
+    - Requests every route registered by routes.init, with every method, as
+      a user of each role, with the database grown to increasing numbers of
+      patients, and records the SQL statements and the wall time of each
+      request. Used by `python manage.py audit_queries`
+    - Writes are sent with bodies from WRITE_REQUESTS, which create, update
+      and delete audit rows only. Routes in SKIPPED_ROUTES, and routes
+      without a request, are reported as skipped
+    - A route fails the audit when:
+      * it answers with a server error
+      * it sends more statements at a larger size than at a smaller one,
+        beyond the few more a route loading rows with selectin needs: the
+        sign of a query per row (N+1)
+      * its time at the largest size is over its budget in AUDIT_BUDGETS_PATH,
+        or over the '*' budget there if it has none
+    - Reads every table with each of its loading profiles (see
+      Database.load_options) and fails a profile that sends more statements
+      than its plan allows: one for the rows, plus one per SELECTIN_BATCH
+      rows for each relationship loaded with selectin
+    - The patients added to reach a size have ids starting with
+      AUDIT_PATIENT_PREFIX and are deleted, with their readings and
+      referrals and the other rows the audit wrote, when the audit ends. Run
+      it against a seeded copy of the database, never production
+"""
+import json
+import math
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import event, func
+from config import app, db, flask_bcrypt
+from models import Patient, Reading, Referral, RecheckDue, FollowUp, User, HealthFacility, Role, RoleEnum
+from Manager import registry
+from Database.IdentityCache import identityCache
+from Manager.HealthFacilityRegistry import healthFacilityRegistry
+from trafficlight import triage_priority
+
+AUDIT_PATIENT_PREFIX = 'AUDIT'
+
+# readings added per patient, the last one is referred
+AUDIT_READINGS_PER_PATIENT = 3
+
+AUDIT_BUDGETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'query_budgets.json')
+
+# budgets written by --write-budgets are the measured time times this
+BUDGET_HEADROOM = 2
+
+# managers whose repos declare loading_profiles
+PROFILED_MANAGERS = ['patientManager', 'readingManager', 'referralManager', 'followUpManager',
+                     'userManager', 'healthFacilityManager']
+
+# parent rows selectinload puts in each SELECT ... IN (...)
+SELECTIN_BATCH = 500
+
+# a route sending a query per row sends at least one more statement per
+# patient added, one loading rows with selectin one more per SELECTIN_BATCH
+# rows, so a route may add statements for this share of the patients added
+N_PLUS_ONE_SHARE = 0.1
+
+# users the audit creates, to log in as and to edit and delete
+AUDIT_EMAIL_DOMAIN = '@audit.invalid'
+AUDIT_PASSWORD = 'audit-password'
+
+# query string of the routes that require one
+ROUTE_QUERIES = {
+    '/api/patient/search': {'q': 'a'},
+    '/api/readings/heatmap': {'bbox': '-180,-90,180,90', 'zoom': '3'},
+}
+
+
+class QueryCounter():
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+"""
+    Description:
+        adds audit patients until there are at least size patients, each
+        with AUDIT_READINGS_PER_PATIENT readings and a referral
+    Return: [int] number of patients
+"""
+def grow_to(size):
+    count = Patient.query.count()
+    if count >= size:
+        return count
+
+    start = Patient.query.filter(Patient.patientId.like(AUDIT_PATIENT_PREFIX + '%')).count()
+    user_ids = [row[0] for row in db.session.query(User.id)] or [None]
+    facilities = [row[0] for row in db.session.query(HealthFacility.healthFacilityName)] or [None]
+    taken = datetime.utcnow() - timedelta(days=30)
+
+    patients, readings, referrals = [], [], []
+    for i in range(start, start + size - count):
+        patient_id = f'{AUDIT_PATIENT_PREFIX}{i:07d}'
+        patients.append({'patientId': patient_id, 'patientName': f'audit {i}', 'patientAge': 30,
+                         'patientSex': 'FEMALE', 'isPregnant': True, 'villageNumber': str(1001 + i % 9)})
+        for j in range(AUDIT_READINGS_PER_PATIENT):
+            readings.append({'readingId': str(uuid.uuid4()), 'patientId': patient_id,
+                             'userId': user_ids[i % len(user_ids)],
+                             'dateTimeTaken': (taken + timedelta(days=j)).strftime('%Y-%m-%dT%H:%M:%S'),
+                             'bpSystolic': 110 + 20 * j, 'bpDiastolic': 70 + 10 * j, 'heartRateBPM': 70})
+        referred = taken + timedelta(days=AUDIT_READINGS_PER_PATIENT)
+        referrals.append({'patientId': patient_id, 'readingId': readings[-1]['readingId'],
+                          'userId': readings[-1]['userId'],
+                          'dateReferred': referred.strftime('%Y-%m-%dT%H:%M:%S'), 'referredAt': referred,
+                          'referralHealthFacilityName': facilities[i % len(facilities)]})
+
+    registry.patientManager.create_many(patients)
+    registry.readingManager.create_many(readings)
+    statuses = {reading['readingId']: reading['trafficLightStatus'] for reading in readings}
+    for referral in referrals:
+        referral['triagePriority'] = triage_priority(statuses[referral['readingId']])
+    registry.referralManager.create_many(referrals)
+    return Patient.query.count()
+
+# deletes the patients added by grow_to and everything that points to
+# them, and the other rows the audit's writes created
+def clean_up():
+    audit_patients = Patient.patientId.like(AUDIT_PATIENT_PREFIX + '%')
+    for table in (Referral, RecheckDue, Reading):
+        table.query.filter(table.patientId.like(AUDIT_PATIENT_PREFIX + '%')).delete(synchronize_session=False)
+    Patient.query.filter(audit_patients).delete(synchronize_session=False)
+    FollowUp.query.filter(FollowUp.diagnosis == AUDIT_PATIENT_PREFIX).delete(synchronize_session=False)
+    HealthFacility.query.filter(HealthFacility.healthFacilityName.like(AUDIT_PATIENT_PREFIX + '-%')) \
+        .delete(synchronize_session=False)
+    # deleted one by one, so that their roles and VHT lists are deleted too
+    for user in User.query.filter(User.email.like('%' + AUDIT_EMAIL_DOMAIN)):
+        db.session.delete(user)
+    db.session.commit()
+    for table in (Referral, RecheckDue, Reading, Patient, FollowUp, HealthFacility, User):
+        identityCache.invalidate(table)
+    healthFacilityRegistry.invalidate()
+
+def first_value(column):
+    row = db.session.query(column).order_by(column).first()
+    return row[0] if row else None
+
+def audit_id():
+    return f'{AUDIT_PATIENT_PREFIX}-{uuid.uuid4().hex[:12]}'
+
+def first_audit_value(column, patient_column):
+    row = db.session.query(column).filter(patient_column.like(AUDIT_PATIENT_PREFIX + '%')).order_by(column).first()
+    return row[0] if row else None
+
+def new_patient():
+    return {'patientId': audit_id(), 'patientName': 'audit', 'patientAge': 30, 'patientSex': 'FEMALE',
+            'isPregnant': True, 'villageNumber': '1001'}
+
+def new_reading(patient_id):
+    return {'readingId': str(uuid.uuid4()), 'patientId': patient_id, 'userId': first_value(User.id),
+            'dateTimeTaken': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'),
+            'bpSystolic': 120, 'bpDiastolic': 80, 'heartRateBPM': 70}
+
+def new_referral():
+    patient = new_patient()
+    return {'patient': patient, 'reading': new_reading(patient['patientId']),
+            'date': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'), 'comment': 'audit',
+            'healthFacilityName': first_value(HealthFacility.healthFacilityName)}
+
+def new_facility():
+    return registry.healthFacilityManager.create({'healthFacilityName': audit_id()})['healthFacilityName']
+
+def new_follow_up():
+    return registry.followUpManager.create({'diagnosis': AUDIT_PATIENT_PREFIX, 'followUpAction': 'audit',
+                                            'treatment': 'audit'}, {'userId': first_value(User.id)})['id']
+
+def new_user():
+    user = User(email=audit_id().lower() + AUDIT_EMAIL_DOMAIN, firstName='audit',
+                password=flask_bcrypt.generate_password_hash(AUDIT_PASSWORD))
+    Role.query.filter_by(name=RoleEnum.VHT).first().users.append(user)
+    db.session.commit()
+    identityCache.invalidate(Role)
+    return user
+
+# (method, rule) -> function returning the arguments of a request to it,
+# called before every request so that each one writes rows of its own
+WRITE_REQUESTS = {
+    ('POST', '/api/patient'): lambda: {'json': new_patient()},
+    ('PUT', '/api/patient/<string:patient_id>'): lambda: {
+        'path': f'/api/patient/{first_audit_value(Patient.patientId, Patient.patientId)}',
+        'json': {'villageNumber': '1001'}},
+    ('POST', '/api/patient/reading'): lambda: (lambda patient: {
+        'json': {'patient': patient, 'reading': new_reading(patient['patientId'])}})(new_patient()),
+    ('POST', '/api/referral'): lambda: {'json': new_referral()},
+    ('PUT', '/api/referral/<int:id>'): lambda: {
+        'path': f'/api/referral/{first_audit_value(Referral.id, Referral.patientId)}',
+        'json': {'comment': 'audit'}},
+    ('POST', '/api/health_facility'): lambda: {'json': {'healthFacilityName': audit_id()}},
+    ('PUT', '/api/health_facility/<string:name>'): lambda: (lambda name: {
+        'path': f'/api/health_facility/{name}', 'json': {'healthFacilityName': name}})(new_facility()),
+    ('DELETE', '/api/health_facility/<string:name>'): lambda: {'path': f'/api/health_facility/{new_facility()}'},
+    ('POST', '/api/follow_up'): lambda: {'json': {
+        'diagnosis': AUDIT_PATIENT_PREFIX, 'followUpAction': 'audit', 'treatment': 'audit',
+        'referral': first_audit_value(Referral.id, Referral.patientId)}},
+    ('PUT', '/api/follow_up/<int:id>'): lambda: {
+        'path': f'/api/follow_up/{new_follow_up()}', 'json': {'diagnosis': AUDIT_PATIENT_PREFIX}},
+    ('DELETE', '/api/follow_up/<int:id>'): lambda: {'path': f'/api/follow_up/{new_follow_up()}'},
+    ('POST', '/api/user/register'): lambda: {'json': {
+        'email': audit_id().lower() + AUDIT_EMAIL_DOMAIN, 'password': AUDIT_PASSWORD,
+        'firstName': 'audit', 'role': 'VHT'}},
+    ('POST', '/api/user/auth'): lambda: {'json': {'email': new_user().email, 'password': AUDIT_PASSWORD}},
+    ('PUT', '/api/user/edit/<int:id>'): lambda: {'path': f'/api/user/edit/{new_user().id}',
+                                                 'json': {'firstName': 'audit'}},
+    ('DELETE', '/api/user/delete/<int:id>'): lambda: {'path': f'/api/user/delete/{new_user().id}'},
+}
+
+# (method, rule) -> why it is not requested
+SKIPPED_ROUTES = {
+    ('DELETE', '/api/patient'): 'deletes every patient',
+    ('DELETE', '/api/health_facility'): 'deletes every health facility',
+    ('DELETE', '/api/follow_up'): 'deletes every follow up',
+    ('POST', '/api/sms'): 'sends the referral to POST /api/referral over HTTP, audited there',
+}
+
+"""
+    Description:
+        returns the url of a route with its parameters filled in with rows
+        of the database, or None if there is no row to request
+"""
+def route_url(rule):
+    values = {
+        'patient_id': lambda: first_value(Patient.patientId),
+        'name': lambda: first_value(HealthFacility.healthFacilityName),
+        'entity': lambda: 'readings',
+        'num': lambda: 1,
+    }
+    if 'follow_up' in rule.rule:
+        values['id'] = lambda: first_value(FollowUp.id)
+    elif rule.rule.startswith('/api/referral'):
+        values['id'] = lambda: first_value(Referral.id)
+    else:
+        values['id'] = lambda: first_value(User.id)
+
+    args = {}
+    for name in rule.arguments:
+        value = values[name]() if name in values else None
+        if value is None:
+            return None
+        args[name] = value
+    return rule.build(args, append_unknown=False)[1]
+
+def get_routes():
+    return sorted((rule for rule in app.url_map.iter_rules() if rule.rule.startswith('/api/')),
+                  key=lambda rule: rule.rule)
+
+"""
+    Description:
+        returns the requests of a route, one per method
+    Return: [list] of (method, function returning the arguments of a
+        request, None if the method is skipped, why it is skipped)
+"""
+def route_requests(rule):
+    requests = []
+    for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+        key = (method, rule.rule)
+        if key in SKIPPED_ROUTES:
+            requests.append((method, None, SKIPPED_ROUTES[key]))
+        elif key in WRITE_REQUESTS:
+            requests.append((method, WRITE_REQUESTS[key], None))
+        elif method != 'GET':
+            requests.append((method, None, 'no request in WRITE_REQUESTS'))
+        else:
+            url = route_url(rule)
+            if url is None:
+                requests.append((method, None, 'no row to request'))
+            else:
+                query = ROUTE_QUERIES.get(rule.rule)
+                requests.append((method, lambda url=url, query=query: {'path': url, 'query_string': query}, None))
+    return requests
+
+"""
+    Description:
+        sends a request once to warm up caches, then repeat times, each time
+        with the arguments make_request returns
+    Return: (status, most statements sent by a request, median ms)
+"""
+def measure(client, counter, rule, method, make_request, headers, repeat):
+    def send():
+        kwargs = dict({'path': rule.rule}, **make_request())
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.open(method=method, headers=headers, **kwargs)
+        response.get_data()
+        return response, counter.count, (time.perf_counter() - started) * 1000
+
+    send()
+    counts, times = [], []
+    for _ in range(repeat):
+        response, count, ms = send()
+        counts.append(count)
+        times.append(ms)
+    times.sort()
+    return response.status_code, max(counts), round(times[len(times) // 2], 1)
+
+"""
+    Description:
+        returns the most statements read_all(profile) may send, counting
+        every row of the parent table of each relationship loaded with
+        selectin
+"""
+def profile_statement_bound(database, profile):
+    bound = 1
+    for path, strategy in database.loading_profiles[profile].items():
+        table = database.table
+        for name in path.split('.'):
+            if strategy == 'selectin':
+                rows = db.session.query(func.count()).select_from(table).scalar()
+                bound += max(1, math.ceil(rows / SELECTIN_BATCH))
+            table = getattr(table, name).property.mapper.class_
+    return bound
+
+"""
+    Description:
+        counts the statements of read_all with each loading profile
+    Return: {'<table> <profile>': (statements, bound)}
+"""
+def measure_profiles(counter):
+    measured = {}
+    for name in PROFILED_MANAGERS:
+        database = registry.get(name).database
+        for profile in database.loading_profiles:
+            bound = profile_statement_bound(database, profile)
+            # start from an empty identity map, so no row is already loaded
+            db.session.remove()
+            counter.count = 0
+            database.read_all(profile)
+            measured[f'{database.table.__tablename__} {profile}'] = (counter.count, bound)
+    db.session.remove()
+    return measured
+
+def load_budgets():
+    if not os.path.exists(AUDIT_BUDGETS_PATH):
+        return {}
+    with open(AUDIT_BUDGETS_PATH) as budgets_file:
+        return json.load(budgets_file)
+
+def write_budgets(results):
+    budgets = {key: round(result['ms'][-1] * BUDGET_HEADROOM, 1) for key, result in results.items()}
+    # keep the budget of the routes that have none of their own
+    default = load_budgets().get('*')
+    if default is not None:
+        budgets['*'] = default
+    with open(AUDIT_BUDGETS_PATH, 'w') as budgets_file:
+        json.dump(budgets, budgets_file, indent=2, sort_keys=True)
+
+"""
+    Description:
+        runs the audit, see the module docstring
+    Params:
+        sizes: increasing numbers of patients
+        tokens: role -> access token
+        slack: statements a route may add between two sizes, on top of
+            those N_PLUS_ONE_SHARE allows
+    Return:
+        {'sizes': [patients at each size], 'results': {'<role> <method>
+        <route>': {status, queries: [per size], ms: [per size], budget,
+        failures}}, 'skipped': {'<method> <route>': why},
+        'profiles': {'<table> <profile>': {queries: [per size],
+        bounds: [per size], failures}}}
+"""
+def run_audit(sizes, tokens, repeat=3, slack=0, budgets=None, progress=None):
+    # measure the queries themselves, not the caches in front of them
+    app.config['STATS_CACHE_TTL'] = 0
+    app.config['IDENTITY_CACHE_SIZE'] = 0
+    budgets = budgets or {}
+    client = app.test_client()
+    counter = QueryCounter()
+    results = {}
+    skipped = {}
+    profiles = {}
+    patients = []
+
+    event.listen(db.engine, 'before_cursor_execute', counter)
+    try:
+        for size in sizes:
+            patients.append(grow_to(size))
+            if progress:
+                progress(f'Auditing with {patients[-1]} patients')
+            for rule in get_routes():
+                for method, make_request, reason in route_requests(rule):
+                    if make_request is None:
+                        skipped[f'{method} {rule.rule}'] = reason
+                        continue
+                    for role, token in sorted(tokens.items()):
+                        status, count, ms = measure(client, counter, rule, method, make_request,
+                                                    {'Authorization': f'Bearer {token}'}, repeat)
+                        result = results.setdefault(f'{role} {method} {rule.rule}',
+                                                    {'status': [], 'queries': [], 'ms': []})
+                        result['status'].append(status)
+                        result['queries'].append(count)
+                        result['ms'].append(ms)
+            for key, (count, bound) in measure_profiles(counter).items():
+                result = profiles.setdefault(key, {'queries': [], 'bounds': []})
+                result['queries'].append(count)
+                result['bounds'].append(bound)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', counter)
+        db.session.rollback()
+        clean_up()
+
+    for key, result in results.items():
+        failures = []
+        if any(status >= 500 for status in result['status']):
+            failures.append('server error')
+        queries = result['queries']
+        for i in range(1, len(queries)):
+            allowed = slack + math.floor((patients[i] - patients[i - 1]) * N_PLUS_ONE_SHARE)
+            if queries[i] > queries[i - 1] + allowed:
+                failures.append(f'queries grow with patients: {" -> ".join(map(str, queries))}')
+                break
+        result['budget'] = budgets.get(key, budgets.get('*'))
+        if result['budget'] is not None and result['ms'][-1] > result['budget']:
+            failures.append(f"{result['ms'][-1]}ms over budget of {result['budget']}ms")
+        result['failures'] = failures
+
+    for result in profiles.values():
+        result['failures'] = [f'{count} statements, more than the {bound} its plan allows'
+                              for count, bound in zip(result['queries'], result['bounds']) if count > bound]
+    return {'sizes': patients, 'results': results, 'skipped': skipped, 'profiles': profiles}
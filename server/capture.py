@@ -0,0 +1,173 @@
+"""
+    @File: capture.py
+    @Description:
+    - Records the API requests a worker serves to a JSONL file, one request
+      per line, so production traffic can be replayed against a local
+      instance with `python manage.py replay` (see replay.py)
+    - Enabled by setting TRAFFIC_CAPTURE_PATH, each worker process appends
+      to <TRAFFIC_CAPTURE_PATH>.<pid> so lines of concurrent workers do not
+      interleave
+    - Personal data is scrubbed before anything is written:
+      * free text fields are replaced by x's of the same length, so the
+        replayed bodies keep their size
+      * patient ids are replaced by a keyed hash with the same number of
+        digits, so requests about the same patient still match
+      * gps locations are rounded to about 10km
+      * the JWT itself is never written, only the roles of its user
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import threading
+import time
+from flask import g, request
+from flask_jwt_extended import verify_jwt_in_request_optional, get_jwt_identity
+
+# fields whose values are replaced by x's
+REDACTED_FIELDS = {
+    'patientName', 'firstName', 'username', 'email', 'password', 'q',
+    'medicalHistory', 'drugHistory', 'symptoms', 'comment', 'actionTaken',
+    'followUpAction', 'diagnosis', 'treatment', 'deviceInfo',
+}
+
+# fields and url parameters whose values are replaced by a pseudonym
+PSEUDONYMIZED_FIELDS = {'patientId', 'patient_id', 'patientId__in', 'patientId__prefix'}
+
+GPS_FIELDS = {'gpsLocationOfReading'}
+
+# decimals gps coordinates are rounded to
+GPS_DECIMALS = 1
+
+def redact(value):
+    return 'x' * len(value) if isinstance(value, str) else None
+
+"""
+    Description:
+        returns a stable pseudonym of value, digits are replaced by digits
+        and everything else by lowercase hex, keeping its length
+"""
+def pseudonymize(value, key):
+    if value is None:
+        return None
+    value = str(value)
+    digest = hmac.new(key, value.encode('utf-8'), hashlib.sha256).hexdigest()
+    while len(digest) < len(value):
+        digest += hashlib.sha256(digest.encode('utf-8')).hexdigest()
+    if value.isdigit():
+        return str(int(digest, 16))[-len(value):].rjust(len(value), '0')
+    return digest[:len(value)]
+
+def coarsen_gps(value):
+    from geo import parse_gps_location
+    location = parse_gps_location(value)
+    if location is None:
+        return redact(value)
+    return f'{round(location[0], GPS_DECIMALS)}, {round(location[1], GPS_DECIMALS)}'
+
+"""
+    Description:
+        returns a copy of a request body or query string with the personal
+        data scrubbed, see the module docstring
+"""
+def scrub(data, key):
+    if isinstance(data, list):
+        return [scrub(item, key) for item in data]
+    if not isinstance(data, dict):
+        return data
+
+    scrubbed = {}
+    for field, value in data.items():
+        if field == 'q' and isinstance(value, str) and value.isdigit():
+            # patient search by id prefix
+            scrubbed[field] = pseudonymize(value, key)
+        elif field in REDACTED_FIELDS:
+            scrubbed[field] = redact(value) if not isinstance(value, (dict, list)) else scrub(value, key)
+        elif field in PSEUDONYMIZED_FIELDS:
+            if isinstance(value, str) and ',' in value:
+                scrubbed[field] = ','.join(pseudonymize(v, key) for v in value.split(','))
+            else:
+                scrubbed[field] = pseudonymize(value, key)
+        elif field in GPS_FIELDS:
+            scrubbed[field] = coarsen_gps(value)
+        else:
+            scrubbed[field] = scrub(value, key)
+    return scrubbed
+
+
+class TrafficCapture():
+    def __init__(self):
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def enabled(self):
+        return bool(self.app.config.get('TRAFFIC_CAPTURE_PATH'))
+
+    def key(self):
+        return (self.app.config.get('TRAFFIC_CAPTURE_KEY') or self.app.config['JWT_SECRET_KEY']).encode('utf-8')
+
+    def before_request(self):
+        if self.enabled():
+            g.capture_started = time.perf_counter()
+
+    def after_request(self, response):
+        started = g.get('capture_started')
+        if started is None or request.url_rule is None or not request.path.startswith('/api/'):
+            return response
+        if random.random() >= self.app.config.get('TRAFFIC_CAPTURE_SAMPLE', 1.0):
+            return response
+        try:
+            self.write(self.record(response, time.perf_counter() - started))
+        except Exception as e:
+            # never fail the request because of the capture
+            logging.warning(f'Traffic capture failed: {e}')
+        return response
+
+    def record(self, response, elapsed):
+        key = self.key()
+        view_args = scrub(request.view_args or {}, key)
+        # rebuild the path from the route and the scrubbed url parameters
+        path = request.url_rule.rule
+        for name, value in view_args.items():
+            path = path.replace(f'<{name}>', str(value))
+            for converter in ('string', 'int', 'path'):
+                path = path.replace(f'<{converter}:{name}>', str(value))
+
+        try:
+            verify_jwt_in_request_optional()
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+
+        return {
+            'time': time.time(),
+            'method': request.method,
+            'endpoint': request.url_rule.rule,
+            'path': path,
+            'query': scrub(request.args.to_dict(), key),
+            'body': scrub(request.get_json(force=True, silent=True), key),
+            'roles': identity.get('roles', []) if isinstance(identity, dict) else [],
+            'status': response.status_code,
+            'durationMs': round(elapsed * 1000, 3),
+            'responseBytes': response.calculate_content_length(),
+        }
+
+    def write(self, record):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            # reopen after uWSGI forks the workers
+            if self._file is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._file = open(f"{self.app.config['TRAFFIC_CAPTURE_PATH']}.{self._pid}", 'a', buffering=1)
+            self._file.write(line)
+
+
+trafficCapture = TrafficCapture()
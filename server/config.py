@@ -11,6 +11,7 @@ from flask_jwt_extended import JWTManager
 from environs import Env
 import environs
 from flask_bcrypt import Bcrypt
+from staticfiles import staticIndex
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -32,11 +33,77 @@ class Config(object):
 
     # SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'test-cradle.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # connections per worker process, opened by warmup() in app.py
+    DB_POOL_SIZE = env.int("DB_POOL_SIZE", 5)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        # MySQL drops idle connections after wait_timeout
+        'pool_recycle': 280,
+        'pool_pre_ping': True,
+    }
     
     # JWT_SECRET_KEY= os.environ.get('SECRET')
     JWT_SECRET_KEY = 'very secret'
     JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=1) 
 
+    # seconds a worker trusts its in-memory list of health facility names
+    HEALTH_FACILITY_REGISTRY_TTL = env.int("HEALTH_FACILITY_REGISTRY_TTL", 30)
+
+    # file whose version the workers check before trusting their list of
+    # health facility names, replaced on every write to the table so all the
+    # workers of a host reload at once, and the minimum number of seconds
+    # between two reloads of a worker caused by an unknown name
+    HEALTH_FACILITY_REGISTRY_VERSION_PATH = env.str("HEALTH_FACILITY_REGISTRY_VERSION_PATH",
+                                                    os.path.join(basedir, 'health_facility.version'))
+    HEALTH_FACILITY_REGISTRY_MISS_INTERVAL = env.int("HEALTH_FACILITY_REGISTRY_MISS_INTERVAL", 1)
+
+    # traffic light thresholds, see trafficlight.py
+    TRAFFIC_LIGHT_RED_SYSTOLIC = env.int("TRAFFIC_LIGHT_RED_SYSTOLIC", 160)
+    TRAFFIC_LIGHT_RED_DIASTOLIC = env.int("TRAFFIC_LIGHT_RED_DIASTOLIC", 110)
+    TRAFFIC_LIGHT_YELLOW_SYSTOLIC = env.int("TRAFFIC_LIGHT_YELLOW_SYSTOLIC", 140)
+    TRAFFIC_LIGHT_YELLOW_DIASTOLIC = env.int("TRAFFIC_LIGHT_YELLOW_DIASTOLIC", 90)
+    TRAFFIC_LIGHT_SHOCK_HIGH = env.float("TRAFFIC_LIGHT_SHOCK_HIGH", 1.7)
+    TRAFFIC_LIGHT_SHOCK_MEDIUM = env.float("TRAFFIC_LIGHT_SHOCK_MEDIUM", 0.9)
+
+    # refuse searches on fields without an index instead of logging a warning
+    SEARCH_REQUIRE_INDEX = env.bool("SEARCH_REQUIRE_INDEX", False)
+
+    # seconds a worker reuses the stats it computed for a scope, and the
+    # number of scopes whose stats each worker keeps, least recently used
+    # scopes are dropped first
+    STATS_CACHE_TTL = env.int("STATS_CACHE_TTL", 60)
+    STATS_CACHE_SIZE = env.int("STATS_CACHE_SIZE", 1024)
+
+    # rows kept in each worker's LRU cache of Database.read by primary key,
+    # 0 disables it (rows are still cached for the length of a request),
+    # and seconds a cached row is trusted, see Database/IdentityCache.py
+    IDENTITY_CACHE_SIZE = env.int("IDENTITY_CACHE_SIZE", 0)
+    IDENTITY_CACHE_TTL = env.int("IDENTITY_CACHE_TTL", 5)
+
+    # readings older than this many days are moved to the archive table
+    # by `python manage.py archive`
+    READING_HOT_DAYS = env.int("READING_HOT_DAYS", 365)
+
+    # file `python manage.py sweep_rechecks` keeps the time of its last run
+    # in, the next run only refreshes the rechecks that came due since
+    RECHECK_SWEEP_STATE_PATH = env.str("RECHECK_SWEEP_STATE_PATH", os.path.join(basedir, 'recheck_sweep.state'))
+
+    # SQLite file that new readings are queued in before a background thread
+    # inserts them in batches, unset to insert them synchronously,
+    # see Manager/ReadingQueue.py
+    READING_QUEUE_PATH = env.str("READING_QUEUE_PATH", None)
+    READING_QUEUE_BATCH_SIZE = env.int("READING_QUEUE_BATCH_SIZE", 500)
+    READING_QUEUE_MAX_LATENCY = env.float("READING_QUEUE_MAX_LATENCY", 1.0)
+    READING_QUEUE_CLAIM_TIMEOUT = env.int("READING_QUEUE_CLAIM_TIMEOUT", 60)
+
+    # file prefix that API requests are recorded to for `python manage.py
+    # replay`, unset to disable, the fraction of requests recorded, and the
+    # key of the patient id pseudonyms (JWT_SECRET_KEY if unset), see capture.py
+    TRAFFIC_CAPTURE_PATH = env.str("TRAFFIC_CAPTURE_PATH", None)
+    TRAFFIC_CAPTURE_SAMPLE = env.float("TRAFFIC_CAPTURE_SAMPLE", 1.0)
+    TRAFFIC_CAPTURE_KEY = env.str("TRAFFIC_CAPTURE_KEY", None)
+
 class JSONEncoder(json.JSONEncoder):
 
     def default(self, o):
@@ -54,10 +121,13 @@ FLASK_DEBUG=1
 
 app = Flask(__name__, static_folder='../client/build')
 
-# Serve React App
+# Serve React App, from memory once create_app() has loaded it, see staticfiles.py
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
+    response = staticIndex.serve(path)
+    if response is not None:
+        return response
     if path != "" and os.path.exists(app.static_folder + '/' + path):
         return send_from_directory(app.static_folder, path)
     else:
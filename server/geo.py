@@ -0,0 +1,100 @@
+"""
+    @File: geo.py
+    @Description:
+    - Parses the gpsLocationOfReading strings sent by the mobile app into
+      latitude and longitude
+    - Encodes and decodes geohashes, used as the spatial cell of a reading.
+      Cells at a coarser precision are prefixes of the stored geohash, so
+      readings are bucketed by grouping on a prefix
+"""
+import re
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# precision of the geohash stored with each reading, about 38m x 19m
+GEOHASH_PRECISION = 8
+
+# two numbers separated by a comma and/or whitespace, ex: "49.2827, -123.1207"
+GPS_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*[,\s]\s*(-?\d+(?:\.\d+)?)\s*$')
+
+"""
+    Description:
+        returns (latitude, longitude) parsed from a gps location string,
+        or None if it is empty, malformed or out of range
+"""
+def parse_gps_location(value):
+    if not value:
+        return None
+    match = GPS_PATTERN.match(value)
+    if not match:
+        return None
+    latitude, longitude = float(match.group(1)), float(match.group(2))
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits = bits << 1
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+"""
+    Description:
+        returns the gpsLatitude, gpsLongitude and gpsCell columns of a
+        reading for its gps location string, all None if it is not valid
+"""
+def gps_columns(value):
+    location = parse_gps_location(value)
+    latitude, longitude = location or (None, None)
+    return {
+        'gpsLatitude': latitude,
+        'gpsLongitude': longitude,
+        'gpsCell': geohash_encode(latitude, longitude) if location else None,
+    }
+
+"""
+    Description:
+        returns (latitude, longitude) of the centre of a geohash cell
+"""
+def geohash_decode(geohash):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if (bits >> shift) & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+"""
+    Description:
+        returns the geohash precision used to bucket a map at a web map zoom
+        level (0 is the whole world), so that a screen holds tens of cells
+"""
+def zoom_to_precision(zoom):
+    return max(1, min(GEOHASH_PRECISION, (zoom + 2) // 3))
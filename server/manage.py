@@ -8,9 +8,12 @@ import datetime
 import numpy as np
 from random import randrange
 from datetime import timedelta, datetime
-from flask_script import Manager
+from flask_script import Manager, Command, Option
 from config import app, db, flask_bcrypt
 from models import *
+from trafficlight import classify_many, classify_mismatches, triage_priority
+from Database.ReadingRepoNew import ReadingRepo
+from Database.ReferralRepo import ReferralRepo
 
 manager = Manager(app)
 
@@ -100,7 +103,8 @@ def seed():
                 "heartRateBPM": getRandomHeartRateBPM(),
                 "symptoms": getRandomSymptoms(),
             }
-            db.session.add(reading_schema.load(r1))
+            reading = reading_schema.load(r1)
+            db.session.add(reading)
             db.session.commit()
 
             if i == numOfReadings-1 and random.choice([True, False]):
@@ -111,11 +115,306 @@ def seed():
                     "referralHealthFacilityName": healthFacilityName,
                     "comment": "She needs help!"
                 }
-                db.session.add(referral_schema.load(referral1))
+                referral = referral_schema.load(referral1)
+                # places the referral in its facility's queue, see ReferralManager.update_triage_priority
+                status = reading.trafficLightStatus
+                referral.triagePriority = triage_priority(status.name if status else None)
+                db.session.add(referral)
                 db.session.commit()
 
     print('Complete!')
 
+# USAGE: python manage.py explain
+# Runs EXPLAIN on the queries issued by the hot endpoints and exits with
+# status 1 if MySQL plans a full table scan for any of them
+@manager.command
+def explain():
+    hot_queries = {
+        'patient stats: readings of a patient':
+            Reading.query.filter_by(patientId='0').order_by(Reading.dateTimeTaken),
+        'VHT patients: readings taken by a user':
+            db.session.query(Reading.patientId).filter_by(userId=0),
+        'referrals of a patient':
+            Referral.query.filter_by(patientId='0'),
+        'referral of a reading':
+            Referral.query.filter_by(readingId='0'),
+        'referral of a follow up':
+            Referral.query.filter_by(followUpId=0),
+        'HCW patients: referrals to a health facility':
+            db.session.query(Referral.patientId).filter_by(referralHealthFacilityName='0'),
+        'open referrals of a health facility':
+            Referral.query.filter_by(referralHealthFacilityName='0', followUpId=None),
+        'follow ups by a healthcare worker':
+            FollowUp.query.filter_by(healthcareWorkerId=0),
+    }
+
+    full_scans = []
+    for name, query in hot_queries.items():
+        sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+        for row in db.session.execute('EXPLAIN ' + sql):
+            row = dict(row)
+            print(f"{name}: table={row['table']} type={row['type']} key={row['key']}")
+            if row['type'] == 'ALL':
+                full_scans.append(name)
+
+    if full_scans:
+        print('Full table scans: ' + ', '.join(full_scans))
+        sys.exit(1)
+    print('No full table scans')
+
+# USAGE: python manage.py reclassify [--chunk-size 10000]
+# Recomputes trafficLightStatus of every stored reading, hot and archived,
+# e.g. after the TRAFFIC_LIGHT_* thresholds change, walking each table in
+# primary key order
+@manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=10000)
+def reclassify(chunk_size):
+    reading_repo = ReadingRepo()
+    referral_repo = ReferralRepo()
+
+    def update_readings(ids, status):
+        count = reading_repo.bulk_update({'readingId': ids}, {'trafficLightStatus': status})
+        # keep the referral queue in the new severity order
+        referral_repo.bulk_update({'readingId': ids}, {'triagePriority': triage_priority(status)})
+        return count
+
+    def update_archive(ids, status):
+        # archived readings have no referral, see ReadingManager.archive
+        count = ReadingArchive.query.filter(ReadingArchive.readingId.in_(ids)) \
+            .update({'trafficLightStatus': status}, synchronize_session=False)
+        db.session.commit()
+        return count
+
+    for table, update in ((Reading, update_readings), (ReadingArchive, update_archive)):
+        last_id = None
+        total = 0
+        updated = 0
+        while True:
+            query = db.session.query(table.readingId, table.bpSystolic, table.bpDiastolic,
+                                     table.heartRateBPM, table.trafficLightStatus)
+            if last_id is not None:
+                query = query.filter(table.readingId > last_id)
+            rows = query.order_by(table.readingId).limit(chunk_size).all()
+            if not rows:
+                break
+
+            reading_ids, systolic, diastolic, heart_rate, current = zip(*rows)
+            statuses = classify_many(systolic, diastolic, heart_rate)
+
+            # one UPDATE ... WHERE readingId IN (...) per status that changed
+            changed = {}
+            for reading_id, old, new in zip(reading_ids, current, statuses):
+                if old is None or old.name != new:
+                    changed.setdefault(new, []).append(reading_id)
+            for status, ids in changed.items():
+                updated += update(ids, status)
+
+            total += len(rows)
+            last_id = reading_ids[-1]
+            print(f'Reclassified {total} {table.__tablename__} rows, {updated} changed')
+
+    print('Complete!')
+
+# USAGE: python manage.py check_traffic_lights
+# Checks that the vectorized classifier used for bulk work gives the same
+# status as the scalar one on every threshold edge, exits 1 if not
+@manager.command
+def check_traffic_lights():
+    mismatches = classify_mismatches()
+    for reading, vectorized, scalar in mismatches:
+        print(f'{reading}: classify_many={vectorized} classify={scalar}')
+    if mismatches:
+        sys.exit(1)
+    print('classify_many matches classify')
+
+# USAGE: python manage.py archive [--older-than 365] [--chunk-size 1000]
+# Moves readings taken more than older-than days ago (READING_HOT_DAYS by
+# default) from the reading table to the readingarchive table
+@manager.option('-o', '--older-than', dest='older_than', type=int, default=None)
+@manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=1000)
+def archive(older_than, chunk_size):
+    from Manager import registry
+    older_than = older_than if older_than is not None else app.config['READING_HOT_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=older_than)
+    print(f'Archiving readings taken before {cutoff.isoformat()}')
+    archived = registry.readingManager.archive(cutoff, chunk_size,
+                                               lambda count: print(f'Archived {count} readings'))
+    print(f'Complete! Archived {archived} readings')
+
+# USAGE: python manage.py sweep_rechecks [--chunk-size 1000] [--full]
+# Rebuilds the recheck worklist rows of the patients whose recheck came due
+# since the last run, from their latest reading. Run periodically (see
+# cradleplatform.ini) to repair the worklist after writes that bypass
+# ReadingManager. The first run, or --full, rebuilds it for every patient
+@manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=1000)
+@manager.option('--full', dest='full', action='store_true', default=False)
+def sweep_rechecks(chunk_size, full):
+    from Manager import registry
+    recheck_manager = registry.recheckManager
+    now = datetime.utcnow()
+    since = None if full else recheck_manager.read_last_sweep()
+    res = recheck_manager.sweep(since, now, chunk_size)
+    recheck_manager.write_last_sweep(now)
+    print(f"Swept {res['patients']} patients, {res['due']} due a recheck")
+
+# USAGE: python manage.py export readings [--from 2019-10-01] [--to 2019-12-31]
+#            [--format csv|ndjson] [--fields readingId,bpSystolic] [--gzip] [--output readings.csv]
+# Streams a readings, referrals or followups export to a file or stdout,
+# same as GET /api/export/<entity>
+@manager.option('entity')
+@manager.option('--from', dest='date_from', default=None)
+@manager.option('--to', dest='date_to', default=None)
+@manager.option('-f', '--format', dest='fmt', default='csv')
+@manager.option('--fields', dest='fields', default=None)
+@manager.option('-z', '--gzip', dest='gzip', action='store_true', default=False)
+@manager.option('-o', '--output', dest='output', default=None)
+@manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=1000)
+def export(entity, date_from, date_to, fmt, fields, gzip, output, chunk_size):
+    from Manager import registry
+    date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+    date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    fields = fields.split(',') if fields else None
+    chunks = registry.exportManager.stream(entity, fmt, fields, date_from, date_to, gzip, chunk_size)
+    out = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+
+# USAGE: python manage.py import patients patients.csv [--rejects patients.rejects.csv] [--chunk-size 1000]
+#        python manage.py import readings readings.csv
+# Bulk loads legacy patients or readings from a csv file whose header row
+# names the columns, see Manager/ImportManager.py. Import patients before
+# their readings. Bad rows are written to the rejects file
+class Import(Command):
+    option_list = (
+        Option('entity'),
+        Option('path'),
+        Option('-r', '--rejects', dest='rejects', default=None),
+        Option('-c', '--chunk-size', dest='chunk_size', type=int, default=1000),
+    )
+
+    def run(self, entity, path, rejects, chunk_size):
+        from Manager import registry
+        from Manager.ImportManager import ImportFileError
+        rejects = rejects or path + '.rejects.csv'
+
+        def progress(totals):
+            print(f"Read {totals['read']} rows, imported {totals['imported']}, rejected {totals['rejected']}")
+
+        with open(path, newline='', encoding='utf-8-sig') as infile, \
+                open(rejects, 'w', newline='', encoding='utf-8') as reject_file:
+            try:
+                totals = registry.importManager.import_csv(entity, infile, reject_file, chunk_size, progress)
+            except ImportFileError as e:
+                print(e)
+                sys.exit(1)
+
+        if totals['rejected']:
+            print(f'Rejected rows written to {rejects}')
+        print('Complete!')
+
+manager.add_command('import', Import())
+
+# returns role -> access token of a user of this database with that role
+def role_tokens(roles):
+    from flask_jwt_extended import create_access_token
+    from Manager import registry
+    tokens = {}
+    for role in roles:
+        user = User.query.join(User.roleIds).filter(Role.name == RoleEnum[role]).first()
+        if user is None:
+            print(f'No user with role {role}, its requests are sent without a token')
+            continue
+        identity = registry.userManager.get_identity(user)
+        identity['email'] = user.email
+        tokens[role] = create_access_token(identity=identity)
+    return tokens
+
+# USAGE: python manage.py replay capture.jsonl.* [--base-url http://localhost:5000] [--concurrency 8]
+#            [--rate 50 | --speed 1] [--endpoint /api/patient/allinfo] [--limit 10000] [--output report.json]
+# Replays requests recorded with TRAFFIC_CAPTURE_PATH against a running
+# instance, see replay.py. Requests are sent with a token of a user of this
+# database that has the role of the user who made them
+@manager.option('paths', nargs='+')
+@manager.option('-u', '--base-url', dest='base_url', default='http://localhost:5000')
+@manager.option('-c', '--concurrency', dest='concurrency', type=int, default=8)
+@manager.option('-r', '--rate', dest='rate', type=float, default=0)
+@manager.option('-s', '--speed', dest='speed', type=float, default=0)
+@manager.option('-e', '--endpoint', dest='endpoint', default=None)
+@manager.option('-l', '--limit', dest='limit', type=int, default=None)
+@manager.option('-o', '--output', dest='output', default=None)
+def replay(paths, base_url, concurrency, rate, speed, endpoint, limit, output):
+    import json
+    from replay import Replayer, load_records, summarize, format_report, role_of
+
+    records = load_records(paths, endpoint, limit)
+    if not records:
+        print('No requests to replay')
+        sys.exit(1)
+
+    tokens = role_tokens({role_of(record) for record in records} - {None})
+    print(f'Replaying {len(records)} requests against {base_url}')
+    replayer = Replayer(base_url, tokens, concurrency, rate, speed)
+    results, elapsed = replayer.run(records, lambda sent, done: print(f'Sent {sent} requests, {done} answered'))
+    report = summarize(results, elapsed)
+    print(format_report(report))
+    if output:
+        with open(output, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+# USAGE: python manage.py audit_queries [--sizes 100,1000] [--repeat 3] [--slack 0] [--write-budgets] [--output audit.json]
+# Requests every route, with every method, as a user of each role with 100
+# and then 1000 patients in the database and exits with status 1 if a route
+# sends more SQL statements with more patients than a route loading rows
+# with selectin would, or is slower than its budget in query_budgets.json,
+# or if a loading profile of a repo sends more statements than its plan
+# allows, see audit.py. Adds and then deletes audit patients and the rows
+# written by the audited writes, run it on a seeded copy of the database
+# (python manage.py seed)
+@manager.option('-s', '--sizes', dest='sizes', default='100,1000')
+@manager.option('-r', '--repeat', dest='repeat', type=int, default=3)
+@manager.option('--slack', dest='slack', type=int, default=0)
+@manager.option('-w', '--write-budgets', dest='write', action='store_true', default=False)
+@manager.option('-o', '--output', dest='output', default=None)
+def audit_queries(sizes, repeat, slack, write, output):
+    import json
+    from audit import run_audit, load_budgets, write_budgets, AUDIT_BUDGETS_PATH
+
+    sizes = sorted(int(size) for size in sizes.split(','))
+    tokens = role_tokens([role.value for role in RoleEnum])
+    report = run_audit(sizes, tokens, repeat, slack, load_budgets(), print)
+
+    patients = report['sizes']
+    if len(set(patients)) < len(patients):
+        print(f'The database already had {patients[-1]} patients, queries were not compared across sizes')
+    failed = 0
+    for key, result in sorted(report['results'].items()):
+        queries = ' -> '.join(map(str, result['queries']))
+        verdict = '; '.join(result['failures']) or 'ok'
+        print(f"{key}: status {result['status'][-1]}, queries {queries}, {result['ms'][-1]}ms"
+              f" (budget {result['budget']}ms): {verdict}")
+        failed += bool(result['failures'])
+    for key, result in sorted(report['profiles'].items()):
+        queries = ' -> '.join(map(str, result['queries']))
+        verdict = '; '.join(result['failures']) or 'ok'
+        print(f"profile {key}: queries {queries} (at most {' -> '.join(map(str, result['bounds']))}): {verdict}")
+        failed += bool(result['failures'])
+    for key, reason in sorted(report['skipped'].items()):
+        print(f'{key}: skipped, {reason}')
+
+    if output:
+        with open(output, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    if write:
+        write_budgets(report['results'])
+        print(f'Budgets written to {AUDIT_BUDGETS_PATH}')
+    if failed:
+        print(f'{failed} routes and profiles failed the audit')
+        sys.exit(1)
+    print('All routes passed the audit')
+
 def getRandomInitials():
     return (random.choice(string.ascii_letters) + random.choice(string.ascii_letters)).upper()
 
@@ -183,4 +482,4 @@ if __name__ == "__main__":
     d1 = datetime.strptime('1/1/2019 12:01 AM', '%m/%d/%Y %I:%M %p')
     #d2 = datetime.strptime('12/31/2019 11:59 PM', '%m/%d/%Y %I:%M %p')
     d2 = datetime.strptime('11/11/2019 11:59 PM', '%m/%d/%Y %I:%M %p')
-    manager.run()
\ No newline at end of file
+    manager.run()
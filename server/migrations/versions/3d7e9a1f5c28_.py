@@ -0,0 +1,108 @@
+"""add referral queue
+
+Revision ID: 3d7e9a1f5c28
+Revises: 8c1f4e6a2b37
+Create Date: 2020-01-29 16:18:40.772019
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d7e9a1f5c28'
+down_revision = '8c1f4e6a2b37'
+branch_labels = None
+depends_on = None
+
+
+# rows read and updated per statement by the backfill
+BATCH_SIZE = 1000
+
+
+# copy of utils.parse_client_datetime as of this revision, so the migration
+# does not change with the app
+def parse_client_datetime(value):
+    if not value:
+        return None
+    value = value.split('[')[0].strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+# copy of trafficlight.TRIAGE_PRIORITY as of this revision
+TRIAGE_PRIORITY = {
+    'RED_DOWN': 0,
+    'RED_UP': 1,
+    'YELLOW_DOWN': 2,
+    'YELLOW_UP': 3,
+    'GREEN': 4,
+    'NONE': 5,
+}
+
+
+def upgrade():
+    op.add_column('referral', sa.Column('referredAt', sa.DateTime(), nullable=True))
+    op.add_column('referral', sa.Column('triagePriority', sa.SmallInteger(), nullable=True))
+    op.create_index('ix_referral_queue', 'referral', ['referralHealthFacilityName', 'followUpId', 'triagePriority', 'referredAt'], unique=False)
+    # ix_referral_queue covers lookups by referralHealthFacilityName and followUpId
+    op.drop_index('ix_referral_referralHealthFacilityName_followUpId', table_name='referral')
+
+    connection = op.get_bind()
+    referral = sa.table('referral',
+        sa.column('id', sa.Integer),
+        sa.column('readingId', sa.String),
+        sa.column('dateReferred', sa.String),
+        sa.column('referredAt', sa.DateTime),
+        sa.column('triagePriority', sa.SmallInteger)
+    )
+    reading = sa.table('reading',
+        sa.column('readingId', sa.String),
+        sa.column('trafficLightStatus', sa.String)
+    )
+
+    # one UPDATE per status, then unclassified readings go last
+    for status, priority in TRIAGE_PRIORITY.items():
+        reading_ids = sa.select([reading.c.readingId]).where(reading.c.trafficLightStatus == status)
+        connection.execute(
+            referral.update().where(referral.c.readingId.in_(reading_ids)).values(triagePriority=priority)
+        )
+    connection.execute(
+        referral.update().where(referral.c.triagePriority.is_(None)).values(triagePriority=TRIAGE_PRIORITY['NONE'])
+    )
+
+    update = referral.update() \
+        .where(referral.c.id == sa.bindparam('_id')) \
+        .values(referredAt=sa.bindparam('_referredAt'))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([referral.c.id, referral.c.dateReferred])
+            .where(referral.c.id > last_id)
+            .order_by(referral.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        params = [{'_id': referral_id, '_referredAt': parse_client_datetime(date_referred)}
+                  for referral_id, date_referred in rows]
+        params = [param for param in params if param['_referredAt']]
+        if params:
+            connection.execute(update, params)
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    op.create_index('ix_referral_referralHealthFacilityName_followUpId', 'referral', ['referralHealthFacilityName', 'followUpId'], unique=False)
+    op.drop_index('ix_referral_queue', table_name='referral')
+    op.drop_column('referral', 'triagePriority')
+    op.drop_column('referral', 'referredAt')
@@ -0,0 +1,43 @@
+"""add indexes for hot filters
+
+Revision ID: 5a8b7c2d9e41
+Revises: 760c99261b86
+Create Date: 2020-01-20 14:02:11.518243
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a8b7c2d9e41'
+down_revision = '760c99261b86'
+branch_labels = None
+depends_on = None
+
+
+# back the foreign keys of their columns, MySQL refuses to drop them (error
+# 1553) and dropped the index it had created for the foreign key when these
+# were added, so downgrade leaves them in place and upgrade skips them
+FOREIGN_KEY_INDEXES = [
+    ('ix_referral_patientId', 'referral', ['patientId']),
+    ('ix_referral_readingId', 'referral', ['readingId']),
+    ('ix_referral_followUpId', 'referral', ['followUpId']),
+    ('ix_followup_healthcareWorkerId', 'followup', ['healthcareWorkerId']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    op.create_index('ix_reading_patientId_dateTimeTaken', 'reading', ['patientId', 'dateTimeTaken'], unique=False)
+    op.create_index('ix_reading_userId_patientId', 'reading', ['userId', 'patientId'], unique=False)
+    for name, table, columns in FOREIGN_KEY_INDEXES:
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=False)
+    op.create_index('ix_referral_referralHealthFacilityName_followUpId', 'referral', ['referralHealthFacilityName', 'followUpId'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_referral_referralHealthFacilityName_followUpId', table_name='referral')
+    op.drop_index('ix_reading_userId_patientId', table_name='reading')
+    op.drop_index('ix_reading_patientId_dateTimeTaken', table_name='reading')
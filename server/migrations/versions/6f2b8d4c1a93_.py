@@ -0,0 +1,32 @@
+"""add patient search indexes
+
+Revision ID: 6f2b8d4c1a93
+Revises: 3d7e9a1f5c28
+Create Date: 2020-02-03 11:27:05.193842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f2b8d4c1a93'
+down_revision = '3d7e9a1f5c28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_patient_patientName'), 'patient', ['patientName'], unique=False)
+    op.create_index('ix_patient_villageNumber_patientName', 'patient', ['villageNumber', 'patientName'], unique=False)
+    op.create_index('ix_patient_zone_patientName', 'patient', ['zone', 'patientName'], unique=False)
+    if op.get_bind().dialect.name == 'mysql':
+        op.execute('CREATE FULLTEXT INDEX ft_patient_patientName ON patient (patientName) WITH PARSER ngram')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'mysql':
+        op.drop_index('ft_patient_patientName', table_name='patient')
+    op.drop_index('ix_patient_zone_patientName', table_name='patient')
+    op.drop_index('ix_patient_villageNumber_patientName', table_name='patient')
+    op.drop_index(op.f('ix_patient_patientName'), table_name='patient')
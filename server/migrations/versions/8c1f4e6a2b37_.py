@@ -0,0 +1,92 @@
+"""add recheck worklist
+
+Revision ID: 8c1f4e6a2b37
+Revises: 5a8b7c2d9e41
+Create Date: 2020-01-27 10:41:52.305118
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f4e6a2b37'
+down_revision = '5a8b7c2d9e41'
+branch_labels = None
+depends_on = None
+
+
+# rows read and updated per statement by the backfill
+BATCH_SIZE = 1000
+
+
+# copy of utils.parse_client_datetime as of this revision, so the migration
+# does not change with the app
+def parse_client_datetime(value):
+    if not value:
+        return None
+    value = value.split('[')[0].strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def upgrade():
+    op.add_column('reading', sa.Column('recheckDueAt', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_reading_recheckDueAt'), 'reading', ['recheckDueAt'], unique=False)
+    op.create_table('recheckdue',
+    sa.Column('patientId', sa.String(length=50), nullable=False),
+    sa.Column('readingId', sa.String(length=50), nullable=False),
+    sa.Column('userId', sa.Integer(), nullable=True),
+    sa.Column('dueAt', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['patientId'], ['patient.patientId'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['readingId'], ['reading.readingId'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['userId'], ['user.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('patientId')
+    )
+    op.create_index(op.f('ix_recheckdue_dueAt'), 'recheckdue', ['dueAt'], unique=False)
+    op.create_index('ix_recheckdue_userId_dueAt', 'recheckdue', ['userId', 'dueAt'], unique=False)
+
+    # backfill recheckDueAt, the worklist is then built by `python manage.py sweep_rechecks`
+    connection = op.get_bind()
+    reading = sa.table('reading',
+        sa.column('readingId', sa.String),
+        sa.column('dateRecheckVitalsNeeded', sa.String),
+        sa.column('recheckDueAt', sa.DateTime)
+    )
+    update = reading.update() \
+        .where(reading.c.readingId == sa.bindparam('_readingId')) \
+        .values(recheckDueAt=sa.bindparam('_recheckDueAt'))
+    last_id = ''
+    while True:
+        rows = connection.execute(
+            sa.select([reading.c.readingId, reading.c.dateRecheckVitalsNeeded])
+            .where(reading.c.dateRecheckVitalsNeeded.isnot(None))
+            .where(reading.c.readingId > last_id)
+            .order_by(reading.c.readingId)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        params = [{'_readingId': reading_id, '_recheckDueAt': parse_client_datetime(date_recheck)}
+                  for reading_id, date_recheck in rows]
+        params = [param for param in params if param['_recheckDueAt']]
+        if params:
+            connection.execute(update, params)
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    op.drop_index('ix_recheckdue_userId_dueAt', table_name='recheckdue')
+    op.drop_index(op.f('ix_recheckdue_dueAt'), table_name='recheckdue')
+    op.drop_table('recheckdue')
+    op.drop_index(op.f('ix_reading_recheckDueAt'), table_name='reading')
+    op.drop_column('reading', 'recheckDueAt')
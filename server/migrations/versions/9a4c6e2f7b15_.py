@@ -0,0 +1,24 @@
+"""add village zone index
+
+Revision ID: 9a4c6e2f7b15
+Revises: 6f2b8d4c1a93
+Create Date: 2020-02-05 09:52:33.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4c6e2f7b15'
+down_revision = '6f2b8d4c1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_village_zoneNumber'), 'village', ['zoneNumber'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_village_zoneNumber'), table_name='village')
@@ -0,0 +1,114 @@
+"""add reading gps columns
+
+Revision ID: b2e5d8f1c364
+Revises: 9a4c6e2f7b15
+Create Date: 2020-02-07 13:06:48.220957
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e5d8f1c364'
+down_revision = '9a4c6e2f7b15'
+branch_labels = None
+depends_on = None
+
+
+# rows read and updated per statement by the backfill
+BATCH_SIZE = 1000
+
+# copies of the parsing and encoding of geo.py as of this revision, so the
+# migration does not change with the app
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 8
+GPS_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*[,\s]\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def parse_gps_location(value):
+    if not value:
+        return None
+    match = GPS_PATTERN.match(value)
+    if not match:
+        return None
+    latitude, longitude = float(match.group(1)), float(match.group(2))
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits = bits << 1
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def upgrade():
+    op.add_column('reading', sa.Column('gpsLatitude', sa.Float(), nullable=True))
+    op.add_column('reading', sa.Column('gpsLongitude', sa.Float(), nullable=True))
+    op.add_column('reading', sa.Column('gpsCell', sa.String(length=12), nullable=True))
+    op.create_index(op.f('ix_reading_gpsCell'), 'reading', ['gpsCell'], unique=False)
+    op.create_index('ix_reading_gps', 'reading', ['gpsLatitude', 'gpsLongitude', 'gpsCell', 'trafficLightStatus'], unique=False)
+
+    connection = op.get_bind()
+    reading = sa.table('reading',
+        sa.column('readingId', sa.String),
+        sa.column('gpsLocationOfReading', sa.String),
+        sa.column('gpsLatitude', sa.Float),
+        sa.column('gpsLongitude', sa.Float),
+        sa.column('gpsCell', sa.String)
+    )
+    update = reading.update() \
+        .where(reading.c.readingId == sa.bindparam('_readingId')) \
+        .values(gpsLatitude=sa.bindparam('_gpsLatitude'), gpsLongitude=sa.bindparam('_gpsLongitude'),
+                gpsCell=sa.bindparam('_gpsCell'))
+    last_id = ''
+    while True:
+        rows = connection.execute(
+            sa.select([reading.c.readingId, reading.c.gpsLocationOfReading])
+            .where(reading.c.gpsLocationOfReading.isnot(None))
+            .where(reading.c.readingId > last_id)
+            .order_by(reading.c.readingId)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        params = []
+        for reading_id, gps_location in rows:
+            location = parse_gps_location(gps_location)
+            if location:
+                params.append({'_readingId': reading_id, '_gpsLatitude': location[0],
+                               '_gpsLongitude': location[1], '_gpsCell': geohash_encode(*location)})
+        if params:
+            connection.execute(update, params)
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    op.drop_index('ix_reading_gps', table_name='reading')
+    op.drop_index(op.f('ix_reading_gpsCell'), table_name='reading')
+    op.drop_column('reading', 'gpsCell')
+    op.drop_column('reading', 'gpsLongitude')
+    op.drop_column('reading', 'gpsLatitude')
@@ -0,0 +1,61 @@
+"""add reading archive
+
+Revision ID: c7a1e4b9d250
+Revises: e4f7a2c9d618
+Create Date: 2020-02-11 15:34:21.907364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a1e4b9d250'
+down_revision = 'e4f7a2c9d618'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_reading_dateTimeTaken', 'reading', ['dateTimeTaken'], unique=False)
+    op.create_table('readingarchive',
+    sa.Column('readingId', sa.String(length=50), nullable=False),
+    sa.Column('bpSystolic', sa.Integer(), nullable=True),
+    sa.Column('bpDiastolic', sa.Integer(), nullable=True),
+    sa.Column('heartRateBPM', sa.Integer(), nullable=True),
+    sa.Column('symptoms', sa.Text(), nullable=True),
+    sa.Column('trafficLightStatus', sa.Enum('NONE', 'GREEN', 'YELLOW_UP', 'YELLOW_DOWN', 'RED_UP', 'RED_DOWN', name='trafficlightenum'), nullable=True),
+    sa.Column('dateLastSaved', sa.String(length=100), nullable=True),
+    sa.Column('dateTimeTaken', sa.String(length=100), nullable=True),
+    sa.Column('dateUploadedToServer', sa.String(length=100), nullable=True),
+    sa.Column('dateRecheckVitalsNeeded', sa.String(length=100), nullable=True),
+    sa.Column('recheckDueAt', sa.DateTime(), nullable=True),
+    sa.Column('gpsLocationOfReading', sa.String(length=50), nullable=True),
+    sa.Column('gpsLatitude', sa.Float(), nullable=True),
+    sa.Column('gpsLongitude', sa.Float(), nullable=True),
+    sa.Column('gpsCell', sa.String(length=12), nullable=True),
+    sa.Column('retestOfPreviousReadingIds', sa.String(length=100), nullable=True),
+    sa.Column('isFlaggedForFollowup', sa.Boolean(), nullable=True),
+    sa.Column('appVersion', sa.String(length=50), nullable=True),
+    sa.Column('deviceInfo', sa.String(length=50), nullable=True),
+    sa.Column('totalOcrSeconds', sa.Float(), nullable=True),
+    sa.Column('manuallyChangeOcrResults', sa.Integer(), nullable=True),
+    sa.Column('temporaryFlags', sa.Integer(), nullable=True),
+    sa.Column('userHasSelectedNoSymptoms', sa.Boolean(), nullable=True),
+    sa.Column('userId', sa.Integer(), nullable=True),
+    sa.Column('patientId', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('readingId')
+    )
+    op.create_index('ix_readingarchive_patientId_dateTimeTaken', 'readingarchive', ['patientId', 'dateTimeTaken'], unique=False)
+    op.create_index('ix_readingarchive_dateTimeTaken', 'readingarchive', ['dateTimeTaken'], unique=False)
+    op.create_index('ix_readingarchive_userId_patientId', 'readingarchive', ['userId', 'patientId'], unique=False)
+    op.create_index('ix_readingarchive_gps', 'readingarchive', ['gpsLatitude', 'gpsLongitude', 'gpsCell', 'trafficLightStatus'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_readingarchive_gps', table_name='readingarchive')
+    op.drop_index('ix_readingarchive_userId_patientId', table_name='readingarchive')
+    op.drop_index('ix_readingarchive_dateTimeTaken', table_name='readingarchive')
+    op.drop_index('ix_readingarchive_patientId_dateTimeTaken', table_name='readingarchive')
+    op.drop_table('readingarchive')
+    op.drop_index('ix_reading_dateTimeTaken', table_name='reading')
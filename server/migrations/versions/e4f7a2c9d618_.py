@@ -0,0 +1,24 @@
+"""add referral referredAt index
+
+Revision ID: e4f7a2c9d618
+Revises: b2e5d8f1c364
+Create Date: 2020-02-10 11:27:05.613402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4f7a2c9d618'
+down_revision = 'b2e5d8f1c364'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_referral_referredAt'), 'referral', ['referredAt'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_referral_referredAt'), table_name='referral')
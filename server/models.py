@@ -4,6 +4,10 @@ from jsonschema.exceptions import ValidationError
 from jsonschema.exceptions import SchemaError
 from marshmallow_enum import EnumField
 from marshmallow_sqlalchemy import fields
+from sqlalchemy.orm import validates
+from trafficlight import classify as classify_traffic_light, triage_priority
+from utils import parse_client_datetime
+from geo import gps_columns
 import enum
 
 # To add a table to db, make a new class
@@ -80,23 +84,39 @@ class Role(db.Model):
     name = db.Column(db.Enum(RoleEnum), nullable=False)
 
 class Referral(db.Model):
+    __table_args__ = (
+        # open referral queue of a health facility: followUpId NULL, most
+        # severe first, then oldest first
+        db.Index('ix_referral_queue', 'referralHealthFacilityName', 'followUpId', 'triagePriority', 'referredAt'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     dateReferred = db.Column(db.String(100), nullable=False) 
+    # dateReferred in utc, set automatically
+    referredAt = db.Column(db.DateTime, index=True)
+    # 0 is most severe, from the traffic light of the reading, see trafficlight.py.
+    # Unclassified until set, never NULL, so the queue's keyset order holds
+    triagePriority = db.Column(db.SmallInteger, default=triage_priority(None))
     comment = db.Column(db.Text)
     actionTaken = db.Column(db.Text)
 
     # FOREIGN KEYS
     userId = db.Column(db.Integer, db.ForeignKey('user.id'))
-    patientId = db.Column(db.String(50), db.ForeignKey('patient.patientId'))
+    patientId = db.Column(db.String(50), db.ForeignKey('patient.patientId'), index=True)
 
     referralHealthFacilityName = db.Column(db.String(50), db.ForeignKey('healthfacility.healthFacilityName'))
-    readingId = db.Column(db.String(50), db.ForeignKey('reading.readingId'))
-    followUpId = db.Column(db.Integer, db.ForeignKey('followup.id'))
+    readingId = db.Column(db.String(50), db.ForeignKey('reading.readingId'), index=True)
+    followUpId = db.Column(db.Integer, db.ForeignKey('followup.id'), index=True)
 
     # RELATIONSHIPS
     healthFacility = db.relationship('HealthFacility', backref=db.backref('referrals', lazy=True))
     reading = db.relationship('Reading', backref=db.backref('referral', lazy=True, uselist=False))
     followUp = db.relationship('FollowUp', backref=db.backref('referral', lazy=True, uselist=False, cascade="save-update"))
+
+    @validates('dateReferred')
+    def validate_date_referred(self, key, value):
+        self.referredAt = parse_client_datetime(value)
+        return value
     
 
 class HealthFacility(db.Model):
@@ -105,8 +125,15 @@ class HealthFacility(db.Model):
 
 
 class Patient(db.Model):
+    __table_args__ = (
+        db.Index('ix_patient_villageNumber_patientName', 'villageNumber', 'patientName'),
+        db.Index('ix_patient_zone_patientName', 'zone', 'patientName'),
+    )
+    # MySQL also has the FULLTEXT index ft_patient_patientName using the ngram
+    # parser, see migration 6f2b8d4c1a93, for PatientManager.search_patients
+
     patientId = db.Column(db.String(50), primary_key=True)
-    patientName = db.Column(db.String(50))
+    patientName = db.Column(db.String(50), index=True)
     patientAge = db.Column(db.Integer, nullable=False)
     patientSex = db.Column(db.Enum(SexEnum), nullable=False)
     isPregnant = db.Column(db.Boolean)
@@ -130,6 +157,17 @@ class Patient(db.Model):
 
 
 class Reading(db.Model):
+    __table_args__ = (
+        db.Index('ix_reading_patientId_dateTimeTaken', 'patientId', 'dateTimeTaken'),
+        # finds the readings to archive, see ReadingManager.archive
+        db.Index('ix_reading_dateTimeTaken', 'dateTimeTaken'),
+        # covers finding the patients a VHT has taken readings for
+        db.Index('ix_reading_userId_patientId', 'userId', 'patientId'),
+        # covers the heatmap: bounding box on latitude/longitude, grouped by
+        # a gpsCell prefix and trafficLightStatus
+        db.Index('ix_reading_gps', 'gpsLatitude', 'gpsLongitude', 'gpsCell', 'trafficLightStatus'),
+    )
+
     readingId = db.Column(db.String(50), primary_key=True)
     bpSystolic = db.Column(db.Integer)
     bpDiastolic = db.Column(db.Integer)
@@ -142,8 +180,14 @@ class Reading(db.Model):
     dateTimeTaken = db.Column(db.String(100))
     dateUploadedToServer = db.Column(db.String(100))
     dateRecheckVitalsNeeded = db.Column(db.String(100))
+    # dateRecheckVitalsNeeded in utc, set automatically
+    recheckDueAt = db.Column(db.DateTime, index=True)
 
     gpsLocationOfReading = db.Column(db.String(50))
+    # gpsLocationOfReading parsed, and its geohash, set automatically
+    gpsLatitude = db.Column(db.Float)
+    gpsLongitude = db.Column(db.Float)
+    gpsCell = db.Column(db.String(12), index=True)
     retestOfPreviousReadingIds = db.Column(db.String(100))
     isFlaggedForFollowup = db.Column(db.Boolean)
     appVersion = db.Column(db.String(50))
@@ -156,37 +200,20 @@ class Reading(db.Model):
     # FOREIGN KEYS
     userId = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
 
+    @validates('dateRecheckVitalsNeeded')
+    def validate_date_recheck_vitals_needed(self, key, value):
+        self.recheckDueAt = parse_client_datetime(value)
+        return value
+
+    @validates('gpsLocationOfReading')
+    def validate_gps_location_of_reading(self, key, value):
+        for column, derived in gps_columns(value).items():
+            setattr(self, column, derived)
+        return value
+
     # @hybrid_property
     def getTrafficLight(self):
-        RED_SYSTOLIC = 160
-        RED_DIASTOLIC = 110
-        YELLOW_SYSTOLIC = 140
-        YELLOW_DIASTOLIC = 90
-        SHOCK_HIGH = 1.7
-        SHOCK_MEDIUM = 0.9
-
-        if self.bpSystolic == None or self.bpDiastolic == None or self.heartRateBPM == None:
-            return TrafficLightEnum.NONE.name
-        
-        shockIndex = self.heartRateBPM / self.bpSystolic
-
-        isBpVeryHigh = (self.bpSystolic >= RED_SYSTOLIC) or (self.bpDiastolic >= RED_DIASTOLIC)
-        isBpHigh = (self.bpSystolic >= YELLOW_SYSTOLIC) or (self.bpDiastolic >= YELLOW_DIASTOLIC)
-        isSevereShock = (shockIndex >= SHOCK_HIGH)
-        isShock = (shockIndex >= SHOCK_MEDIUM)
-
-        if isSevereShock:
-            trafficLight = TrafficLightEnum.RED_DOWN.name
-        elif isBpVeryHigh:
-            trafficLight = TrafficLightEnum.RED_UP.name
-        elif isShock:
-            trafficLight = TrafficLightEnum.YELLOW_DOWN.name
-        elif isBpHigh:
-            trafficLight = TrafficLightEnum.YELLOW_UP.name
-        else:
-            trafficLight = TrafficLightEnum.GREEN.name
-
-        return trafficLight
+        return classify_traffic_light(self.bpSystolic, self.bpDiastolic, self.heartRateBPM)
 
     def __init__(self, userId, patientId, readingId, bpSystolic,
                  bpDiastolic,heartRateBPM,symptoms,
@@ -233,15 +260,45 @@ class FollowUp(db.Model):
     diagnosis = db.Column(db.Text)
     treatment = db.Column(db.Text)
     dateAssessed = db.Column(db.String(100), nullable=False)
-    healthcareWorkerId = db.Column(db.ForeignKey(User.id), nullable=False)
+    healthcareWorkerId = db.Column(db.ForeignKey(User.id), nullable=False, index=True)
 
     # reading = db.relationship('Reading', backref=db.backref('referral', lazy=True, uselist=False))
     healthcareWorker = db.relationship(User, backref=db.backref('followups', lazy=True))
 
 
+# readings moved out of the reading table by `python manage.py archive`,
+# same columns as Reading but without foreign keys, read through
+# ReadingRepo.query_range
+class ReadingArchive(db.Model):
+    __table__ = db.Table('readingarchive', db.metadata,
+        *[db.Column(column.name, column.type.copy(), primary_key=column.primary_key, nullable=column.nullable)
+          for column in Reading.__table__.columns],
+        db.Index('ix_readingarchive_patientId_dateTimeTaken', 'patientId', 'dateTimeTaken'),
+        db.Index('ix_readingarchive_dateTimeTaken', 'dateTimeTaken'),
+        # the scope of VHTs and CHOs and the heatmap, as on reading
+        db.Index('ix_readingarchive_userId_patientId', 'userId', 'patientId'),
+        db.Index('ix_readingarchive_gps', 'gpsLatitude', 'gpsLongitude', 'gpsCell', 'trafficLightStatus')
+    )
+
+
+# worklist of patients whose latest reading asks for a recheck,
+# maintained by RecheckManager
+class RecheckDue(db.Model):
+    __tablename__ = 'recheckdue'
+    __table_args__ = (
+        db.Index('ix_recheckdue_userId_dueAt', 'userId', 'dueAt'),
+    )
+
+    patientId = db.Column(db.String(50), db.ForeignKey('patient.patientId', ondelete='CASCADE'), primary_key=True)
+    readingId = db.Column(db.String(50), db.ForeignKey('reading.readingId', ondelete='CASCADE'), nullable=False)
+    # user who took the reading
+    userId = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    dueAt = db.Column(db.DateTime, nullable=False, index=True)
+
+
 class Village(db.Model):
     villageNumber = db.Column(db.String(50), primary_key=True)
-    zoneNumber    = db.Column(db.String(50))
+    zoneNumber    = db.Column(db.String(50), index=True)
 
 
 ######################
@@ -253,6 +310,18 @@ class UserSchema(ma.ModelSchema):
         include_fk = True
         model = User
 
+# lean projections of a user, they never include the password or the
+# user's referrals and follow ups, see UserManager
+class UserListSchema(ma.Schema):
+    class Meta:
+        fields = ('id', 'firstName', 'username', 'email', 'healthFacilityName', 'roleIds', 'vhtList')
+
+# columns only, for users nested in other responses
+class UserSummarySchema(ma.ModelSchema):
+    class Meta:
+        model = User
+        fields = ('id', 'firstName', 'username', 'email', 'healthFacilityName')
+
 class PatientSchema(ma.ModelSchema):
     patientSex = EnumField(SexEnum, by_value=True)
     class Meta:
@@ -264,6 +333,7 @@ class ReadingSchema(ma.ModelSchema):
     class Meta:
         include_fk = True
         model = Reading
+        dump_only = ('recheckDueAt', 'gpsLatitude', 'gpsLongitude', 'gpsCell')
     
 class RoleSchema(ma.ModelSchema):
     class Meta:
@@ -276,16 +346,22 @@ class HealthFacilitySchema(ma.ModelSchema):
         model = HealthFacility
 
 class FollowUpSchema(ma.ModelSchema):
-    healthcareWorker = fields.Nested(UserSchema)
+    healthcareWorker = fields.Nested(UserSummarySchema)
     class Meta:
         include_fk = True
         model = FollowUp
 
+class RecheckDueSchema(ma.ModelSchema):
+    class Meta:
+        include_fk = True
+        model = RecheckDue
+
 class ReferralSchema(ma.ModelSchema):
     followUp = fields.Nested(FollowUpSchema)
     class Meta:
         include_fk = True
         model = Referral
+        dump_only = ('referredAt', 'triagePriority')
 
 user_schema = {
     "type": "object",
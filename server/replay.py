@@ -0,0 +1,182 @@
+"""
+    @File: replay.py
+    @Description:
+    - Replays requests recorded by capture.py against a running instance
+      and reports throughput, error rate and latency percentiles, overall
+      and per endpoint. Used by `python manage.py replay`
+    - Three pacing modes:
+      * rate: requests are sent at a fixed rate, whatever the latency
+      * speed: requests keep the gaps between them in the capture, divided
+        by speed, to reproduce bursts such as a clinic uploading referrals
+      * neither: each of the concurrency threads sends its next request as
+        soon as the previous one is answered
+    - When requests are paced, latency is measured from the time a request
+      was due to be sent rather than from when a thread was free to send
+      it, so a saturated server is not hidden by requests waiting in line
+"""
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+import requests
+
+PERCENTILES = [50, 90, 95, 99]
+
+# the role whose token is used for a request made by a user with several roles
+ROLE_PRIORITY = ['ADMIN', 'HCW', 'CHO', 'VHT']
+
+"""
+    Description:
+        reads the records of one or more capture files, in the order they
+        were recorded
+    Params:
+        endpoint: only keep records of routes starting with endpoint
+        limit: only keep the first limit records
+"""
+def load_records(paths, endpoint=None, limit=None):
+    records = []
+    for path in paths:
+        with open(path, encoding='utf-8') as capture_file:
+            for line in capture_file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if endpoint and not record['endpoint'].startswith(endpoint):
+                    continue
+                records.append(record)
+    records.sort(key=lambda record: record['time'])
+    return records[:limit] if limit else records
+
+def role_of(record):
+    for role in ROLE_PRIORITY:
+        if role in record.get('roles', []):
+            return role
+    return None
+
+
+class Replayer():
+    """
+        Params:
+            base_url: ex: http://localhost:5000
+            tokens: role -> access token, requests of roles without a token
+                are sent without one
+    """
+    def __init__(self, base_url, tokens, concurrency=8, rate=0, speed=0, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.tokens = tokens
+        self.concurrency = concurrency
+        self.rate = rate
+        self.speed = speed
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # one session per thread, so connections are kept alive
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, record, due):
+        headers = {}
+        token = self.tokens.get(role_of(record))
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+
+        started = due if due is not None else time.perf_counter()
+        try:
+            response = self._session().request(
+                record['method'], self.base_url + record['path'], params=record.get('query') or None,
+                json=record.get('body'), headers=headers, timeout=self.timeout)
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        return record['method'] + ' ' + record['endpoint'], status, time.perf_counter() - started
+
+    def _work(self, pending, results):
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            results.append(self.send(*item))
+
+    """
+        Description:
+            sends records and waits for all of the responses
+        Return:
+            ([list] of (endpoint, status or None on connection errors,
+            latency in seconds), seconds elapsed)
+    """
+    def run(self, records, progress=None):
+        pending = queue.Queue(maxsize=self.concurrency * 2 if not (self.rate or self.speed) else 0)
+        results = []
+        workers = [threading.Thread(target=self._work, args=(pending, results), daemon=True)
+                   for _ in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+
+        started = time.perf_counter()
+        first_time = records[0]['time'] if records else 0
+        for i, record in enumerate(records):
+            due = None
+            if self.rate:
+                due = started + i / self.rate
+            elif self.speed:
+                due = started + (record['time'] - first_time) / self.speed
+            if due is not None:
+                time.sleep(max(0, due - time.perf_counter()))
+            pending.put((record, due))
+            if progress and (i + 1) % 1000 == 0:
+                progress(i + 1, len(results))
+
+        for _ in workers:
+            pending.put(None)
+        for worker in workers:
+            worker.join()
+        return results, time.perf_counter() - started
+
+"""
+    Description:
+        summarizes the results of Replayer.run, errors are server errors
+        (5xx) and connection errors, client errors (4xx) are counted apart
+"""
+def summarize(results, elapsed):
+    def stats(latencies, statuses):
+        errors = sum(1 for status in statuses if status is None or status >= 500)
+        client_errors = sum(1 for status in statuses if status is not None and 400 <= status < 500)
+        latencies_ms = np.array(latencies) * 1000
+        summary = {
+            'requests': len(statuses),
+            'throughput': round(len(statuses) / elapsed, 2) if elapsed else None,
+            'errorRate': round(errors / len(statuses), 4) if statuses else None,
+            'clientErrorRate': round(client_errors / len(statuses), 4) if statuses else None,
+        }
+        for percentile, value in zip(PERCENTILES, np.percentile(latencies_ms, PERCENTILES) if statuses else []):
+            summary[f'p{percentile}Ms'] = round(float(value), 1)
+        summary['maxMs'] = round(float(latencies_ms.max()), 1) if statuses else None
+        return summary
+
+    by_endpoint = defaultdict(lambda: ([], []))
+    for endpoint, status, latency in results:
+        by_endpoint[endpoint][0].append(latency)
+        by_endpoint[endpoint][1].append(status)
+
+    report = stats([latency for _, _, latency in results], [status for _, status, _ in results])
+    report['seconds'] = round(elapsed, 2)
+    report['endpoints'] = {endpoint: stats(latencies, statuses)
+                           for endpoint, (latencies, statuses) in sorted(by_endpoint.items())}
+    return report
+
+def format_report(report):
+    columns = ['requests', 'throughput', 'errorRate', 'clientErrorRate'] + \
+              [f'p{percentile}Ms' for percentile in PERCENTILES] + ['maxMs']
+    rows = [['endpoint'] + columns]
+    rows += [[endpoint] + [str(summary.get(column)) for column in columns]
+             for endpoint, summary in report['endpoints'].items()]
+    rows.append(['total'] + [str(report.get(column)) for column in columns])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ['  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
+    lines.append(f"{report['requests']} requests in {report['seconds']}s")
+    return '\n'.join(lines)
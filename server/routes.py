@@ -7,12 +7,16 @@ from Controller.HelloWorld import *
 from Controller.Multi import *
 from Controller.UsersController import *
 from Controller.PatientsController import *
-from Controller.ReferralsController import ReferralApi, ReferralInfo
+from Controller.ReferralsController import ReferralApi, ReferralInfo, ReferralQueue
 from Controller.HealthFacilityController import *
 from Controller.FollowUpController import FollowUp, FollowUpMobile, FollowUpMobileSummarized
 from Controller.StatsController import *
 from Controller.PatientStatsController import *
 from Controller.SMSController import *
+from Controller.RecheckController import RecheckDueList
+from Controller.ReadingsController import ReadingHeatmap
+from Controller.ExportController import Export
+from Controller.MetricsController import CacheMetrics
 
 
 
@@ -20,7 +24,10 @@ from Controller.SMSController import *
 def init(api):
     api.add_resource(Multi, '/api/multi/<int:num>')
     api.add_resource(AllStats, '/api/stats') # [GET]
+    api.add_resource(GeoStats, '/api/stats/geo') # [GET]
+    api.add_resource(PatientsByTrafficLight, '/api/stats/patients/trafficlight') # [GET]
     api.add_resource(PatientStats,'/api/patient/stats/<string:patient_id>') # [GET]
+    api.add_resource(PatientVitals, '/api/patient/<string:patient_id>/vitals') # [GET]
 
     api.add_resource(UserApi, '/api/user/register') # [POST]
     api.add_resource(UserAuthApi, '/api/user/auth') # [POST]
@@ -31,12 +38,14 @@ def init(api):
     api.add_resource(UserAllVHT, '/api/user/vhts') # [GET]
 
     api.add_resource(PatientAllInformation, '/api/patient/allinfo') # [GET]
+    api.add_resource(PatientSearch, '/api/patient/search') # [GET]
     api.add_resource(PatientReading, '/api/patient/reading') # [POST]
     api.add_resource(PatientInfo, '/api/patient/<string:patient_id>') # [GET, PUT]
     api.add_resource(PatientAll, '/api/patient') # [GET, POST]
 
     api.add_resource(ReferralApi, '/api/referral') # [GET, POST]
     api.add_resource(ReferralInfo, '/api/referral/<int:id>') # [GET, PUT]
+    api.add_resource(ReferralQueue, '/api/referral/queue') # [GET]
 
     api.add_resource(HealthFacility, '/api/health_facility', '/api/health_facility/<string:name>') # [GET, POST, PUT, DELETE]
     api.add_resource(HealthFacilityList, '/api/health_facility_list') # [GET]
@@ -46,4 +55,9 @@ def init(api):
     api.add_resource(FollowUpMobileSummarized, '/api/mobile/summarized/follow_up', '/api/mobile/summarized/follow_up/<int:id>') # [GET]
 
 
+    api.add_resource(RecheckDueList, '/api/rechecks/due') # [GET]
+    api.add_resource(ReadingHeatmap, '/api/readings/heatmap') # [GET]
+    api.add_resource(Export, '/api/export/<string:entity>') # [GET]
+    api.add_resource(CacheMetrics, '/api/metrics/cache') # [GET]
+
     api.add_resource(SMS, '/api/sms')
@@ -0,0 +1,131 @@
+"""
+    @File: staticfiles.py
+    @Description:
+    - Serves the React build (client/build) from memory. load() reads every
+      file once, when the app is created in the uWSGI master, so the forked
+      workers share it, and the requests for static files do not touch
+      the disk
+    - Compressible files are gzipped once at load, and brotli compressed
+      too if the brotli package is installed. Each request gets the
+      smallest variant its Accept-Encoding allows
+    - Files whose names contain a content hash (ex: main.1a2b3c4d.chunk.js)
+      never change, so browsers may cache them for a year. Other files,
+      index.html included, are revalidated with their ETag and answered
+      with 304 Not Modified when unchanged
+    - In production nginx serves client/build itself and only passes /api
+      to uWSGI, see vmconfig/nginxconfig. This module covers the setups
+      without nginx in front (Heroku, `python app.py`)
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    # brotli is optional, gzip is used alone without it
+    brotli = None
+
+# a hex content hash of 8+ characters between dots, as added by the React build
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# files smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/manifest+json',
+                      'application/xml', 'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon')
+
+INDEX = 'index.html'
+
+# not known to every system's mimetypes
+mimetypes.add_type('font/woff2', '.woff2')
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+
+
+class StaticFile():
+    def __init__(self, path, body):
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(os.path.basename(path)) \
+            else REVALIDATE_CACHE_CONTROL
+
+        # encoding -> body, in order of preference
+        self.variants = {}
+        if len(body) >= MIN_COMPRESS_BYTES and self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            if brotli is not None:
+                self.add_variant('br', brotli.compress(body, quality=11), body)
+            self.add_variant('gzip', gzip.compress(body, compresslevel=9, mtime=0), body)
+        self.variants['identity'] = body
+
+    # keeps a compressed variant only if it is smaller
+    def add_variant(self, encoding, compressed, body):
+        if len(compressed) < len(body):
+            self.variants[encoding] = compressed
+
+    def choose_encoding(self, accept_encoding):
+        accepted = {value.split(';')[0].strip() for value in accept_encoding.lower().split(',')}
+        for encoding in self.variants:
+            if encoding in accepted or encoding == 'identity':
+                return encoding
+
+    def etag_of(self, encoding):
+        return f'"{self.etag}"' if encoding == 'identity' else f'"{self.etag}-{encoding}"'
+
+    def response(self):
+        encoding = self.choose_encoding(request.headers.get('Accept-Encoding', ''))
+        etag = self.etag_of(encoding)
+        headers = {
+            'Cache-Control': self.cache_control,
+            'ETag': etag,
+            'Vary': 'Accept-Encoding',
+        }
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [value.strip() for value in if_none_match.split(',')] or if_none_match.strip() == '*':
+            return Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.variants[encoding], mimetype=self.mimetype, headers=headers)
+
+
+class StaticIndex():
+    def __init__(self):
+        # path relative to the build directory, with / separators -> StaticFile
+        self.files = {}
+
+    """
+        Description:
+            reads and compresses every file of root, replacing the files
+            loaded before. Does nothing if root does not exist, ex: the
+            React app was not built
+        Return: [int] number of files loaded
+    """
+    def load(self, root):
+        files = {}
+        if os.path.isdir(root):
+            for directory, _, names in os.walk(root):
+                for name in names:
+                    full_path = os.path.join(directory, name)
+                    path = os.path.relpath(full_path, root).replace(os.sep, '/')
+                    with open(full_path, 'rb') as static_file:
+                        files[path] = StaticFile(path, static_file.read())
+        self.files = files
+        return len(files)
+
+    """
+        Description:
+            answers a request for path, with index.html for the paths that
+            are not files so the React router can handle them
+        Return: a Response, or None if index.html is not loaded either
+    """
+    def serve(self, path):
+        static_file = self.files.get(path) or self.files.get(INDEX)
+        return static_file.response() if static_file else None
+
+
+staticIndex = StaticIndex()
@@ -0,0 +1,133 @@
+"""
+    @File: trafficlight.py
+    @Description:
+    - Classifies blood pressure and heart rate readings into traffic light
+      statuses (see TrafficLightEnum in models.py)
+    - classify() handles one reading, classify_many() handles arrays of
+      readings at once for bulk ingestion and reclassification
+    - Thresholds are read from the TRAFFIC_LIGHT_* app config values
+    - triage_priority() orders statuses by severity for the referral queue
+    - classify_mismatches() checks that both classifiers agree at the edges
+"""
+import itertools
+import math
+
+from config import app
+
+# 0 is the most severe, unclassified readings go last
+TRIAGE_PRIORITY = {
+    'RED_DOWN': 0,
+    'RED_UP': 1,
+    'YELLOW_DOWN': 2,
+    'YELLOW_UP': 3,
+    'GREEN': 4,
+    'NONE': 5,
+}
+
+def triage_priority(status):
+    return TRIAGE_PRIORITY.get(status, TRIAGE_PRIORITY['NONE'])
+
+def get_thresholds():
+    return {
+        'red_systolic': app.config['TRAFFIC_LIGHT_RED_SYSTOLIC'],
+        'red_diastolic': app.config['TRAFFIC_LIGHT_RED_DIASTOLIC'],
+        'yellow_systolic': app.config['TRAFFIC_LIGHT_YELLOW_SYSTOLIC'],
+        'yellow_diastolic': app.config['TRAFFIC_LIGHT_YELLOW_DIASTOLIC'],
+        'shock_high': app.config['TRAFFIC_LIGHT_SHOCK_HIGH'],
+        'shock_medium': app.config['TRAFFIC_LIGHT_SHOCK_MEDIUM'],
+    }
+
+"""
+    Description:
+        returns the traffic light status name of a single reading
+"""
+def classify(bp_systolic, bp_diastolic, heart_rate):
+    t = get_thresholds()
+
+    if bp_systolic is None or bp_diastolic is None or heart_rate is None:
+        return 'NONE'
+
+    # a systolic of 0 is treated as an infinite shock index
+    shock_index = heart_rate / bp_systolic if bp_systolic else float('inf')
+
+    isBpVeryHigh = (bp_systolic >= t['red_systolic']) or (bp_diastolic >= t['red_diastolic'])
+    isBpHigh = (bp_systolic >= t['yellow_systolic']) or (bp_diastolic >= t['yellow_diastolic'])
+    isSevereShock = (shock_index >= t['shock_high'])
+    isShock = (shock_index >= t['shock_medium'])
+
+    if isSevereShock:
+        return 'RED_DOWN'
+    elif isBpVeryHigh:
+        return 'RED_UP'
+    elif isShock:
+        return 'YELLOW_DOWN'
+    elif isBpHigh:
+        return 'YELLOW_UP'
+    else:
+        return 'GREEN'
+
+"""
+    Description:
+        returns a list of traffic light status names, one per reading,
+        giving the same result as calling classify() on each reading
+    Params:
+        bp_systolic, bp_diastolic, heart_rate:
+            equal length sequences of numbers, None for missing values
+"""
+def classify_many(bp_systolic, bp_diastolic, heart_rate):
+    # numpy is only needed for bulk work, so it is not loaded with the models
+    import numpy as np
+
+    t = get_thresholds()
+
+    systolic = np.asarray(bp_systolic, dtype=float)
+    diastolic = np.asarray(bp_diastolic, dtype=float)
+    heart_rate = np.asarray(heart_rate, dtype=float)
+
+    missing = np.isnan(systolic) | np.isnan(diastolic) | np.isnan(heart_rate)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shock_index = np.where(systolic == 0, np.inf, heart_rate / systolic)
+
+    is_bp_very_high = (systolic >= t['red_systolic']) | (diastolic >= t['red_diastolic'])
+    is_bp_high = (systolic >= t['yellow_systolic']) | (diastolic >= t['yellow_diastolic'])
+    is_severe_shock = shock_index >= t['shock_high']
+    is_shock = shock_index >= t['shock_medium']
+
+    # conditions are checked in order, the first one that holds wins
+    return np.select(
+        [missing, is_severe_shock, is_bp_very_high, is_shock, is_bp_high],
+        ['NONE', 'RED_DOWN', 'RED_UP', 'YELLOW_DOWN', 'YELLOW_UP'],
+        default='GREEN'
+    ).tolist()
+
+"""
+    Description:
+        returns (reading, classify_many status, classify status) for every
+        reading on which the two classifiers disagree, out of a grid of
+        readings on, just under and just over each threshold, with systolic
+        0 and missing vitals. Used by `python manage.py check_traffic_lights`
+"""
+def classify_mismatches():
+    t = get_thresholds()
+
+    systolic = {None, 0, 1}
+    diastolic = {None, 0}
+    for delta in (-1, 0, 1):
+        systolic.update({t['red_systolic'] + delta, t['yellow_systolic'] + delta})
+        diastolic.update({t['red_diastolic'] + delta, t['yellow_diastolic'] + delta})
+
+    # heart rates putting the shock index on and around its thresholds
+    heart_rate = {None, 0}
+    for bp_systolic in systolic - {None}:
+        for shock in (t['shock_high'], t['shock_medium']):
+            boundary = shock * bp_systolic
+            heart_rate.update({boundary, math.floor(boundary), math.ceil(boundary)})
+
+    readings = list(itertools.product(systolic, diastolic, heart_rate))
+    statuses = classify_many(*zip(*readings))
+    mismatches = []
+    for reading, status in zip(readings, statuses):
+        expected = classify(*reading)
+        if status != expected:
+            mismatches.append((reading, status, expected))
+    return mismatches
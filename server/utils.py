@@ -6,4 +6,20 @@ def pprint(to_print):
 
 # returns formatted current time in utc timezone
 def get_current_time():
-    return str(datetime.datetime.utcnow())
\ No newline at end of file
+    return str(datetime.datetime.utcnow())
+
+# parses a date sent by the mobile app, ex: 2019-09-25T19:00:16.683-07:00[America/Vancouver],
+# into a naive datetime in utc timezone. Returns None if value is empty or not a date
+def parse_client_datetime(value):
+    if not value:
+        return None
+    value = value.split('[')[0].strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""
+    @File: wsgi.py
+    @Description:
+    - Production entry point, served by uWSGI (see cradleplatform.ini)
+    - The app is loaded once in the uWSGI master process and then forked
+      into the worker processes. Each worker drops the database connections
+      inherited from the master, then opens its own and warms up its caches
+      before it accepts requests
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from app import create_app, warmup
+from config import db
+
+app = create_app()
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    # not running under uWSGI, e.g. another WSGI server without forking
+    postfork = None
+
+if postfork:
+    @postfork
+    def init_worker():
+        db.engine.dispose()
+        warmup()
+else:
+    warmup()